@@ -4,6 +4,12 @@ from atomtools.ase.update_db_info import UpdateDBInfo
 from atomtools.ase.delete_vacancies import delete_vacancies
 from atomtools.ase.rotate_atoms_and_cell import rotate_atoms_and_cell, rotate_crd_system, align_direction_with_z
 from atomtools.ase.constituent_strain import ConstituentStrain
+from atomtools.ase.constituent_strain_model import ConstituentStrainModel
 from atomtools.ase.elastic_constants import ElasticConstants
+from atomtools.ase.cubic_elastic_constants import CubicElasticConstants
+from atomtools.ase.elastic_directional import DirectionalElasticity
 from atomtools.ase.autocorrelation_function import AutocorrelationFunction
+from atomtools.ase.trajectory_autocorrelation import TrajectoryAutocorrelation
+from atomtools.ase.structure_factor import StructureFactor
+from atomtools.ase.diffraction import KinematicDiffraction
 from atomtools.ase.displacement_field import DisplacementField
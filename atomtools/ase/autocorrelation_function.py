@@ -1,5 +1,189 @@
 import numpy as np
 
+CORRELATION_MODES = ["direct", "linear", "periodic"]
+SMEARING_KERNELS = [None, "gaussian", "cic"]
+
+
+def _padded_shape(image_shape):
+    """Return the zero padded shape used for linear correlations."""
+    from scipy.fftpack import next_fast_len
+    return tuple(next_fast_len(2*n - 1) for n in image_shape)
+
+
+def power_spectrum(image, periodic=False):
+    """Return the power spectrum |F|^2 of an image (rfft2 layout).
+
+    :param image: 2D array
+    :param periodic: If False the image is zero padded such that the
+        inverse transform gives the linear (non wrapping) correlation
+    """
+    if periodic:
+        return np.abs(np.fft.rfft2(image))**2
+    return np.abs(np.fft.rfft2(image, s=_padded_shape(image.shape)))**2
+
+
+def correlation_from_power(power, image_shape, periodic=False):
+    """Transform a power spectrum back to the auto correlation.
+
+    :param power: Power spectrum as returned by power_spectrum
+    :param image_shape: Shape of the original image
+    :param periodic: Has to match the value passed to power_spectrum
+    """
+    nx, ny = image_shape
+    if periodic:
+        corr = np.fft.irfft2(power, s=image_shape)
+        return np.fft.fftshift(corr)
+
+    corr = np.fft.irfft2(power, s=_padded_shape(image_shape))
+
+    # Place zero lag at (nx-1, ny-1) as done in correlate2d
+    corr = np.roll(corr, (nx - 1, ny - 1), axis=(0, 1))
+    return corr[:2*nx - 1, :2*ny - 1]
+
+
+def fft_autocorrelation(image, periodic=False):
+    """Compute the auto correlation of an image via FFT.
+
+    :param image: 2D array
+    :param periodic: If True the image is treated as periodic and the
+        correlation wraps around the boundaries. The result has the same
+        shape as the image with zero lag in the centre. If False, the
+        image is zero padded and the result is identical to
+        scipy.signal.correlate2d(image, image) (shape (2*nx-1, 2*ny-1)).
+    """
+    power = power_spectrum(image, periodic=periodic)
+    return correlation_from_power(power, image.shape, periodic=periodic)
+
+
+def grid_extent(pos, npix):
+    """Return the origin and spacing of a grid spanning the bounding box.
+
+    :param pos: Positions (N x 2)
+    :param npix: Number of pixels along each direction
+    """
+    pos_min = np.min(pos, axis=0)
+    pos_max = np.max(pos, axis=0)
+    return pos_min, (pos_max - pos_min)/(npix - 1)
+
+
+def grid_positions(pos, values, npix, smearing=None, sigma=None,
+                   pos_min=None, spacing=None, wrap=False):
+    """Deposit weighted 2D positions onto a npix x npix grid.
+
+    By default the grid spans the bounding box of the positions. The cost
+    is O(N) for the deposition and O(npix^2 log npix) for the optional
+    Gaussian smearing.
+
+    :param pos: Positions (N x 2)
+    :param values: Weight of each position (N)
+    :param npix: Number of pixels along each direction
+    :param smearing: Smearing kernel. One of
+        None - nearest grid point
+        cic - cloud-in-cell (bilinear) assignment
+        gaussian - nearest grid point convolved with a Gaussian in
+                   Fourier space (periodic wrap around at the edges)
+    :param sigma: Width of the Gaussian in the same unit as pos
+    :param pos_min: Position of the first pixel. Together with spacing
+        it fixes the grid (e.g. to use the same grid for many frames).
+        If not given, the grid is fitted to the bounding box
+    :param spacing: Pixel spacing along each direction
+    :param wrap: If True, positions outside the grid are wrapped
+        periodically (with period npix*spacing), otherwise they are
+        discarded
+    """
+    if smearing not in SMEARING_KERNELS:
+        raise ValueError("Smearing has to be one of {}"
+                         "".format(SMEARING_KERNELS))
+    if smearing == "gaussian" and sigma is None:
+        raise ValueError("sigma has to be given for Gaussian smearing")
+    if (pos_min is None) != (spacing is None):
+        raise ValueError("pos_min and spacing have to be given together")
+
+    if pos_min is None:
+        pos_min, spacing = grid_extent(pos, npix)
+    else:
+        pos_min = np.asarray(pos_min, dtype=float)
+        spacing = np.asarray(spacing, dtype=float)
+    frac = (pos - pos_min)/spacing
+    if wrap:
+        frac = np.mod(frac, npix)
+
+    if smearing == "cic":
+        lower = np.floor(frac).astype(int)
+        w_upper = frac - lower
+        inside = np.all(lower >= 0, axis=1) & np.all(lower < npix, axis=1)
+        if wrap:
+            lower = np.mod(lower, npix)
+            upper = np.mod(lower + 1, npix)
+        else:
+            lower = np.minimum(lower, npix - 1)
+            upper = np.minimum(lower + 1, npix - 1)
+        w_lower = 1.0 - w_upper
+
+        flat = []
+        weights = []
+        for ix, wx in ((lower[:, 0], w_lower[:, 0]),
+                       (upper[:, 0], w_upper[:, 0])):
+            for iy, wy in ((lower[:, 1], w_lower[:, 1]),
+                           (upper[:, 1], w_upper[:, 1])):
+                flat.append(ix*npix + iy)
+                weights.append(values*wx*wy)
+        inside = np.tile(inside, 4)
+        flat = np.concatenate(flat)[inside]
+        weights = np.concatenate(weights)[inside]
+    else:
+        indices = np.floor(frac).astype(int)
+        if wrap:
+            indices = np.mod(indices, npix)
+        inside = np.all(indices >= 0, axis=1) & \
+            np.all(indices < npix, axis=1)
+        flat = indices[inside, 0]*npix + indices[inside, 1]
+        weights = values[inside]
+
+    image = np.bincount(flat, weights=weights, minlength=npix*npix)
+    image = image.reshape((npix, npix))
+
+    if smearing == "gaussian":
+        kx = 2.0*np.pi*np.fft.fftfreq(npix, d=spacing[0])
+        ky = 2.0*np.pi*np.fft.rfftfreq(npix, d=spacing[1])
+        ksq = kx[:, None]**2 + ky[None, :]**2
+        ft = np.fft.rfft2(image)*np.exp(-0.5*sigma**2*ksq)
+        image = np.fft.irfft2(ft, s=image.shape)
+    return image
+
+
+def rotation_to_normal(normal):
+    """Return the rotation matrix that rotates normal onto the z-axis.
+
+    After the rotation the first two coordinates span the plane
+    perpendicular to normal.
+
+    :param normal: Normal vector (does not need to be normalized)
+    """
+    normal = np.array(normal, dtype=float)
+    normal /= np.sqrt(normal.dot(normal))
+
+    # Rotate the normal into the xz-plane
+    alpha = np.arctan2(normal[1], normal[0])
+    sa = np.sin(alpha)
+    ca = np.cos(alpha)
+    R1 = np.eye(3)
+    R1[0, 0] = ca
+    R1[0, 1] = sa
+    R1[1, 0] = -sa
+    R1[1, 1] = ca
+
+    # Rotate around the y-axis such that the normal points along z
+    alpha = np.arccos(normal[2])
+    sa = np.sin(alpha)
+    ca = np.cos(alpha)
+    R2 = np.eye(3)
+    R2[0, 0] = ca
+    R2[0, 2] = -sa
+    R2[2, 0] = sa
+    R2[2, 2] = ca
+    return R2.dot(R1)
+
 
 class AutocorrelationFunction(object):
     """
@@ -9,73 +193,77 @@ class AutocorrelationFunction(object):
 
     def __init__(self, atoms=None, plane_normal=(1, 1, 1), symb_dict={}):
         self.atoms = atoms
-        self.plane_normal = np.array(plane_normal)
+        self.plane_normal = plane_normal
         self.symb_dict = symb_dict
 
+    @property
+    def plane_normal(self):
+        return self._plane_normal
+
+    @plane_normal.setter
+    def plane_normal(self, normal):
+        self._plane_normal = np.array(normal)
+        self._rotation_matrix = None
+
+    @property
+    def rotation_matrix(self):
+        """Rotation matrix that brings the plane normal onto the z-axis."""
+        if self._rotation_matrix is None:
+            self._rotation_matrix = rotation_to_normal(self.plane_normal)
+        return self._rotation_matrix
+
     @property
     def projected_positions(self):
         """Project the positions onto a plane."""
-        normal_cart = self.plane_normal / \
-            np.sqrt(self.plane_normal.dot(self.plane_normal))
         pos = self.atoms.get_positions()
-
-        # Rotate such that z axis points along the normal vector
-        alpha = np.arctan2(normal_cart[1], normal_cart[0])
-        sa = np.sin(alpha)
-        ca = np.cos(alpha)
-        R = np.eye(3)
-        R[0, 0] = ca
-        R[0, 1] = -sa
-        R[1, 0] = sa
-        R[1, 1] = ca
-        pos = (R.dot(pos.T)).T
-        print(R)
-
-        alpha = np.arccos(normal_cart[2])
-        sa = np.sin(alpha)
-        ca = np.cos(alpha)
-        R = np.eye(3)
-        R[0, 0] = ca
-        R[0, 2] = -sa
-        R[2, 0] = sa
-        R[2, 2] = ca
-        pos = (R.dot(pos.T)).T
-        # assert np.allclose(pos[:, 2], np.zeros(pos.shape[0]))
-        return pos[:, :2]
+        return pos.dot(self.rotation_matrix[:2, :].T)
 
     @property
     def unique_symbs(self):
-        un_symb = []
-        for atom in self.atoms:
-            if atom.symbol not in un_symb:
-                un_symb.append(atom.symbol)
-        return un_symb
-
-    def projected_image(self, npix=512, show=True, cmap="gray"):
-        """Construct a projected image."""
-        from scipy.signal import correlate2d
+        symbs = self.atoms.get_chemical_symbols()
+        _, first = np.unique(symbs, return_index=True)
+        return [symbs[i] for i in sorted(first)]
+
+    @property
+    def values(self):
+        """Return the weight of each atom given by symb_dict."""
+        symbs = self.atoms.get_chemical_symbols()
+        un_symb, inverse = np.unique(symbs, return_inverse=True)
+        weights = np.array([self.symb_dict.get(s, 0) for s in un_symb],
+                           dtype=float)
+        return weights[inverse]
+
+    def projected_image(self, npix=512, show=True, cmap="gray",
+                        mode="linear", smearing=None, sigma=None):
+        """Construct a projected image.
+
+        :param npix: Number of pixels along each direction
+        :param show: If True the image and correlation function is plotted
+        :param cmap: Colormap used for plotting
+        :param mode: How the correlation is computed. One of
+            direct - direct summation with scipy.signal.correlate2d
+            linear - zero padded FFT (same result as direct)
+            periodic - FFT with periodic wrap around
+        :param smearing: Smearing kernel (None, gaussian or cic).
+            See grid_positions
+        :param sigma: Width of the Gaussian smearing kernel
+        """
+        if mode not in CORRELATION_MODES:
+            raise ValueError("Mode has to be one of {}"
+                             "".format(CORRELATION_MODES))
+
         for symb in self.unique_symbs:
             if symb not in self.symb_dict.keys():
                 self.symb_dict[symb] = 0
 
-        values = np.zeros(len(self.atoms))
-        for i, atom in enumerate(self.atoms):
-            values[i] = self.symb_dict[atom.symbol]
-        pos = self.projected_positions
-
-        image = np.zeros((npix, npix))
-        xmin = np.min(pos[:, 0])
-        xmax = np.max(pos[:, 0])
-        ymin = np.min(pos[:, 1])
-        ymax = np.max(pos[:, 1])
-        dx = (xmax - xmin)/(npix-1)
-        dy = (ymax - ymin)/(npix-1)
-
-        for i in range(pos.shape[0]):
-            ix = int((pos[i, 0] - xmin)/dx)
-            iy = int((pos[i, 1] - ymin)/dy)
-            image[ix, iy] += values[i]
-        corr = correlate2d(image, image)
+        image = grid_positions(self.projected_positions, self.values, npix,
+                               smearing=smearing, sigma=sigma)
+
+        if mode == "direct":
+            from scipy.signal import correlate2d
+            corr = correlate2d(image, image)
+        else:
+            corr = fft_autocorrelation(image, periodic=(mode == "periodic"))
 
         if show:
             self.plot(image, cmap=cmap)
@@ -1,12 +1,85 @@
 from ase.db import connect
 from ase.optimize import BFGS
-from ase.constraints import StrainFilter
+from ase.constraints import StrainFilter, UnitCellFilter
 from ase.optimize.precon import PreconLBFGS
 from atomtools.ase import align_direction_with_z
 from matplotlib import pyplot as plt
 import numpy as np
 from scipy.interpolate import interp1d
-from scipy.optimize import minimize
+from multiprocessing import Pool
+
+def relax_in_plane( atoms, cell_length_x=2.0, cell_length_y=2.0, direction=(0,0,1), smax=0.003, align=True, hessian=None, return_hessian=False ):
+    """
+    Rotate the atoms such that direction is along z, set the in-plane
+    cell lengths and relax the atomic positions and the out-of-plane
+    strain components. Returns the relaxed atoms.
+
+    If align is False, the atoms are assumed to be rotated already (e.g.
+    the relaxed structure of a neighbouring in-plane lattice point).
+    hessian is an optional initial Hessian for the BFGS relaxer, and
+    if return_hessian is True the final Hessian is returned as well
+    """
+    # Rotate the atoms object such that the z-direction points along target_z_direction
+    if ( align ):
+        atoms = align_direction_with_z( atoms, direction=direction )
+    lengths_angles = atoms.get_cell_lengths_and_angles()
+    ratio_x = cell_length_x/lengths_angles[0]
+    ratio_y = cell_length_y/lengths_angles[1]
+    cell = atoms.get_cell()
+    cell[0,:] *= ratio_x
+    cell[1,:] *= ratio_y
+    atoms.set_cell( cell, scale_atoms=True )
+
+    cell_filter = UnitCellFilter( atoms, mask=[0,0,1,1,1,1] )
+    relaxer = BFGS(cell_filter)
+    n_dof = 3*len(cell_filter)
+    if ( hessian is not None and hessian.shape == (n_dof,n_dof) ):
+        relaxer.H = hessian.copy()
+        # Mark the current configuration as the last one such that
+        # the first BFGS update keeps the initial Hessian
+        relaxer.r0 = cell_filter.get_positions().ravel()
+        relaxer.f0 = np.zeros(n_dof)
+    V = atoms.get_volume()
+    relaxer.run( fmax=smax*V )
+    if ( return_hessian ):
+        return atoms, relaxer.H
+    return atoms
+
+def in_plane_key_value_pairs( cell_length_x, cell_length_y, direction ):
+    """
+    Returns the key value pairs identifying an in-plane relaxation in the database
+    """
+    return {
+        "cell_length_x":cell_length_x,
+        "cell_length_y":cell_length_y,
+        "direction_x":direction[0],
+        "direction_y":direction[1],
+        "direction_z":direction[2]
+    }
+
+def write_in_plane_result( db, atoms, kvp, error=None ):
+    """
+    Write the result of an in-plane relaxation to the database.
+    Failed relaxations are stored with failed=True and the error message in data
+    """
+    if ( error is None ):
+        db.write( atoms, key_value_pairs=kvp )
+        return
+    kvp = dict(kvp)
+    kvp["failed"] = True
+    db.write( atoms.copy(), key_value_pairs=kvp, data={"error":error} )
+
+def _relax_in_plane_worker( args ):
+    """
+    Relax one in-plane lattice point. Executed in the worker processes
+    """
+    atoms, cell_length_x, cell_length_y, direction, smax = args
+    kvp = in_plane_key_value_pairs( cell_length_x, cell_length_y, direction )
+    try:
+        atoms = relax_in_plane( atoms, cell_length_x=cell_length_x, cell_length_y=cell_length_y, direction=direction, smax=smax )
+    except Exception as exc:
+        return atoms, kvp, str(exc)
+    return atoms, kvp, None
 
 class ConstituentStrain(object):
     """
@@ -15,36 +88,20 @@ class ConstituentStrain(object):
     """
     def __init__( self, atoms=None, db_name=None ):
         self.atoms = atoms
-        self.orig_atoms = self.atoms.copy()
-        self.orig_atoms.set_calculator( self.atoms._calc )
+        self.orig_atoms = None
+        if ( atoms is not None ):
+            # Atoms are only needed for running new relaxations
+            self.orig_atoms = self.atoms.copy()
+            self.orig_atoms.set_calculator( self.atoms._calc )
         self.db_name = db_name
 
     def run_one_in_plane_distance( self, cell_length_x=2.0, cell_length_y=2.0, direction=(0,0,1), smax=0.003 ):
-        # Rotate the atoms object such that the z-direction points along target_z_direction
-        self.atoms = align_direction_with_z( self.atoms, direction=direction )
-        lengths_angles = self.atoms.get_cell_lengths_and_angles()
-        ratio_x = cell_length_x/lengths_angles[0]
-        ratio_y = cell_length_y/lengths_angles[1]
-        cell = self.atoms.get_cell()
-        cell[0,:] *= ratio_x
-        cell[1,:] *= ratio_y
-        self.atoms.set_cell( cell.T, scale_atoms=True )
-
-        strfilter = StrainFilter( self.atoms, mask=[0,0,1,1,1,1] )
-        relaxer = BFGS(self.atoms)
-        V = self.atoms.get_volume()
-        relaxer.run( fmax=smax*V )
+        self.atoms = relax_in_plane( self.atoms, cell_length_x=cell_length_x, cell_length_y=cell_length_y, direction=direction, smax=smax )
 
         # Store the results to ase db
         db = connect( self.db_name )
-        kvp = {
-            "cell_length_x":cell_length_x,
-            "cell_length_y":cell_length_y,
-            "direction_x":direction[0],
-            "direction_y":direction[1],
-            "direction_z":direction[2]
-        }
-        db.write( self.atoms,key_value_pairs=kvp )
+        kvp = in_plane_key_value_pairs( cell_length_x, cell_length_y, direction )
+        write_in_plane_result( db, self.atoms, kvp )
 
     def full_relaxation( self, fmax=0.025, smax=0.003 ):
         """
@@ -61,30 +118,240 @@ class ConstituentStrain(object):
         db = connect( self.db_name )
         db.write( self.atoms, key_value_pairs={"full_relaxation":True} )
 
-    def run( self, cell_length_x=None, cell_length_y=None, direction=(0,0,1), smax=0.003 ):
+    def run( self, cell_length_x=None, cell_length_y=None, direction=(0,0,1), smax=0.003, continuation=False, reuse_hessian=False ):
         """
         Run all cell lengths
+
+        If continuation is True, the lattice points are sorted and each
+        relaxation starts from the relaxed positions and out-of-plane cell
+        of the previous point. If in addition reuse_hessian is True, the
+        final BFGS Hessian of the previous point is used as initial Hessian.
         """
         if ( cell_length_y is None ):
             cell_length_y = cell_length_x
         if ( cell_length_x is None ):
             raise ValueError( "No cell length is given!" )
 
+        if ( continuation ):
+            self._run_continuation( cell_length_x, cell_length_y, direction=direction, smax=smax, reuse_hessian=reuse_hessian )
+            return
+
         for ax,ay in zip(cell_length_x,cell_length_y):
             try:
                 self.run_one_in_plane_distance( cell_length_x=ax, cell_length_y=ay, direction=direction, smax=smax )
             except Exception as exc:
                 print (str(exc))
                 print ("Proceeding to the next")
+                kvp = in_plane_key_value_pairs( ax, ay, direction )
+                write_in_plane_result( connect(self.db_name), self.atoms, kvp, error=str(exc) )
             self.atoms = self.orig_atoms.copy()
             self.atoms.set_calculator( self.orig_atoms._calc )
 
+    def _run_continuation( self, cell_length_x, cell_length_y, direction=(0,0,1), smax=0.003, reuse_hessian=False ):
+        """
+        Run all cell lengths in sorted order, seeding each relaxation with
+        the result of the previous one. Note that the seeded structures are
+        only equivalent to cold starts when the first two cell vectors span
+        the plane perpendicular to direction
+        """
+        db = connect( self.db_name )
+        points = sorted( zip(cell_length_x,cell_length_y) )
+        prev_atoms = None
+        hessian = None
+        for ax,ay in points:
+            kvp = in_plane_key_value_pairs( ax, ay, direction )
+            if ( prev_atoms is None ):
+                atoms = self.orig_atoms.copy()
+                align = True
+            else:
+                atoms = prev_atoms.copy()
+                align = False
+            atoms.set_calculator( self.orig_atoms._calc )
+            try:
+                atoms, H = relax_in_plane( atoms, cell_length_x=ax, cell_length_y=ay, direction=direction, smax=smax, align=align, hessian=hessian, return_hessian=True )
+            except Exception as exc:
+                print (str(exc))
+                print ("Proceeding to the next with a cold start")
+                write_in_plane_result( db, atoms, kvp, error=str(exc) )
+                prev_atoms = None
+                hessian = None
+                continue
+            write_in_plane_result( db, atoms, kvp )
+            prev_atoms = atoms
+            if ( reuse_hessian ):
+                hessian = H
+        self.atoms = self.orig_atoms.copy()
+        self.atoms.set_calculator( self.orig_atoms._calc )
+
+    def run_parallel( self, cell_length_x=None, cell_length_y=None, directions=[(0,0,1)], smax=0.003, num_proc=None ):
+        """
+        Run all cell lengths and directions in a pool of worker processes.
+
+        The relaxations are farmed out to the workers, while all results are
+        written to the database from this process such that there is only one
+        writer. Failed points are stored in the database with failed=True.
+
+        NOTE: The calculator attached to the atoms has to be picklable
+        """
+        if ( cell_length_y is None ):
+            cell_length_y = cell_length_x
+        if ( cell_length_x is None ):
+            raise ValueError( "No cell length is given!" )
+
+        jobs = []
+        for direction in directions:
+            for ax,ay in zip(cell_length_x,cell_length_y):
+                atoms = self.orig_atoms.copy()
+                atoms.set_calculator( self.orig_atoms._calc )
+                jobs.append( (atoms,ax,ay,tuple(direction),smax) )
+
+        db = connect( self.db_name )
+        pool = Pool( processes=num_proc )
+        try:
+            for atoms,kvp,error in pool.imap_unordered( _relax_in_plane_worker, jobs ):
+                write_in_plane_result( db, atoms, kvp, error=error )
+        finally:
+            pool.close()
+            pool.join()
+
+    def _relax_adaptive_point( self, db, a, direction, smax, relaxed ):
+        """
+        Relax one point of the adaptive sampling, seeded with the relaxed
+        structure of the nearest lattice point if there is one.
+        Returns the energy per atom or None if the relaxation failed
+        """
+        kvp = in_plane_key_value_pairs( a, a, direction )
+        if ( len(relaxed) == 0 ):
+            atoms = self.orig_atoms.copy()
+            align = True
+        else:
+            nearest = min( relaxed.keys(), key=lambda x: abs(x-a) )
+            atoms = relaxed[nearest].copy()
+            align = False
+        atoms.set_calculator( self.orig_atoms._calc )
+        try:
+            atoms = relax_in_plane( atoms, cell_length_x=a, cell_length_y=a, direction=direction, smax=smax, align=align )
+            energy = atoms.get_potential_energy()/len(atoms)
+        except Exception as exc:
+            print (str(exc))
+            write_in_plane_result( db, atoms, kvp, error=str(exc) )
+            return None
+        write_in_plane_result( db, atoms, kvp )
+        relaxed[a] = atoms
+        return energy
+
+    def run_adaptive( self, a_min=None, a_max=None, direction=(0,0,1), n_initial=4, tol_a=1E-3, tol_curvature=1E-2, max_points=20, smax=0.003 ):
+        """
+        Sample the energy as a function of the in-plane lattice parameter
+        adaptively (equal lattice parameter along x and y).
+
+        The interval [a_min, a_max] is first sampled with n_initial points.
+        The bracket is extended if the minimum is on the boundary. Then new
+        points are put at the minimum of a parabola through the three
+        points around the lowest energy, and at the midpoints of the two
+        neighbouring intervals when the minimum is already sampled (or
+        when the parabola is not convex). The sampling stops when the
+        position of the minimum changes less than tol_a and the curvature
+        changes less than tol_curvature (relative). At most max_points
+        relaxations are attempted (failed ones included).
+
+        A RuntimeError is raised if a point that has already been tried
+        is proposed again (e.g. when the bracket can not be extended
+        because the relaxation there failed).
+
+        Returns the in-plane lattice parameter at the minimum, the curvature
+        d^2E/da^2, the minimum energy (per atom) and whether the sampling
+        converged. If max_points is reached before the convergence test
+        passes, the last estimate is returned with converged=False
+        """
+        if ( a_min is None or a_max is None ):
+            raise ValueError( "The initial bracket [a_min, a_max] has to be given!" )
+        if ( n_initial < 3 ):
+            raise ValueError( "At least 3 initial points are needed!" )
+
+        db = connect( self.db_name )
+        relaxed = {}
+        energies = {}
+        tried = []
+        failed = []
+
+        def evaluate( a, purpose ):
+            previous = [x for x in tried if abs(x-a) < 1E-10]
+            if ( len(previous) > 0 ):
+                if ( previous[0] in failed ):
+                    raise RuntimeError( "Cannot {} at the failed point a={}".format(purpose,a) )
+                raise RuntimeError( "Cannot {} at the already sampled point a={}".format(purpose,a) )
+            tried.append(a)
+            energy = self._relax_adaptive_point( db, a, direction, smax, relaxed )
+            if ( energy is None ):
+                failed.append(a)
+            else:
+                energies[a] = energy
+
+        for a in np.linspace( a_min, a_max, n_initial ):
+            evaluate( float(a), "sample the initial bracket" )
+
+        a_opt = None
+        curvature = None
+        E_opt = None
+        converged = False
+        while ( len(tried) < max_points ):
+            a = np.array( sorted(energies.keys()) )
+            E = np.array( [energies[x] for x in a] )
+            if ( len(a) < 3 ):
+                raise RuntimeError( "Too many failed relaxations to locate the minimum!" )
+            i_min = np.argmin(E)
+
+            # Extend the bracket if the minimum is on the boundary
+            if ( i_min == 0 ):
+                evaluate( float(2.0*a[0]-a[1]), "extend the bracket below" )
+                continue
+            elif ( i_min == len(a)-1 ):
+                evaluate( float(2.0*a[-1]-a[-2]), "extend the bracket above" )
+                continue
+
+            coeff = np.polyfit( a[i_min-1:i_min+2], E[i_min-1:i_min+2], 2 )
+            if ( coeff[0] <= 0.0 ):
+                # The vertex is not a minimum, bisect the bracket instead
+                evaluate( float(0.5*(a[i_min-1]+a[i_min])), "bisect the bracket" )
+                if ( len(tried) < max_points ):
+                    evaluate( float(0.5*(a[i_min]+a[i_min+1])), "bisect the bracket" )
+                continue
+
+            new_a_opt = -0.5*coeff[1]/coeff[0]
+            new_curvature = 2.0*coeff[0]
+            if ( a_opt is not None ):
+                converged = abs(new_a_opt-a_opt) < tol_a and \
+                    abs(new_curvature-curvature) < tol_curvature*abs(new_curvature)
+            else:
+                converged = False
+            a_opt = new_a_opt
+            curvature = new_curvature
+            E_opt = np.polyval( coeff, a_opt )
+            if ( converged ):
+                break
+
+            if ( np.min(np.abs(a-a_opt)) > 0.5*tol_a ):
+                evaluate( float(a_opt), "refine the minimum" )
+            else:
+                evaluate( float(0.5*(a[i_min-1]+a[i_min])), "refine the bracket" )
+                if ( len(tried) < max_points ):
+                    evaluate( float(0.5*(a[i_min]+a[i_min+1])), "refine the bracket" )
+
+        if ( a_opt is None ):
+            raise RuntimeError( "Could not locate a minimum with {} points!".format(max_points) )
+        self.atoms = self.orig_atoms.copy()
+        self.atoms.set_calculator( self.orig_atoms._calc )
+        return a_opt, curvature, E_opt, converged
+
     def get_energy_in_plane_distance( self, direction=None ):
         db = connect( self.db_name )
         energies = {}
         a_in_plane = {}
 
         for row in db.select( direction_x=direction[0], direction_y=direction[1], direction_z=direction[2] ):
+            if ( row.get("failed",False) ):
+                continue
             if ( row.formula not in energies.keys() ):
                 energies[row.formula] = []
                 a_in_plane[row.formula] = []
@@ -111,43 +378,83 @@ class ConstituentStrain(object):
 
     def coherency_strain_energy( self, direction=None ):
         """
-        Computes the coherency strain energy
+        Computes the coherency strain energy of a binary system on 20
+        concentrations. The concentration refers to the first formula
+        found in the database
         """
         energies, a_in_plane = self.get_energy_in_plane_distance( direction=direction )
         if ( len(energies.keys()) > 2 ):
             msg = "Systems with more than two elements are not supported!\n"
-            msg += "Elements found in database {}".format(energies.keys())
+            msg += "Elements found in database {}".format(list(energies.keys()))
+            msg += "\nUse coherency_strain_energy_table for multicomponent systems"
             raise ValueError( msg )
 
-        key1 = energies.keys()[0]
-        key2 = energies.keys()[1]
-        i1 = interp1d( a_in_plane[key1], energies[key1], bounds_error=False, fill_value="extrapolate", kind="linear" )
-        i2 = interp1d( a_in_plane[key2], energies[key2], bounds_error=False, fill_value="extrapolate", kind="linear" )
-
-        # Find the minimum of each function
-        def cost_i1(a):
-            return i1(a)
-        def cost_i2(a):
-            return i2(a)
-
-        x01 = np.argmin(energies[key1])
-        x02 = np.argmin(energies[key2])
-        res1 = minimize(cost_i1,x0=x01)
-        res2 = minimize(cost_i2,x0=x02)
-        ref1 = i1(res1["x"])
-        ref2 = i2(res2["x"])
-        i1 = interp1d( a_in_plane[key1], np.array(energies[key1])-ref1, bounds_error=False, fill_value="extrapolate", kind="linear" )
-        i2 = interp1d( a_in_plane[key2], np.array(energies[key2])-ref2, bounds_error=False, fill_value="extrapolate", kind="linear" )
-
-        def cost_func( a, conc ):
-            return i1(a)*conc + (1.0-conc)*i2(a)
-
         concs = np.linspace(0.0,1.0,20)
-        a_in_plane_min = []
-        E_CS = []
-        for conc in concs:
-            x0 = conc*x01 + (1.0-conc)*x02
-            res = minimize( cost_func, x0=x0, args=(conc,) )
-            a_in_plane_min.append(res["x"])
-            E_CS.append( res["fun"] )
-        return concs, E_CS
+        formulas = list(energies.keys())
+        table = self.coherency_strain_energy_table( directions=[direction], concentrations=concs, formulas=formulas )
+        return concs, table[2][0,:]
+
+    def coherency_strain_energy_table( self, directions=[(0,0,1)], concentrations=None, formulas=None, kind="linear", n_grid=1000 ):
+        """
+        Computes the coherency strain energy for many concentrations and
+        directions at once
+
+        E_CS(x, k) = min_a sum_m x_m [E_m(a,k) - min_a' E_m(a',k)]
+
+        where E_m(a,k) is the energy per atom of end member m with in-plane
+        lattice parameter a, epitaxially constrained perpendicular to k.
+        All interpolants are evaluated on a shared grid consisting of all
+        sampled lattice parameters and n_grid uniformly spaced points, and the
+        minimization is done for all concentrations in one array operation.
+        For linear interpolation the minimum is exact.
+
+        concentrations: 1D array with the concentration of the first end
+                        member (binary systems) or an array of shape
+                        (num_conc, num_end_members) where each row sum to 1.
+                        Default is 101 points for binary systems
+        formulas: Order of the end members. Default is all formulas found
+                  in the database for the first direction, sorted
+        kind: kind of the interpolant (see scipy.interpolate.interp1d)
+
+        Returns the formulas, concentrations (num_conc x num_end_members),
+        E_CS (num_directions x num_conc) and the in-plane lattice parameter
+        at the minimum (num_directions x num_conc)
+        """
+        data = [self.get_energy_in_plane_distance(direction=d) for d in directions]
+        if ( formulas is None ):
+            formulas = sorted( data[0][0].keys() )
+
+        for (energies,a_in_plane),direction in zip(data,directions):
+            for formula in formulas:
+                if ( formula not in energies.keys() ):
+                    msg = "No energies for {} along {}".format(formula,direction)
+                    raise ValueError( msg )
+
+        if ( concentrations is None ):
+            if ( len(formulas) != 2 ):
+                raise ValueError( "Concentrations have to be given for multicomponent systems!" )
+            concentrations = np.linspace(0.0,1.0,101)
+        concentrations = np.array( concentrations, dtype=float )
+        if ( concentrations.ndim == 1 ):
+            if ( len(formulas) != 2 ):
+                raise ValueError( "Concentrations have to be (num_conc x num_end_members) for multicomponent systems!" )
+            concentrations = np.vstack( (concentrations,1.0-concentrations) ).T
+        if ( concentrations.shape[1] != len(formulas) ):
+            raise ValueError( "The concentrations have to have one column per end member!" )
+
+        all_a = np.concatenate( [np.concatenate([a[f] for f in formulas]) for _,a in data] )
+        grid = np.linspace( np.min(all_a), np.max(all_a), n_grid )
+        grid = np.unique( np.concatenate((grid,all_a)) )
+
+        # Strain energy of each end member relative to its minimum
+        delta_E = np.zeros( (len(directions),len(formulas),len(grid)) )
+        for i,(energies,a_in_plane) in enumerate(data):
+            for j,formula in enumerate(formulas):
+                interp = interp1d( a_in_plane[formula], energies[formula], bounds_error=False, fill_value="extrapolate", kind=kind )
+                E = interp(grid)
+                delta_E[i,j,:] = E - np.min(E)
+
+        mixed = np.einsum( "cm,dmg->dcg", concentrations, delta_E )
+        indx = np.argmin( mixed, axis=2 )
+        E_CS = np.min( mixed, axis=2 )
+        return formulas, concentrations, E_CS, grid[indx]
@@ -0,0 +1,191 @@
+"""Fitted model of the constituent strain energy for fast lookup."""
+import os
+import numpy as np
+
+
+# Cubic invariants spanning the Kubic harmonics up to the given order
+CUBIC_HARMONIC_ORDERS = [0, 4, 6, 8, 10]
+
+
+def cubic_harmonics(directions, lmax=6):
+    """Evaluate the Kubic harmonics of order <= lmax.
+
+    The Kubic harmonics are the combinations of spherical harmonics that
+    are invariant under the cubic point group. Up to l=10 there is one
+    per order, and they span the same space as the cubic invariants
+    1, I4, I6, I4^2 and I4*I6, where I4 = x^4 + y^4 + z^4 and
+    I6 = x^2 y^2 z^2 (x, y, z are the direction cosines). Each invariant
+    has its spherical average subtracted.
+
+    :param directions: Array of shape (N, 3). Need not be normalized
+    :param lmax: Maximum order (at most 10)
+
+    :return: Array of shape (N, num_harmonics)
+    """
+    if lmax > CUBIC_HARMONIC_ORDERS[-1]:
+        raise ValueError("lmax can be at most {}"
+                         "".format(CUBIC_HARMONIC_ORDERS[-1]))
+    directions = np.atleast_2d(directions).astype(float)
+    sq = directions**2
+    sq /= np.sum(sq, axis=1)[:, None]
+    I4 = np.sum(sq**2, axis=1)
+    I6 = np.prod(sq, axis=1)
+
+    # Spherical averages: <I4> = 3/5, <I6> = 1/105, <I4^2> = 41/105,
+    # <I4*I6> = 1/231
+    harmonics = [np.ones_like(I4), I4 - 3.0/5.0, I6 - 1.0/105.0,
+                 I4**2 - 41.0/105.0, I4*I6 - 1.0/231.0]
+    num = sum(1 for l in CUBIC_HARMONIC_ORDERS if l <= lmax)
+    return np.array(harmonics[:num]).T
+
+
+def concentration_basis(conc, order=3):
+    """Return the concentration basis x(1-x)(1-2x)^p for p < order."""
+    conc = np.asarray(conc, dtype=float)
+    powers = np.arange(order)
+    return (conc*(1.0 - conc))[..., None]*(1.0 - 2.0*conc)[..., None]**powers
+
+
+class ConstituentStrainModel(object):
+    """
+    Expansion of the constituent strain energy of a binary system
+
+    E_CS(x, k) = sum_l sum_p c_lp K_l(k) x(1-x)(1-2x)^p
+
+    where K_l are Kubic harmonics. The model is fitted to the table
+    computed by ConstituentStrain.coherency_strain_energy_table for a
+    few directions, and can then be evaluated for millions of (k, x)
+    pairs in a vectorized way.
+
+    :param lmax: Maximum order of the Kubic harmonics
+    :param order: Number of terms in the concentration polynomial
+    """
+
+    def __init__(self, lmax=6, order=3):
+        self.lmax = lmax
+        self.order = order
+        self.coeff = None
+
+        # Directions and end members of the table the model was fitted
+        # to (set by from_constituent_strain)
+        self.directions = None
+        self.formulas = None
+
+    @property
+    def num_harmonics(self):
+        return sum(1 for l in CUBIC_HARMONIC_ORDERS if l <= self.lmax)
+
+    def fit(self, directions, concentrations, energies):
+        """Fit the expansion coefficients.
+
+        :param directions: Directions (num_directions x 3)
+        :param concentrations: Concentrations (num_conc)
+        :param energies: Constituent strain energies
+            (num_directions x num_conc)
+        """
+        directions = np.atleast_2d(directions)
+        if len(directions) < self.num_harmonics:
+            msg = "At least {} directions are needed to fit ".format(
+                self.num_harmonics)
+            msg += "Kubic harmonics up to l={}".format(self.lmax)
+            raise ValueError(msg)
+
+        harm = cubic_harmonics(directions, lmax=self.lmax)
+        poly = concentration_basis(concentrations, order=self.order)
+        design = np.einsum("dh,cp->dchp", harm, poly)
+        design = design.reshape((harm.shape[0]*poly.shape[0], -1))
+        coeff = np.linalg.lstsq(design, np.ravel(energies), rcond=None)[0]
+        self.coeff = coeff.reshape((harm.shape[1], poly.shape[1]))
+        return self.coeff
+
+    def evaluate(self, directions, concentrations):
+        """Evaluate the constituent strain energy.
+
+        :param directions: Wave vectors (N x 3)
+        :param concentrations: Concentrations (N). A scalar is broadcasted
+            to all directions
+
+        :return: Energies (N)
+        """
+        if self.coeff is None:
+            raise ValueError("The model is not fitted. Call fit first.")
+        harm = cubic_harmonics(directions, lmax=self.lmax)
+        conc = np.broadcast_to(concentrations, (harm.shape[0],))
+        poly = concentration_basis(conc, order=self.order)
+        return np.einsum("nh,hp,np->n", harm, self.coeff, poly)
+
+    def save(self, fname):
+        """Store the model to a numpy .npz file."""
+        if self.coeff is None:
+            raise ValueError("The model is not fitted. Call fit first.")
+        directions = np.zeros((0, 3))
+        if self.directions is not None:
+            directions = np.array(self.directions, dtype=float)
+        formulas = [] if self.formulas is None else self.formulas
+        with open(fname, "wb") as out:
+            np.savez(out, coeff=self.coeff, lmax=self.lmax, order=self.order,
+                     directions=directions,
+                     formulas=np.array(formulas, dtype=str))
+
+    @staticmethod
+    def load(fname):
+        """Load a model stored with save."""
+        data = np.load(fname)
+        model = ConstituentStrainModel(lmax=int(data["lmax"]),
+                                       order=int(data["order"]))
+        model.coeff = data["coeff"]
+        if "directions" in data and len(data["directions"]) > 0:
+            model.directions = data["directions"]
+        if "formulas" in data and len(data["formulas"]) > 0:
+            model.formulas = [str(f) for f in data["formulas"]]
+        return model
+
+    def matches(self, directions, formulas, lmax, order):
+        """Return True if the model was fitted with the given settings."""
+        if self.lmax != lmax or self.order != order:
+            return False
+        if (self.formulas is None) != (formulas is None):
+            return False
+        if formulas is not None and list(self.formulas) != list(formulas):
+            return False
+        if self.directions is None:
+            return False
+        directions = np.atleast_2d(np.array(directions, dtype=float))
+        return self.directions.shape == directions.shape and \
+            np.allclose(self.directions, directions)
+
+    @staticmethod
+    def from_constituent_strain(cs, directions=None, formulas=None,
+                                lmax=6, order=3, cache=None):
+        """Build the model from the database of a ConstituentStrain.
+
+        If cache is given and the file holds a model fitted with the same
+        directions, formulas, lmax and order, the model is loaded from the
+        file. Otherwise, the model is fitted and stored to the file.
+
+        :param cs: Instance of ConstituentStrain
+        :param directions: Directions present in the database
+        :param formulas: The two end members. The concentration refers to
+            the first one
+        :param lmax: Maximum order of the Kubic harmonics
+        :param order: Number of terms in the concentration polynomial
+        :param cache: Filename of the cached model
+        """
+        if directions is None:
+            directions = [(1, 0, 0), (1, 1, 0), (1, 1, 1), (2, 1, 1)]
+        if cache is not None and os.path.exists(cache):
+            cached = ConstituentStrainModel.load(cache)
+            if cached.matches(directions, formulas, lmax, order):
+                return cached
+        table = cs.coherency_strain_energy_table(directions=directions,
+                                                 formulas=formulas)
+        concs = table[1][:, 0]
+        model = ConstituentStrainModel(lmax=lmax, order=order)
+        model.fit(directions, concs, table[2])
+        model.directions = np.atleast_2d(np.array(directions, dtype=float))
+        if formulas is not None:
+            model.formulas = list(formulas)
+
+        if cache is not None:
+            model.save(cache)
+        return model
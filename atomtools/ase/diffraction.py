@@ -0,0 +1,146 @@
+"""Module for simulating kinematic diffraction patterns."""
+import numpy as np
+from ase.data import atomic_numbers
+from atomtools.ase.autocorrelation_function import rotation_to_normal
+from atomtools.ase.structure_factor import projected_cell
+
+
+class KinematicDiffraction(object):
+    """
+    Kinematic (single scattering) diffraction patterns of projected
+    atoms objects.
+
+    The atoms are projected onto the plane perpendicular to each zone
+    axis (as in AutocorrelationFunction.projected_positions). The
+    projected structure is periodic with the two in-plane periodicity
+    vectors of the cell, and the density of each species is put on a
+    npix x npix grid spanned by them. Hence, the FFT is evaluated
+    exactly at the reciprocal lattice vectors of the projected cell and
+    Bragg peaks (including superlattice peaks of ordered supercells) do
+    not leak into neighbouring pixels. The intensity is
+
+    I(q) = |sum_s f_s(|q|) FFT[rho_s](q)|^2
+
+    All species and all zone axes are transformed in one FFT call.
+
+    :param atoms: Atoms object
+    :param form_factors: Dictionary with the form factor of each symbol.
+        The values can be a number or a function of |q| (1/angstrom)
+        that accepts numpy arrays. Symbols not present default to the
+        atomic number (the forward scattering limit for X-rays)
+    :param npix: Number of pixels along each direction
+    """
+
+    def __init__(self, atoms=None, form_factors=None, npix=256):
+        self.atoms = atoms
+        if form_factors is None:
+            form_factors = {}
+        self.form_factors = form_factors
+        self.npix = npix
+
+        symbs = atoms.get_chemical_symbols()
+        un_symb, self.species_index = np.unique(symbs, return_inverse=True)
+        self.species = list(un_symb)
+
+    def projected_positions(self, zone_axes):
+        """Return the projected positions for all zone axes.
+
+        :param zone_axes: Cartesian directions (num_zones x 3)
+
+        :return: Array of shape (num_zones, num_atoms, 2)
+        """
+        rot = np.array([rotation_to_normal(z) for z in zone_axes])
+        pos = self.atoms.get_positions()
+        return np.einsum("zij,nj->zni", rot[:, :2, :], pos)
+
+    def projected_cells(self, zone_axes):
+        """Return the in-plane periodicity vectors for all zone axes.
+
+        Each zone axis has to be parallel to a lattice direction [uvw] of
+        the cell. The lattice vectors completing [uvw] to a basis are
+        projected onto the plane and reduced.
+
+        :param zone_axes: Cartesian directions (num_zones x 3)
+
+        :return: Array of shape (num_zones, 2, 2) where the rows are the
+            periodicity vectors in the in-plane coordinates
+        """
+        cell = self.atoms.get_cell()
+        return np.array([projected_cell(cell, zone) for zone in zone_axes])
+
+    def species_images(self, zone_axes):
+        """Grid the density of each species for all zone axes.
+
+        :param zone_axes: Cartesian directions (num_zones x 3)
+
+        :return: images of shape (num_zones, num_species, npix, npix) and
+            the in-plane periodicity vectors (num_zones x 2 x 2). Pixel
+            (i, j) is at i*p1/npix + j*p2/npix
+        """
+        npix = self.npix
+        num_species = len(self.species)
+        proj = self.projected_positions(zone_axes)
+        periods = self.projected_cells(zone_axes)
+        num_zones = proj.shape[0]
+
+        frac = np.einsum("zni,zij->znj", proj, np.linalg.inv(periods))
+        indx = np.floor(frac*npix + 0.5).astype(int) % npix
+
+        zone = np.repeat(np.arange(num_zones), proj.shape[1])
+        species = np.tile(self.species_index, num_zones)
+        flat = np.ravel_multi_index((zone, species, indx[..., 0].ravel(),
+                                     indx[..., 1].ravel()),
+                                    (num_zones, num_species, npix, npix))
+        size = num_zones*num_species*npix*npix
+        images = np.bincount(flat, minlength=size).astype(float)
+        return images.reshape((num_zones, num_species, npix, npix)), periods
+
+    def _form_factor(self, symb, q):
+        f = self.form_factors.get(symb, atomic_numbers[symb])
+        if callable(f):
+            return f(q)
+        return f*np.ones_like(q)
+
+    def wave_vectors(self, periods):
+        """Return the in-plane wave vectors of the FFT grid.
+
+        :param periods: In-plane periodicity vectors (num_zones x 2 x 2)
+
+        :return: Array of shape (num_zones, npix, npix, 2) in fft2 layout
+        """
+        rec = 2.0*np.pi*np.transpose(np.linalg.inv(periods), axes=(0, 2, 1))
+        h = np.fft.fftfreq(self.npix, d=1.0/self.npix)
+        return h[None, :, None, None]*rec[:, None, None, 0, :] + \
+            h[None, None, :, None]*rec[:, None, None, 1, :]
+
+    def patterns(self, zone_axes):
+        """Compute the diffraction patterns for many zone axes.
+
+        :param zone_axes: Cartesian directions (num_zones x 3)
+
+        :return: intensities (num_zones, npix, npix) with q=0 in the
+            centre, and the wave vectors q (num_zones, npix, npix, 2) of
+            each pixel in 1/angstrom
+        """
+        zone_axes = np.atleast_2d(zone_axes)
+        images, periods = self.species_images(zone_axes)
+        ft = np.fft.rfft2(images, axes=(-2, -1))
+
+        npix = self.npix
+        nhalf = ft.shape[-1]
+        q = self.wave_vectors(periods)
+        qabs = np.sqrt(np.sum(q[:, :, :nhalf, :]**2, axis=-1))
+        form = np.array([self._form_factor(s, qabs) for s in self.species])
+        amplitude = np.einsum("szij,zsij->zij", form, ft)
+        half = np.abs(amplitude)**2
+
+        # Recover the full plane from I(-q) = I(q)
+        intensity = np.zeros((half.shape[0], npix, npix))
+        intensity[:, :, :nhalf] = half
+        rows = (-np.arange(npix)) % npix
+        cols = np.arange(nhalf, npix)
+        intensity[:, :, nhalf:] = half[:, rows[:, None], npix - cols[None, :]]
+
+        intensity = np.fft.fftshift(intensity, axes=(-2, -1))
+        q = np.fft.fftshift(q, axes=(1, 2))
+        return intensity, q
@@ -1,6 +1,195 @@
 """Module for calculating elastic constants."""
+import os
+import socket
+import time
+from multiprocessing import Pool
 from ase.db import connect
+from ase.db.sqlite import SQLite3Database
+from ase.calculators.singlepoint import SinglePointCalculator
 import numpy as np
+from atomtools.ase import mandel
+from atomtools.ase.elastic_directional import DirectionalElasticity
+from atomtools.ase.stress_strain_accumulator import StressStrainAccumulator
+from atomtools.ase.stress_strain_accumulator import EnergyStrainAccumulator
+
+# Calculator used by the worker processes in ElasticConstants.run_pool
+_worker_calc = None
+
+
+def _init_worker(calc):
+    """Attach the calculator to the worker process."""
+    global _worker_calc
+    _worker_calc = calc
+
+
+def _evaluate_worker(args):
+    """Evaluate the requested properties of one structure.
+
+    Returns the results and the error message (None if the calculation
+    succeeded), such that one failing structure does not stop the pool.
+    """
+    uid, atoms, properties = args
+    atoms.set_calculator(_worker_calc)
+    try:
+        return uid, _evaluate_properties(atoms, properties), None
+    except Exception as exc:
+        return uid, None, str(exc)
+
+
+def _is_dead_owner(owner):
+    """Return True if owner (host:pid) is a process on this host that has
+    terminated."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (ValueError, PermissionError):
+        return False
+    return False
+
+
+def _conventional_cell(spg):
+    """Return the conventional cell vectors (rows) of the space group.
+
+    Only the shape matters. Hexagonal and trigonal groups (143-194,
+    hexagonal axes) have a1 along x and c along z. For all other groups
+    the rotations in lattice coordinates are also valid in cartesian
+    coordinates (the monoclinic unique axis is b, along y).
+    """
+    if 143 <= spg <= 194:
+        return np.array([[1.0, 0.0, 0.0],
+                         [-0.5, np.sqrt(3.0)/2.0, 0.0],
+                         [0.0, 0.0, 1.0]])
+    return np.identity(3)
+
+
+def _space_group_rotations(spg, perm="xyz"):
+    """Return the cartesian rotations of the space group with permuted axes.
+
+    Spacegroup returns the rotations r in lattice coordinates, which are
+    converted with R = A^T r (A^T)^-1 where the rows of A are the
+    conventional cell vectors.
+    """
+    permut_lut = {
+        "xyz": 0,
+        "zxy": -1,
+        "yzx": -2
+    }
+    if perm not in permut_lut.keys():
+        raise ValueError("perm has to be one of {}"
+                         "".format(list(permut_lut.keys())))
+    from ase.spacegroup import Spacegroup
+    rotations = Spacegroup(spg).get_rotations()
+    cell_t = _conventional_cell(spg).T
+    rotations = np.einsum("ij,gjk,kl->gil", cell_t, rotations,
+                          np.linalg.inv(cell_t))
+    return np.roll(rotations, permut_lut[perm], axis=(1, 2))
+
+
+# Symmetry projection operators cached per (space group, permutation)
+_symmetry_projectors = {}
+
+
+def symmetry_projector(spg, perm="xyz"):
+    """Return the projection operator onto tensors invariant under spg.
+
+    The operator is the group average of Q_g C Q_g^T, where Q_g is the
+    Mandel representation of the rotations, written as a 36x36 matrix
+    acting on the flattened 6x6 Mandel tensor. It is computed once per
+    space group and permutation.
+
+    :param spg: Space group
+    :param perm: Permutation of the axes (xyz, zxy or yzx)
+    """
+    key = (spg, perm)
+    if key not in _symmetry_projectors:
+        Q = mandel.mandel_rotation(_space_group_rotations(spg, perm=perm))
+        proj = np.einsum("gik,gjl->ijkl", Q, Q)/len(Q)
+        _symmetry_projectors[key] = proj.reshape((36, 36))
+    return _symmetry_projectors[key]
+
+
+def symmetrize_elastic_tensors(tensors, spg, perm="xyz"):
+    """Average elastic tensors over the rotations of the space group.
+
+    :param tensors: Mandel tensors of shape (..., 6, 6)
+    :param spg: Space group
+    :param perm: Permutation of the axes (xyz, zxy or yzx)
+    """
+    tensors = np.asarray(tensors)
+    flat = tensors.reshape(tensors.shape[:-2] + (36,))
+    proj = symmetry_projector(spg, perm=perm)
+    return flat.dot(proj.T).reshape(tensors.shape)
+
+
+def elastic_properties(tensors):
+    """Compute the polycrystalline elastic properties of many tensors.
+
+    All quantities are evaluated in one vectorized pass, and the
+    compliance is obtained with a single (batched) matrix inverse.
+
+    :param tensors: Elastic tensors in Mandel notation (N, 6, 6)
+
+    :return: Dictionary with arrays of length N. The keys are
+        K_V, K_R, K_H (bulk moduli), G_V, G_R, G_H (shear moduli),
+        E_V, E_R, E_H (Young's moduli), nu_V, nu_R, nu_H (Poisson ratios)
+        computed from the bulk and shear modulus of the same average,
+        zener (Zener anisotropy 2*C44/(C11 - C12) in Voigt notation),
+        universal_anisotropy (5*G_V/G_R + K_V/K_R - 6) and compliance
+        (N, 6, 6) (Voigt notation, same as
+        ElasticConstants.compliance_tensor)
+    """
+    C = np.array(tensors, dtype=float)
+    if C.ndim == 2:
+        C = C[None, :, :]
+
+    # Convert Mandel tensor into Voigt tensor
+    C[:, 3:, :3] /= np.sqrt(2.0)
+    C[:, :3, 3:] /= np.sqrt(2.0)
+    C[:, 3:, 3:] /= 2.0
+    S = np.linalg.inv(C)
+
+    diag = np.arange(3)
+    shear = np.arange(3, 6)
+    off_row = np.array([0, 1, 2])
+    off_col = np.array([1, 2, 0])
+    C_diag = np.sum(C[:, diag, diag], axis=1)
+    C_off = np.sum(C[:, off_row, off_col], axis=1)
+    C_shear = np.sum(C[:, shear, shear], axis=1)
+    S_diag = np.sum(S[:, diag, diag], axis=1)
+    S_off = np.sum(S[:, off_row, off_col], axis=1)
+    S_shear = np.sum(S[:, shear, shear], axis=1)
+
+    props = {}
+    props["K_V"] = (C_diag + 2.0*C_off)/9.0
+    props["K_R"] = 1.0/(S_diag + 2.0*S_off)
+    props["G_V"] = (C_diag - C_off + 3.0*C_shear)/15.0
+    props["G_R"] = 15.0/(4.0*S_diag - 4.0*S_off + 3.0*S_shear)
+    props["K_H"] = 0.5*(props["K_V"] + props["K_R"])
+    props["G_H"] = 0.5*(props["G_V"] + props["G_R"])
+    for avg in ["V", "R", "H"]:
+        K = props["K_" + avg]
+        G = props["G_" + avg]
+        props["E_" + avg] = 9.0*K*G/(3.0*K + G)
+        props["nu_" + avg] = (3.0*K - 2.0*G)/(6.0*K + 2.0*G)
+    props["zener"] = 2.0*C[:, 3, 3]/(C[:, 0, 0] - C[:, 0, 1])
+    props["universal_anisotropy"] = 5.0*props["G_V"]/props["G_R"] + \
+        props["K_V"]/props["K_R"] - 6.0
+    props["compliance"] = S
+    return props
+
+
+def _evaluate_properties(atoms, properties):
+    """Return a dictionary with the requested properties."""
+    results = {}
+    if "stress" in properties:
+        results["stress"] = atoms.get_stress()
+    if "energy" in properties:
+        results["energy"] = atoms.get_potential_energy()
+    return results
 
 
 class ElasticConstants(object):
@@ -16,201 +205,562 @@ class ElasticConstants(object):
 
         self.delta_no_shear = [-0.01, -0.005, 0.005, 0.01]
         self.delta_shear = [-0.06, -0.03, 0.03, 0.06]
-        self.data = []
         self.elastic_tensor = None
+        self.elastic_tensor_std = None
+        self.covariance = None
+        self.residual_stress = None
         self.db_name = db_name
 
     def _to_mandel(self, tensor):
         """Convert tensor to mandel notation."""
-        mandel = np.zeros(6)
-        mandel[0] = tensor[0, 0]
-        mandel[1] = tensor[1, 1]
-        mandel[2] = tensor[2, 2]
-        mandel[3] = np.sqrt(2.0)*tensor[1, 2]
-        mandel[4] = np.sqrt(2.0)*tensor[0, 2]
-        mandel[5] = np.sqrt(2.0)*tensor[0, 1]
-        return mandel
+        return mandel.to_mandel(tensor)
+
+    def _from_mandel(self, mandel_vec):
+        """Convert a vector in Mandel notation to a symmetric tensor."""
+        return mandel.from_mandel(mandel_vec)
+
+    def _mandel_rotation(self, op):
+        """Return the 6x6 Mandel representation of a symmetry operation.
+
+        The returned matrix Q satisfies mandel(op*eps*op^T) = Q*mandel(eps)
+        for any symmetric tensor eps, and a rank 4 tensor in Mandel
+        notation transforms as Q*C*Q^T.
+        """
+        return mandel.mandel_rotation(op)
+
+    def _invariant_basis(self, spg, perm="xyz"):
+        """Return a basis for elastic tensors invariant under the space group.
+
+        The basis consists of orthonormal symmetric 6x6 matrices (Mandel
+        notation), and the number of matrices equals the number of
+        independent elastic constants.
+        """
+        proj = symmetry_projector(spg, perm=perm)
+
+        # Restrict to symmetric matrices, C = C^T
+        transpose = np.identity(36).reshape((6, 6, 36))
+        transpose = transpose.transpose((1, 0, 2)).reshape((36, 36))
+        sym = 0.5*(np.identity(36) + transpose)
+        U, S, V = np.linalg.svd(proj.dot(sym))
+        rank = np.sum(S > 1E-8*S[0])
+        return U[:, :rank].T.reshape((rank, 6, 6))
+
+    def minimal_strain_components(self, spg, perm="xyz"):
+        """Return the strain components needed to determine the tensor.
+
+        The components (0-2: normal xx, yy, zz, 3-5: shear yz, xz, xy)
+        are added one at a time and kept only if they determine more
+        independent elastic constants of the space group.
+        """
+        basis = self._invariant_basis(spg, perm=perm)
+        components = []
+        design = np.zeros((0, len(basis)))
+        rank = 0
+        for comp in range(6):
+            unit = np.zeros(6)
+            unit[comp] = 1.0
+            rows = np.array([B.dot(unit) for B in basis]).T
+            trial = np.vstack((design, rows))
+            trial_rank = np.linalg.matrix_rank(trial)
+            if trial_rank > rank:
+                components.append(comp)
+                design = trial
+                rank = trial_rank
+            if rank == len(basis):
+                break
+        return components
+
+    def _invariant_stress_basis(self, spg, perm="xyz"):
+        """Return an orthonormal basis of the invariant stresses (Mandel)."""
+        Q = mandel.mandel_rotation(_space_group_rotations(spg, perm=perm))
+        U, S, V = np.linalg.svd(np.mean(Q, axis=0))
+        rank = np.sum(S > 1E-8)
+        return U[:, :rank].T
+
+    def pair_strain_components(self, spg=1, perm="xyz"):
+        """Return the pairs of strain components needed for energy fits.
+
+        The energy of the single component strain states only depends on
+        the diagonal elements of the elastic tensor. Pairs (i, j) of
+        components (see minimal_strain_components) are added one at a time
+        and kept if they determine more independent elastic constants.
+        """
+        basis = self._invariant_basis(spg, perm=perm)
+        components = self.minimal_strain_components(spg, perm=perm)
+        design = np.array([[B[c, c] for B in basis] for c in components])
+        rank = np.linalg.matrix_rank(design)
+        pairs = []
+        for i in range(6):
+            for j in range(i + 1, 6):
+                if rank == len(basis):
+                    return pairs
+                unit = np.zeros(6)
+                unit[[i, j]] = 1.0
+                row = [unit.dot(B).dot(unit) for B in basis]
+                trial = np.vstack((design, row))
+                trial_rank = np.linalg.matrix_rank(trial)
+                if trial_rank > rank:
+                    pairs.append((i, j))
+                    design = trial
+                    rank = trial_rank
+        return pairs
 
     def _to_mandel_rank4(self, tensor):
         """Convert rank 4 tensor to mandel notation."""
-        from itertools import product
-        out = np.zeros((6, 6))
-        mandel_lut = {
-            (0, 0): 0,
-            (1, 1): 1,
-            (2, 2): 2,
-            (1, 2): 3,
-            (0, 2): 4,
-            (0, 1): 5
-        }
-        for ind in product([0, 1, 2], repeat=4):
-            if ind[1] < ind[0] or ind[3] < ind[2]:
-                continue
-            row = mandel_lut[(ind[0], ind[1])]
-            col = mandel_lut[(ind[2], ind[3])]
-
-            if ind[0] != ind[1] and ind[2] != ind[3]:
-                value = 2.0*tensor[ind[0], ind[1], ind[2], ind[3]]
-            elif ind[0] != ind[1]:
-                value = np.sqrt(2.0)*tensor[ind[0], ind[1], ind[2], ind[3]]
-            elif ind[2] != ind[3]:
-                value = np.sqrt(2.0)*tensor[ind[0], ind[1], ind[2], ind[3]]
-            else:
-                value = tensor[ind[0], ind[1], ind[2], ind[3]]
-            out[row, col] = value
-        return out
+        return mandel.to_mandel_rank4(tensor)
 
     def _to_full_rank4(self, mandel_tensor):
         """Convert Mandel representation to full tensor."""
-        from itertools import product
-        out = np.zeros((3, 3, 3, 3))
-        mandel_lut = [(0, 0), (1, 1), (2, 2), 
-                      (1, 2), (0, 2), (0, 1)]
-        
-        for ind in product(range(6), repeat=2):
-            if ind[0] > 2 and ind[1] > 2:
-                value = mandel_tensor[ind[0], ind[1]]/2.0
-            elif ind[0] > 2 or ind[1] > 2:
-                value = mandel_tensor[ind[0], ind[1]]/np.sqrt(2.0)
+        return mandel.to_full_rank4(mandel_tensor)
+
+    def _strained_atoms(self, component, delta):
+        """Return a strained copy of the atoms and its Mandel strain.
+
+        :param component: Strain component (0-2: normal xx, yy, zz,
+            3-5: shear yz, xz, xy) or a list of components
+        :param delta: Magnitude of the deformation (one per component)
+        """
+        shear_elements = {3: (1, 2), 4: (0, 2), 5: (0, 1)}
+        identity = np.identity(3)
+        atoms = self.atoms.copy()
+        atoms.set_calculator(self.atoms.get_calculator())
+        F = np.identity(3)
+        for comp, d in zip(np.atleast_1d(component), np.atleast_1d(delta)):
+            if comp < 3:
+                F[comp, comp] = 1 + d
             else:
-                value = mandel_tensor[ind[0], ind[1]]
+                e = shear_elements[comp]
+                F[e[0], e[1]] = d
+        strain = 0.5*(F.T.dot(F) - identity)
+        cell = atoms.get_cell()  # NOTE: not transpose by purpose
 
-            row = mandel_lut[ind[0]]
-            col = mandel_lut[ind[1]]
+        # Scale the components of each lattice vector
+        cell = cell.dot(F)
+        atoms.set_cell(cell, scale_atoms=True)
+        return atoms, self._to_mandel(strain)
 
-            out[row[0], row[1], col[0], col[1]] = value
-            out[row[0], row[1], col[1], col[0]] = value
-            out[row[1], row[0], col[1], col[0]] = value
-            out[row[1], row[0], col[0], col[1]] = value
-        return out
+    @staticmethod
+    def _strain_kvp(component):
+        """Return the keys identifying a single component strain state.
 
-    def _compute_no_shear(self):
+        strain_type is 0 for normal strains and the Mandel index
+        (3: yz, 4: xz, 5: xy) for shear strains. strain_component is
+        always the Mandel index.
+        """
+        return {"strain_type": 0 if component < 3 else component,
+                "strain_component": component}
+
+    def _compute_no_shear(self, axes=[0, 1, 2]):
         """Compute the energy for the non shear configurations."""
-        identity = np.identity(3)
         db = connect(self.db_name)
-        strain_type = 0
         for delta in self.delta_no_shear:
-            for i in range(3):
-                atoms = self.atoms.copy()
-                atoms.set_calculator(self.atoms.get_calculator())
-                F = np.identity(3)
-                F[i, i] = 1 + delta
-                strain = 0.5*(F.T.dot(F) - identity)
-                cell = atoms.get_cell()  # NOTE: not transpose by purpose
-
-                # Scale i-th component of each lattice vector
-                cell = cell.dot(F)
-                atoms.set_cell(cell, scale_atoms=True)
-                kvp = {"strain_type": strain_type}
-                strain = self._to_mandel(strain)
-                db.write(atoms, data={"strain": strain}, key_value_pairs=kvp)
+            for i in axes:
+                atoms, strain = self._strained_atoms(i, delta)
+                db.write(atoms, data={"strain": strain},
+                         key_value_pairs=self._strain_kvp(i))
 
-    def _compute_shear(self):
+    def _compute_shear(self, components=[5, 4, 3]):
         """Compute the stresses for sheared configurations."""
-        identity = np.identity(3)
-        element = [(0, 1), (0, 2), (1, 2)]
         db = connect(self.db_name)
-        strain_type = 3
         for delta in self.delta_shear:
-            for e in element:
-                atoms = self.atoms.copy()
-                atoms.set_calculator(self.atoms.get_calculator())
-                F = np.identity(3)
-                F[e[0], e[1]] = delta
-                strain = 0.5*(F.T.dot(F) - identity)
-                cell = atoms.get_cell()
-                cell = cell.dot(F)
-                atoms.set_cell(cell, scale_atoms=True)
-                kvp = {"strain_type": strain_type}
-                strain = self._to_mandel(strain)
+            for comp in components:
+                atoms, strain = self._strained_atoms(comp, delta)
+                db.write(atoms, data={"strain": strain},
+                         key_value_pairs=self._strain_kvp(comp))
+
+    def _compute_pairs(self, pairs):
+        """Compute the configurations where two components are strained."""
+        db = connect(self.db_name)
+        for dn, ds in zip(self.delta_no_shear, self.delta_shear):
+            for pair in pairs:
+                deltas = [dn if comp < 3 else ds for comp in pair]
+                atoms, strain = self._strained_atoms(pair, deltas)
+                kvp = {"strain_type": 100,
+                       "pair": "{}-{}".format(pair[0], pair[1])}
                 db.write(atoms, data={"strain": strain}, key_value_pairs=kvp)
-                strain_type += 1
 
-    def prepare_db(self):
+    def prepare_db(self, spg=1, perm="xyz", pair_strains=False):
         """Prepare database for DFT calculations.
 
         Puts entries into the database which needs to be evaluated with
         DFT
-        """
-        self._compute_no_shear()
-        self._compute_shear()
 
-    def run(self, uid, calc):
-        """Run one job."""
+        :param spg: Space group. If different from 1, only the strain
+            states needed to determine the independent elastic constants
+            of the space group are written (e.g. one normal and one shear
+            strain per magnitude for cubic crystals). get() has to be
+            called with the same spg and perm.
+        :param perm: Permutation of the axes (see get)
+        :param pair_strains: If True, states where two components are
+            strained simultaneously are added (strain_type=100), such that
+            the tensor can be fitted from energies with get_from_energy
+
+        Single component states are stored with the keys strain_type (0
+        for normal strains, 3: yz, 4: xz, 5: xy for shear strains) and
+        strain_component (the Mandel index of the strained component).
+        """
+        if spg == 1:
+            self._compute_no_shear()
+            self._compute_shear()
+        else:
+            components = self.minimal_strain_components(spg, perm=perm)
+            axes = [c for c in components if c < 3]
+            shear = [c for c in components if c >= 3]
+            if axes:
+                self._compute_no_shear(axes=axes)
+            if shear:
+                self._compute_shear(components=shear)
+
+        if pair_strains:
+            self._compute_pairs(self.pair_strain_components(spg, perm=perm))
+
+    def run(self, uid, calc, properties=["stress"]):
+        """Run one job.
+
+        The row is updated in place in a single transaction, such that
+        the strain state is never lost if the job is interrupted.
+        """
         db = connect(self.db_name)
-        row = db.get(id=uid)
-        strain = row.data["strain"]
-        kvp = row.key_value_pairs
         atoms = db.get_atoms(id=uid)
         atoms.set_calculator(calc)
-        stress = atoms.get_stress()
-        del db[uid]
-        db.write(atoms, data={"stress": stress, "strain": strain},
-                 key_value_pairs=kvp)
+        results = _evaluate_properties(atoms, properties)
+        self._store_results(db, uid, atoms, results)
+
+    @staticmethod
+    def _store_results(db, uid, atoms, results):
+        """Update the row with the calculated properties."""
+        atoms = atoms.copy()
+        atoms.set_calculator(SinglePointCalculator(atoms, **results))
+        data = {}
+        if "stress" in results:
+            data["stress"] = results["stress"]
+        db.update(uid, atoms=atoms, data=data, computed=True,
+                  delete_keys=["claimed_by", "claimed_at", "failed"])
+
+    @staticmethod
+    def _store_failure(db, uid, error):
+        """Mark the row as failed and store the error message."""
+        db.update(uid, data={"error": error}, failed=True,
+                  delete_keys=["claimed_by", "claimed_at"])
+
+    @staticmethod
+    def _pending_rows(db, owner=None, claim_timeout=None):
+        """Return the IDs of the rows that are neither computed nor claimed.
+
+        Failed rows are skipped. Claims made by owner, claims older than
+        claim_timeout seconds and claims of terminated processes on this
+        host do not count.
+        """
+        now = time.time()
+        pending = []
+        for row in db.select():
+            if row.get("computed", False) or row.get("failed", False):
+                continue
+            claimed_by = row.get("claimed_by", None)
+            if claimed_by is not None and claimed_by != owner and \
+                    not _is_dead_owner(claimed_by):
+                age = now - row.get("claimed_at", now)
+                if claim_timeout is None or age < claim_timeout:
+                    continue
+            pending.append(row.id)
+        return pending
+
+    @staticmethod
+    def _claimed_rows(db, owner):
+        """Return the IDs of uncomputed rows claimed by other jobs."""
+        return [row.id for row in db.select()
+                if not row.get("computed", False) and
+                row.get("claimed_by", owner) != owner]
+
+    def pending_ids(self, claim_timeout=None):
+        """Return the IDs of all rows that still need to be computed.
+
+        Rows claimed by a running run_pool job and rows where the
+        calculation failed (failed=True, the error message is stored in
+        data["error"]) are skipped. Remove the failed key to try a
+        failed row again.
+
+        :param claim_timeout: Claims older than this (seconds) are
+            considered stale and their rows are returned. If None, claims
+            never expire
+        """
+        db = connect(self.db_name)
+        return self._pending_rows(db, claim_timeout=claim_timeout)
+
+    def _claim_rows(self, db, num, owner, claim_timeout):
+        """Claim up to num pending rows in one transaction.
+
+        For SQLite databases the transaction takes the write lock before
+        reading, such that two jobs can never claim the same row.
+        """
+        with db:
+            if isinstance(db, SQLite3Database):
+                db.connection.execute("BEGIN IMMEDIATE")
+            uids = self._pending_rows(db, owner=owner,
+                                      claim_timeout=claim_timeout)[:num]
+            now = time.time()
+            for uid in uids:
+                db.update(uid, claimed_by=owner, claimed_at=now)
+        return uids
+
+    @staticmethod
+    def _release_rows(db, uids):
+        """Remove the claims of rows that were not computed."""
+        with db:
+            for uid in uids:
+                db.update(uid, delete_keys=["claimed_by", "claimed_at"])
+
+    def run_pool(self, calc, num_proc=None, batch_size=None,
+                 properties=["stress"], claim_timeout=86400.0):
+        """Evaluate all pending rows in parallel.
+
+        Batches of rows are claimed in the database (with the keys
+        claimed_by, host:pid of this process, and claimed_at), evaluated
+        by a pool of worker processes and each batch is committed in one
+        transaction. Hence, several run_pool jobs (e.g. on different
+        nodes) can work on the same database without computing a row
+        twice. Only the parent process reads from and writes to the
+        database. If the job is interrupted, all rows of committed
+        batches are kept and calling run_pool again resumes with the
+        remaining rows, including rows claimed by a job on this host that
+        is no longer running. Rows are updated in place, hence no row is
+        ever deleted or duplicated. A calculation that raises marks its
+        row with failed=True and the error message in data["error"], and
+        the remaining rows are still evaluated.
+
+        :param calc: Calculator (has to be picklable)
+        :param num_proc: Number of worker processes
+        :param batch_size: Number of rows committed in each transaction.
+            Default is 4 times the number of processes
+        :param properties: Properties to evaluate (stress and/or energy)
+        :param claim_timeout: Claims older than this (seconds) are
+            assumed to belong to a job that died, and their rows are
+            claimed again. If None, claims never expire
+
+        :return: Number of rows that are left uncomputed because they are
+            claimed by other jobs
+        """
+        if num_proc is None:
+            num_proc = os.cpu_count()
+        if batch_size is None:
+            batch_size = 4*num_proc
+        owner = "{}:{}".format(socket.gethostname(), os.getpid())
+
+        pool = Pool(processes=num_proc, initializer=_init_worker,
+                    initargs=(calc,))
+        db = connect(self.db_name)
+        try:
+            while True:
+                batch = self._claim_rows(db, batch_size, owner,
+                                         claim_timeout)
+                if not batch:
+                    break
+                try:
+                    jobs = [(uid, db.get_atoms(id=uid), properties)
+                            for uid in batch]
+                    results = pool.map(_evaluate_worker, jobs)
+                except Exception:
+                    self._release_rows(db, batch)
+                    raise
+                atoms = {job[0]: job[1] for job in jobs}
+                with db:
+                    for uid, res, error in results:
+                        if error is None:
+                            self._store_results(db, uid, atoms[uid], res)
+                        else:
+                            self._store_failure(db, uid, error)
+        finally:
+            pool.close()
+            pool.join()
+        return len(self._claimed_rows(db, owner))
+
+    def run_adaptive(self, calc, spg=1, perm="xyz",
+                     normal_deltas=[0.0025, 0.005, 0.0075, 0.01, 0.015,
+                                    0.02],
+                     shear_deltas=[0.015, 0.03, 0.045, 0.06, 0.09, 0.12],
+                     tol=1E-3, nonlinear_tol=0.1):
+        """Determine the elastic tensor with as few stress calls as possible.
+
+        One strain magnitude (positive and negative) is added at a time
+        for each of the strain components needed for the space group (see
+        minimal_strain_components), and the tensor is refitted to the
+        central differences sigma(+d) - sigma(-d). The loop
+        stops when the standard errors of all elements of the tensor are
+        below tol, or when the response to the last magnitude is
+        nonlinear. The stresses are taken relative to the stress of the
+        reference structure, sigma(0), and the nonlinearity of each strain
+        component is measured by
+
+        |sigma(+d) + sigma(-d) - 2*sigma(0) - C*(eps(+d) + eps(-d))|
+        / |sigma(+d) - sigma(-d)|
+
+        where C is the tensor fitted to the previous magnitudes.
+
+        The rows of the last magnitude are then marked with nonlinear=True
+        in the database and are not used in the fit. All calculations are
+        stored in the database with the keys strain_type and
+        strain_component (as in prepare_db), adaptive_step and nonlinear.
+
+        :param calc: Calculator
+        :param spg: Space group
+        :param perm: Permutation of the axes (see get)
+        :param normal_deltas: Increasing magnitudes of the normal strains
+        :param shear_deltas: Increasing magnitudes of the shear
+            deformations. Has to have the same length as normal_deltas
+        :param tol: Tolerance for the standard errors (eV/angstrom^3)
+        :param nonlinear_tol: Maximum allowed nonlinearity
+
+        :return: Elastic tensor and its standard errors (Mandel notation)
+        """
+        if len(normal_deltas) != len(shear_deltas):
+            raise ValueError("normal_deltas and shear_deltas need to have "
+                             "the same length")
+
+        components = self.minimal_strain_components(spg, perm=perm)
+        ref = self.atoms.copy()
+        ref.set_calculator(calc)
+        stress0 = ref.get_stress()
+        stress0[3:] *= np.sqrt(2.0)
+
+        db = connect(self.db_name)
+        basis = self._invariant_basis(spg, perm=perm)
+        acc = StressStrainAccumulator()
+        tensor = np.zeros((6, 6))
+        std = None
+        for step, deltas in enumerate(zip(normal_deltas, shear_deltas)):
+            uids = []
+            new_strains = []
+            new_stresses = []
+            for comp in components:
+                delta = deltas[0] if comp < 3 else deltas[1]
+                for sign in [1, -1]:
+                    atoms, strain = self._strained_atoms(comp, sign*delta)
+                    kvp = self._strain_kvp(comp)
+                    kvp.update(adaptive_step=step, nonlinear=False)
+                    uid = db.write(atoms, data={"strain": strain},
+                                   key_value_pairs=kvp)
+                    atoms.set_calculator(calc)
+                    results = _evaluate_properties(atoms, ["stress"])
+                    self._store_results(db, uid, atoms, results)
+
+                    stress = np.array(results["stress"])
+                    stress[3:] *= np.sqrt(2.0)
+                    uids.append(uid)
+                    new_strains.append(strain)
+                    new_stresses.append(stress - stress0)
+
+            # Central differences cancel the residual stress and all terms
+            # that are even in the deformation. The deformations for +d and
+            # -d have the same second order strain, which is accounted for
+            # with the current estimate of the tensor.
+            eps = np.array(new_strains)
+            sigma = np.array(new_stresses)
+            even = sigma[::2] + sigma[1::2] - \
+                (eps[::2] + eps[1::2]).dot(tensor.T)
+            new_strains = eps[::2] - eps[1::2]
+            new_stresses = sigma[::2] - sigma[1::2]
+            ratio = np.linalg.norm(even, axis=1) / \
+                np.linalg.norm(new_stresses, axis=1)
+            if np.any(ratio > nonlinear_tol):
+                for uid in uids:
+                    db.update(uid, nonlinear=True)
+                if acc.num_obs == 0:
+                    raise RuntimeError("The response is nonlinear already "
+                                       "at the smallest strain magnitude")
+                break
+
+            acc.add(new_strains, new_stresses)
+            tensor, cov, std = acc.solve(basis=basis)
+            self.elastic_tensor = tensor
+            self.elastic_tensor_std = std
+            self.covariance = cov
+            if np.max(std) < tol:
+                break
+        return self.elastic_tensor, std
 
     def get(self, select_cond=[], strains=None, stresses=None, spg=1, perm="xyz",
             convert_stress_to_mandel=True, convert_strain_to_mandel=False):
-        """Compute the elastic properties."""
+        """Compute the elastic properties.
+
+        The normal equations of the fit are accumulated while iterating
+        over the database (or the given strains and stresses). If the
+        strains span all six components, all elements are fitted and the
+        tensor is symmetrized afterwards. Otherwise, only the independent
+        constants of the space group are fitted.
+
+        The standard errors of the elements are stored in
+        elastic_tensor_std, and the covariance matrix of the fitted
+        parameters in covariance (see StressStrainAccumulator.solve).
+        """
+        acc = StressStrainAccumulator()
         if strains is not None and stresses is not None:
-            for eps, sigma in zip(strains, stresses):
-                d = {
-                    "strain": eps,
-                    "stress": sigma
-                }
-                self.data.append(d)
+            acc.add(strains, stresses,
+                    convert_stress_to_mandel=convert_stress_to_mandel,
+                    convert_strain_to_mandel=convert_strain_to_mandel)
         else:
             db = connect(self.db_name)
-            self.data = []
-            for row in db.select():
-                d = row.data
-                d["strain_type"] = row.key_value_pairs["strain_type"]
-                self.data.append(d)
-
-        stress_matrix = np.zeros((6, len(self.data)))
-        strain_matrix = np.zeros_like(stress_matrix)
-        for i, d in enumerate(self.data):
-            stress_matrix[:, i] = d["stress"]
-            strain_matrix[:, i] = d["strain"]
-
-        # Convert to Mandel stress (strain is already assumed to be
-        # in mandel representation)
-        if convert_stress_to_mandel:
-            stress_matrix[3:, :] *= np.sqrt(2.0)
-
-        if convert_strain_to_mandel:
-            strain_matrix[3:, :] *= np.sqrt(2.0)
-        print("here")
-        print(stress_matrix)
-        print("here")
-        prec = np.linalg.inv(strain_matrix.dot(strain_matrix.T))
-        #self.elastic_tensor = prec.dot(stress_matrix.dot(strain_matrix.T))
-        self.elastic_tensor = stress_matrix.dot(strain_matrix.T).dot(prec)
+            acc.add_rows(db.select(select_cond),
+                         convert_stress_to_mandel=convert_stress_to_mandel,
+                         convert_strain_to_mandel=convert_strain_to_mandel)
+
+        if acc.rank() < 6:
+            # Reduced set of strains, fit only the independent constants
+            basis = self._invariant_basis(spg, perm=perm)
+            if acc.rank(basis=basis) < len(basis):
+                msg = "The strains do not determine all independent elastic "
+                msg += "constants of space group {}".format(spg)
+                raise ValueError(msg)
+            self.elastic_tensor, self.covariance, self.elastic_tensor_std = \
+                acc.solve(basis=basis)
+            return self.elastic_tensor
+
+        self.elastic_tensor, cov, std = acc.solve()
+        if spg != 1:
+            proj = symmetry_projector(spg, perm=perm)
+            cov = proj.dot(cov).dot(proj.T)
+            std = np.sqrt(np.diag(cov)).reshape((6, 6))
+        self.covariance = cov
+        self.elastic_tensor_std = std
         self._symmetrize_elastic_tensor(spg=spg, perm=perm)
         return self.elastic_tensor
 
+    def get_from_energy(self, select_cond=[], spg=1, perm="xyz",
+                        convert_strain_to_mandel=False):
+        """Compute the elastic tensor from the total energies.
+
+        The energies of all rows are fitted in one least squares problem
+        to
+
+        E = E0 + V0*sigma0.eps + 0.5*V0*eps^T C eps
+
+        where V0 is the volume of the reference atoms, and sigma0 and C
+        are expanded in the quantities invariant under the space group.
+        The database has to contain pairs of strain components (see
+        prepare_db with pair_strains=True), otherwise the off-diagonal
+        elements are not determined.
+
+        The standard errors and the covariance are stored as in get, and
+        the fitted residual stress in residual_stress.
+        """
+        acc = EnergyStrainAccumulator()
+        db = connect(self.db_name)
+        acc.add_rows(db.select(select_cond),
+                     convert_strain_to_mandel=convert_strain_to_mandel)
+        basis = self._invariant_basis(spg, perm=perm)
+        stress_basis = self._invariant_stress_basis(spg, perm=perm)
+        E0, stress, tensor, cov, std = acc.solve(
+            self.atoms.get_volume(), basis, stress_basis=stress_basis)
+        self.elastic_tensor = tensor
+        self.elastic_tensor_std = std
+        self.covariance = cov
+        self.residual_stress = stress
+        return self.elastic_tensor
+
     def _symmetrize_elastic_tensor(self, spg=1, perm="xyz"):
         if spg == 1:
             return
-        permut_lut = {
-            "xyz": 0,
-            "zxy": -1,
-            "yzx": -2
-        }
-        from ase.spacegroup import Spacegroup
-        spg = Spacegroup(spg)
-        sym_op = spg.get_rotations()
-        full = self._to_full_rank4(self.elastic_tensor)
-        new_tensor = np.zeros((3, 3, 3, 3))
-        for op in sym_op:
-            op = np.roll(op, permut_lut[perm], (0, 1))
-            avg_tensor = np.zeros((3, 3, 3, 3))
-            avg_tensor = np.einsum("pl,ijkl->ijkp", op, full)
-            avg_tensor = np.einsum("ok,ijkp->ijop", op, avg_tensor)
-            avg_tensor = np.einsum("nj,ijop->inop", op, avg_tensor)
-            avg_tensor = np.einsum("mi,inop->mnop", op, avg_tensor)
-            new_tensor += avg_tensor
-        new_tensor /= len(sym_op)
-        self.elastic_tensor = self._to_mandel_rank4(new_tensor)
+        self.elastic_tensor = symmetrize_elastic_tensors(
+            self.elastic_tensor, spg, perm=perm)
 
     @property
     def compliance_tensor(self):
@@ -281,8 +831,7 @@ class ElasticConstants(object):
         inv_Gr = 4.0*(S[0, 0] + S[1, 1] + S[2, 2])
         inv_Gr -= 4.0*(S[0, 1] + S[1, 2] + S[2, 0])
         inv_Gr += 3.0*(S[3, 3] + S[4, 4] + S[5, 5])
-        Gr = 1.0/inv_Gr
-        return Gr/15.0
+        return 15.0/inv_Gr
 
     def shear_modulus(self, mode="VRH"):
         """Compute the shear modulus."""
@@ -325,6 +874,26 @@ class ElasticConstants(object):
         G_vrh = self.shear_modulus(mode="VRH")
         return (3.0*K_vrh - 2.0*G_vrh)/(6.0*K_vrh + 2.0*G_vrh)
 
+    def properties(self):
+        """Return all polycrystalline elastic properties.
+
+        See elastic_properties for the keys of the returned dictionary.
+        """
+        if self.elastic_tensor is None:
+            msg = "Elastic tensor not computed."
+            msg += "Call get() method first."
+            raise ValueError(msg)
+        props = elastic_properties(self.elastic_tensor[None, :, :])
+        return {k: v[0] for k, v in props.items()}
+
+    def directional(self):
+        """Return the direction dependent properties of the fitted tensor."""
+        if self.elastic_tensor is None:
+            msg = "Elastic tensor not computed."
+            msg += "Call get() method first."
+            raise ValueError(msg)
+        return DirectionalElasticity(self.elastic_tensor, atoms=self.atoms)
+
     @staticmethod
     def get_strain(ref_cell, strained_cell, principal=False):
         """Compute the eigenstrain of the strained cell.
@@ -0,0 +1,143 @@
+"""Module for direction dependent elastic properties."""
+import numpy as np
+from ase.units import _e, _amu, _hplanck, _k
+from atomtools.ase import mandel
+
+
+def fibonacci_sphere(num_points):
+    """Return approximately uniformly distributed unit vectors.
+
+    :param num_points: Number of points
+
+    :return: Array of shape (num_points, 3)
+    """
+    i = np.arange(num_points)
+    z = 1.0 - (2.0*i + 1.0)/num_points
+    r = np.sqrt(1.0 - z**2)
+    phi = np.pi*(3.0 - np.sqrt(5.0))*i
+    return np.column_stack((r*np.cos(phi), r*np.sin(phi), z))
+
+
+def _normalize(directions):
+    directions = np.atleast_2d(directions).astype(float)
+    return directions/np.sqrt(np.sum(directions**2, axis=1))[:, None]
+
+
+def _perpendicular_basis(directions):
+    """Return two unit vectors perpendicular to each direction."""
+    trial = np.zeros_like(directions)
+    along_x = np.abs(directions[:, 0]) > 0.9
+    trial[along_x, 1] = 1.0
+    trial[~along_x, 0] = 1.0
+    u = np.cross(directions, trial)
+    u /= np.sqrt(np.sum(u**2, axis=1))[:, None]
+    v = np.cross(directions, u)
+    return u, v
+
+
+class DirectionalElasticity(object):
+    """
+    Direction dependent elastic properties of a single crystal.
+
+    All properties are evaluated for arrays of directions in one
+    vectorized operation, such that dense grids (e.g. 10^5 points from
+    fibonacci_sphere) can be used.
+
+    :param elastic_tensor: Elastic tensor in Mandel notation
+        (eV/angstrom^3, as ElasticConstants.elastic_tensor)
+    :param atoms: Atoms object. Needed for the sound velocities (density)
+        and the Debye temperature
+    """
+
+    def __init__(self, elastic_tensor, atoms=None):
+        self.elastic_tensor = np.array(elastic_tensor, dtype=float)
+        self.compliance = np.linalg.inv(self.elastic_tensor)
+        self.full_tensor = mandel.to_full_rank4(self.elastic_tensor)
+        self.atoms = atoms
+
+    @property
+    def density(self):
+        """Mass density in amu/angstrom^3."""
+        if self.atoms is None:
+            raise ValueError("An atoms object is needed for the density")
+        return np.sum(self.atoms.get_masses())/self.atoms.get_volume()
+
+    def _uniaxial(self, directions):
+        """Mandel vectors of n n^T for each direction."""
+        directions = _normalize(directions)
+        return mandel.to_mandel(np.einsum("ni,nj->nij", directions,
+                                          directions))
+
+    def youngs_modulus(self, directions):
+        """Directional Young's modulus, 1/E = n_i n_j n_k n_l S_ijkl.
+
+        :param directions: Array of shape (N, 3)
+        """
+        m = self._uniaxial(directions)
+        return 1.0/np.einsum("ni,ij,nj->n", m, self.compliance, m)
+
+    def linear_compressibility(self, directions):
+        """Linear compressibility under hydrostatic pressure, S_iikl n_k n_l.
+
+        :param directions: Array of shape (N, 3)
+        """
+        m = self._uniaxial(directions)
+        identity = mandel.to_mandel(np.identity(3))
+        return m.dot(self.compliance.dot(identity))
+
+    def shear_modulus(self, directions, num_angles=36):
+        """Minimum and maximum shear modulus for each direction.
+
+        The shear modulus for shear in the plane with normal n along m
+        is 1/G = 4 n_i m_j n_k m_l S_ijkl. It is evaluated for num_angles
+        directions m perpendicular to n.
+
+        :param directions: Plane normals, array of shape (N, 3)
+        :param num_angles: Number of shear directions in [0, pi)
+
+        :return: Minimum and maximum shear modulus (each of length N)
+        """
+        directions = _normalize(directions)
+        u, v = _perpendicular_basis(directions)
+        angles = np.linspace(0.0, np.pi, num_angles, endpoint=False)
+        shear_dir = np.cos(angles)[None, :, None]*u[:, None, :] + \
+            np.sin(angles)[None, :, None]*v[:, None, :]
+        outer = np.einsum("ni,naj->naij", directions, shear_dir)
+        a = mandel.to_mandel(0.5*(outer + np.swapaxes(outer, -1, -2)))
+        G = 1.0/(4.0*np.einsum("nai,ij,naj->na", a, self.compliance, a))
+        return np.min(G, axis=1), np.max(G, axis=1)
+
+    def christoffel(self, directions):
+        """Christoffel matrices Gamma_ik = C_ijkl n_j n_l (N, 3, 3)."""
+        directions = _normalize(directions)
+        tmp = np.einsum("ijkl,nl->nijk", self.full_tensor, directions)
+        return np.einsum("nijk,nj->nik", tmp, directions)
+
+    def sound_velocities(self, directions):
+        """Acoustic sound velocities from the Christoffel equation.
+
+        :param directions: Propagation directions, array of shape (N, 3)
+
+        :return: Velocities (N, 3) in m/s, sorted in increasing order
+        """
+        eigval = np.linalg.eigvalsh(self.christoffel(directions))
+        eigval = np.maximum(eigval, 0.0)
+        return np.sqrt(eigval/self.density*_e/_amu)
+
+    def debye_temperature(self, num_points=10000):
+        """Elastic Debye temperature.
+
+        The mean sound velocity is averaged over the sphere,
+        3/v_m^3 = sum_s <1/v_s^3>, and
+
+        theta_D = h/k_B (3 n/(4 pi))^(1/3) v_m
+
+        where n is the number density of atoms.
+
+        :param num_points: Number of directions in the spherical average
+        """
+        vel = self.sound_velocities(fibonacci_sphere(num_points))
+        inv_cube = np.sum(np.mean(1.0/vel**3, axis=0))
+        v_mean = (3.0/inv_cube)**(1.0/3.0)
+        num_dens = len(self.atoms)/(self.atoms.get_volume()*1E-30)
+        return _hplanck/_k*(3.0*num_dens/(4.0*np.pi))**(1.0/3.0)*v_mean
@@ -0,0 +1,76 @@
+"""Conversion between full tensors and the Mandel notation.
+
+The Mandel index I of the symmetric pair (i, j) is
+0: (0, 0), 1: (1, 1), 2: (2, 2), 3: (1, 2), 4: (0, 2), 5: (0, 1),
+and off-diagonal components are weighted by sqrt(2), such that the
+Mandel notation preserves inner products. All functions act on stacks
+of tensors, i.e. arrays of shape (..., 3, 3), (..., 3, 3, 3, 3), (..., 6)
+and (..., 6, 6).
+"""
+import numpy as np
+
+# Pair of cartesian indices belonging to each Mandel index
+MANDEL_PAIRS = np.array([[0, 0], [1, 1], [2, 2], [1, 2], [0, 2], [0, 1]])
+
+# Weight of each Mandel index
+MANDEL_WEIGHTS = np.array([1.0, 1.0, 1.0, np.sqrt(2.0), np.sqrt(2.0),
+                           np.sqrt(2.0)])
+
+# Mandel index of each pair of cartesian indices
+MANDEL_INDEX = np.array([[0, 5, 4],
+                         [5, 1, 3],
+                         [4, 3, 2]])
+
+# Gather indices and weights for rank 4 tensors
+_ROW_I = MANDEL_PAIRS[:, 0][:, None]
+_ROW_J = MANDEL_PAIRS[:, 1][:, None]
+_COL_I = MANDEL_PAIRS[:, 0][None, :]
+_COL_J = MANDEL_PAIRS[:, 1][None, :]
+MANDEL_WEIGHTS_RANK4 = np.outer(MANDEL_WEIGHTS, MANDEL_WEIGHTS)
+
+# Scatter indices and weights from Mandel to full rank 4 tensors
+_FULL_ROW = MANDEL_INDEX[:, :, None, None]
+_FULL_COL = MANDEL_INDEX[None, None, :, :]
+_FULL_WEIGHTS_RANK4 = 1.0/MANDEL_WEIGHTS_RANK4[_FULL_ROW, _FULL_COL]
+
+
+def to_mandel(tensor):
+    """Convert symmetric tensors (..., 3, 3) to Mandel vectors (..., 6)."""
+    tensor = np.asarray(tensor)
+    return tensor[..., MANDEL_PAIRS[:, 0], MANDEL_PAIRS[:, 1]]*MANDEL_WEIGHTS
+
+
+def from_mandel(mandel):
+    """Convert Mandel vectors (..., 6) to symmetric tensors (..., 3, 3)."""
+    mandel = np.asarray(mandel)
+    return (mandel/MANDEL_WEIGHTS)[..., MANDEL_INDEX]
+
+
+def to_mandel_rank4(tensor):
+    """Convert rank 4 tensors (..., 3, 3, 3, 3) to Mandel (..., 6, 6).
+
+    The tensors are assumed to have the minor symmetries
+    C_ijkl = C_jikl = C_ijlk.
+    """
+    tensor = np.asarray(tensor)
+    return tensor[..., _ROW_I, _ROW_J, _COL_I, _COL_J]*MANDEL_WEIGHTS_RANK4
+
+
+def to_full_rank4(mandel):
+    """Convert Mandel matrices (..., 6, 6) to rank 4 tensors (..., 3, 3, 3, 3).
+    """
+    mandel = np.asarray(mandel)
+    return mandel[..., _FULL_ROW, _FULL_COL]*_FULL_WEIGHTS_RANK4
+
+
+def mandel_rotation(rot):
+    """Return the Mandel representation of rotations (..., 3, 3).
+
+    The returned matrices Q (..., 6, 6) satisfy
+    to_mandel(R eps R^T) = Q to_mandel(eps) for symmetric tensors eps, and
+    a rank 4 tensor in Mandel notation transforms as Q C Q^T.
+    """
+    rot = np.asarray(rot, dtype=float)
+    full = 0.5*(np.einsum("...ik,...jl->...ijkl", rot, rot) +
+                np.einsum("...il,...jk->...ijkl", rot, rot))
+    return to_mandel_rank4(full)
@@ -60,8 +60,13 @@ def align_direction_with_z( atoms=None, direction=(0,0,1) ):
     dir_to_align /= np.sqrt( np.sum(dir_to_align**2) )
 
     zhat = np.array( [0,0,1] )
+    if ( np.allclose(dir_to_align,zhat) ):
+        return atoms
+    if ( np.allclose(dir_to_align,-zhat) ):
+        atoms.rotate( 180.0, v="x", rotate_cell=True )
+        return atoms
     rot_axis = np.cross( zhat, dir_to_align )
     rot_axis /= np.sqrt( np.sum(rot_axis**2) )
-    angle = np.arccos( zhat.dot(rot_axis) )
+    angle = np.arccos( zhat.dot(dir_to_align) )
     atoms.rotate( -angle*180.0/np.pi, v=rot_axis, rotate_cell=True )
     return atoms
@@ -0,0 +1,274 @@
+"""Streaming least squares fits of stress-strain and energy-strain data."""
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, LinAlgError
+
+# Upper triangular index pairs of the quadratic strain monomials
+QUADRATIC_ROWS, QUADRATIC_COLS = np.triu_indices(6)
+
+
+class StrainDataAccumulator(object):
+    """Base class for accumulators fed with strain states from a database.
+
+    Subclasses implement add and _row_data, which extracts the strain and
+    the fitted quantity from a database row.
+    """
+
+    def add_rows(self, rows, batch_size=100, **kwargs):
+        """Add observations from an iterator over database rows.
+
+        :param rows: Iterator over rows (e.g. db.select()) with the strain
+            in the data dictionary
+        :param batch_size: Number of rows added in each batch
+        :param kwargs: Passed to add
+        """
+        strains = []
+        values = []
+        for row in rows:
+            strain, value = self._row_data(row)
+            strains.append(strain)
+            values.append(value)
+            if len(strains) == batch_size:
+                self.add(strains, values, **kwargs)
+                strains = []
+                values = []
+        if strains:
+            self.add(strains, values, **kwargs)
+
+    def add(self, strains, values, **kwargs):
+        raise NotImplementedError("Has to be implemented in derived classes")
+
+    def _row_data(self, row):
+        raise NotImplementedError("Has to be implemented in derived classes")
+
+    @staticmethod
+    def _solve(matrix, rhs):
+        """Solve matrix*x = rhs and return x and the inverse of matrix."""
+        try:
+            factor = cho_factor(matrix)
+            identity = np.identity(matrix.shape[0])
+            return cho_solve(factor, rhs), cho_solve(factor, identity)
+        except LinAlgError:
+            sol = np.linalg.lstsq(matrix, rhs, rcond=None)[0]
+            return sol, np.linalg.pinv(matrix)
+
+    @staticmethod
+    def _residual_variance(rss, dof):
+        rss = np.maximum(rss, 0.0)
+        if dof <= 0:
+            return np.nan*rss
+        return rss/dof
+
+
+class StressStrainAccumulator(StrainDataAccumulator):
+    """
+    Accumulate the normal equations of the fit sigma = C eps.
+
+    Only the sums
+
+    sum eps eps^T (6x6), sum sigma eps^T (6x6), sum sigma sigma^T (6x6)
+
+    and the number of observations are stored, hence the memory does not
+    depend on the number of structures. Strains and stresses are in
+    Mandel notation.
+    """
+
+    def __init__(self):
+        self.strain_strain = np.zeros((6, 6))
+        self.stress_strain = np.zeros((6, 6))
+        self.stress_stress = np.zeros((6, 6))
+        self.num_obs = 0
+
+    def add(self, strains, stresses, convert_stress_to_mandel=False,
+            convert_strain_to_mandel=False):
+        """Add one observation or a batch of observations.
+
+        :param strains: Mandel strains, shape (6,) or (N, 6)
+        :param stresses: Mandel stresses, shape (6,) or (N, 6)
+        :param convert_stress_to_mandel: If True, the stresses are
+            converted from Voigt (as returned by ASE) to Mandel notation
+        :param convert_strain_to_mandel: If True, the strains are
+            converted from Voigt to Mandel notation
+
+        Observations can also be added from database rows with add_rows,
+        which takes the same keyword arguments.
+        """
+        strains = np.array(np.atleast_2d(strains), dtype=float)
+        stresses = np.array(np.atleast_2d(stresses), dtype=float)
+        if convert_stress_to_mandel:
+            stresses[:, 3:] *= np.sqrt(2.0)
+        if convert_strain_to_mandel:
+            strains[:, 3:] *= np.sqrt(2.0)
+        self.strain_strain += strains.T.dot(strains)
+        self.stress_strain += stresses.T.dot(strains)
+        self.stress_stress += stresses.T.dot(stresses)
+        self.num_obs += strains.shape[0]
+
+    def _row_data(self, row):
+        return row.data["strain"], row.data["stress"]
+
+    def _normal_equations(self, basis=None):
+        """Return the normal matrix and right hand side.
+
+        Without a basis the parameters are the 36 elements of C. With a
+        basis (list of 6x6 matrices B_k), C = sum_k c_k B_k and the
+        parameters are c_k.
+        """
+        if basis is None:
+            return self.strain_strain, self.stress_strain.T
+
+        basis = np.asarray(basis)
+        matrix = np.einsum("kij,ljm,mi->kl", basis, basis,
+                           self.strain_strain)
+        rhs = np.einsum("kij,ji->k", basis, self.stress_strain)
+        return matrix, rhs
+
+    def rank(self, basis=None):
+        """Return the rank of the normal equations."""
+        matrix, _ = self._normal_equations(basis=basis)
+        if self.num_obs == 0:
+            return 0
+        return np.linalg.matrix_rank(matrix)
+
+    def solve(self, basis=None):
+        """Solve the normal equations.
+
+        :param basis: Optional basis of symmetric 6x6 matrices (e.g. the
+            tensors invariant under the space group). If not given all
+            elements of C are fitted independently
+
+        :return: Elastic tensor (6x6), covariance matrix of the parameters
+            (36x36 for the elements of C in row major order, or one row and
+            column per basis element) and the standard error of each
+            element of the elastic tensor (6x6). The covariances are estimated from
+            the residuals and are NaN if there are no degrees of freedom
+            left.
+        """
+        matrix, rhs = self._normal_equations(basis=basis)
+        sol, inv = self._solve(matrix, rhs)
+
+        if basis is None:
+            tensor = sol.T
+            rss = np.diag(self.stress_stress) - \
+                2.0*np.sum(tensor*self.stress_strain, axis=1) + \
+                np.einsum("ij,jk,ik->i", tensor, self.strain_strain, tensor)
+            dof = self.num_obs - 6
+            var = self._residual_variance(rss, dof)
+            cov = np.kron(np.diag(var), inv)
+            std = np.sqrt(np.diag(cov)).reshape((6, 6))
+            return tensor, cov, std
+
+        basis = np.asarray(basis)
+        tensor = np.einsum("k,kij->ij", sol, basis)
+        rss = np.trace(self.stress_stress) - 2.0*sol.dot(rhs) + sol.dot(matrix).dot(sol)
+        dof = 6*self.num_obs - len(basis)
+        cov = inv*self._residual_variance(rss, dof)
+        var = np.einsum("kij,kl,lij->ij", basis, cov, basis)
+        return tensor, cov, np.sqrt(np.abs(var))
+
+
+class EnergyStrainAccumulator(StrainDataAccumulator):
+    """
+    Accumulate the normal equations of the energy expansion
+
+    E = E0 + V0*sigma0.eps + 0.5*V0*eps^T C eps
+
+    where eps is the Mandel strain, V0 the reference volume, sigma0 the
+    residual stress and C the elastic tensor. The energy is linear in the
+    28 monomials 1, eps_i and eps_i*eps_j (i <= j), hence only the 28x28
+    normal matrix of the monomials is stored, and all parameters are fitted
+    in one least squares problem when solve is called.
+    """
+
+    def __init__(self):
+        num_features = 7 + len(QUADRATIC_ROWS)
+        self.feature_feature = np.zeros((num_features, num_features))
+        self.feature_energy = np.zeros(num_features)
+        self.energy_energy = 0.0
+        self.num_obs = 0
+
+    @staticmethod
+    def features(strains):
+        """Return the monomials of each strain (N, 28)."""
+        strains = np.atleast_2d(strains)
+        quad = strains[:, QUADRATIC_ROWS]*strains[:, QUADRATIC_COLS]
+        return np.hstack((np.ones((strains.shape[0], 1)), strains, quad))
+
+    def add(self, strains, energies, convert_strain_to_mandel=False):
+        """Add one observation or a batch of observations.
+
+        :param strains: Mandel strains, shape (6,) or (N, 6)
+        :param energies: Total energies, scalar or shape (N,)
+        :param convert_strain_to_mandel: If True, the strains are
+            converted from Voigt to Mandel notation
+        """
+        strains = np.array(np.atleast_2d(strains), dtype=float)
+        energies = np.atleast_1d(energies).astype(float)
+        if convert_strain_to_mandel:
+            strains[:, 3:] *= np.sqrt(2.0)
+        feat = self.features(strains)
+        self.feature_feature += feat.T.dot(feat)
+        self.feature_energy += feat.T.dot(energies)
+        self.energy_energy += energies.dot(energies)
+        self.num_obs += strains.shape[0]
+
+    def _row_data(self, row):
+        return row.data["strain"], row.energy
+
+    def _parameter_map(self, volume, basis, stress_basis):
+        """Return the matrix mapping the parameters to the monomials.
+
+        The parameters are E0, the coefficients of sigma0 in stress_basis
+        and the coefficients of C in basis.
+        """
+        num_params = 1 + len(stress_basis) + len(basis)
+        param_map = np.zeros((self.feature_feature.shape[0], num_params))
+        param_map[0, 0] = 1.0
+        for m, vec in enumerate(stress_basis):
+            param_map[1:7, 1 + m] = volume*np.asarray(vec)
+
+        # Off-diagonal monomials appear twice in eps^T C eps
+        weight = np.where(QUADRATIC_ROWS == QUADRATIC_COLS, 0.5, 1.0)
+        offset = 1 + len(stress_basis)
+        for k, B in enumerate(basis):
+            param_map[7:, offset + k] = \
+                volume*weight*np.asarray(B)[QUADRATIC_ROWS, QUADRATIC_COLS]
+        return param_map
+
+    def solve(self, volume, basis, stress_basis=None):
+        """Solve the normal equations.
+
+        :param volume: Reference volume V0
+        :param basis: Basis of symmetric 6x6 matrices for the elastic
+            tensor (e.g. the tensors invariant under the space group)
+        :param stress_basis: Basis of Mandel vectors for the residual
+            stress. If not given, all six components are fitted
+
+        :return: E0, residual stress (6), elastic tensor (6x6), covariance
+            matrix of the parameters (E0, stress coefficients and elastic
+            coefficients) and the standard error of each element of the
+            elastic tensor (6x6)
+        """
+        if stress_basis is None:
+            stress_basis = np.identity(6)
+        basis = np.asarray(basis)
+        stress_basis = np.asarray(stress_basis)
+        param_map = self._parameter_map(volume, basis, stress_basis)
+        matrix = param_map.T.dot(self.feature_feature).dot(param_map)
+        rhs = param_map.T.dot(self.feature_energy)
+        num_params = len(rhs)
+        if np.linalg.matrix_rank(matrix) < num_params:
+            msg = "The strain states do not determine all parameters of the "
+            msg += "energy expansion. Pairs of strain components are needed "
+            msg += "to determine the off-diagonal elastic constants."
+            raise ValueError(msg)
+
+        sol, inv = self._solve(matrix, rhs)
+        rss = self.energy_energy - 2.0*sol.dot(rhs) + sol.dot(matrix).dot(sol)
+        cov = inv*self._residual_variance(rss, self.num_obs - num_params)
+
+        offset = 1 + len(stress_basis)
+        stress = sol[1:offset].dot(stress_basis)
+        tensor = np.einsum("k,kij->ij", sol[offset:], basis)
+        cov_C = cov[offset:, offset:]
+        var = np.einsum("kij,kl,lij->ij", basis, cov_C, basis)
+        return sol[0], stress, tensor, cov, np.sqrt(np.abs(var))
@@ -0,0 +1,292 @@
+"""Module for computing the 3D structure factor on a grid."""
+import numpy as np
+from atomtools.ase.autocorrelation_function import rotation_to_normal
+
+
+def lattice_direction(direction, cell, max_index=12, tol=1E-6):
+    """Return the shortest integer direction [uvw] parallel to a vector.
+
+    :param direction: Cartesian vector
+    :param cell: Cell vectors (rows)
+    :param max_index: Largest index that is tried
+    :param tol: Tolerance for the direction to be parallel to [uvw]
+    """
+    frac = np.linalg.solve(np.asarray(cell).T, np.asarray(direction, float))
+    frac /= np.max(np.abs(frac))
+    for n in range(1, max_index + 1):
+        uvw = np.round(n*frac)
+        if np.allclose(uvw, n*frac, atol=n*tol):
+            uvw = uvw.astype(int)
+            return uvw//np.gcd.reduce(uvw)
+    raise ValueError("{} is not parallel to a lattice direction with "
+                     "indices up to {}".format(direction, max_index))
+
+
+def unimodular_basis(uvw):
+    """Complete a primitive integer direction to a unimodular matrix.
+
+    The first row is uvw and the determinant is 1, hence the rows are a
+    basis of the lattice and the last two rows span the lattice
+    projected along uvw. The last two columns of the inverse span the
+    integer vectors (h, k, l) perpendicular to uvw.
+
+    :param uvw: Integer direction with gcd(u, v, w) = 1
+    """
+    u, v, w = [int(x) for x in uvw]
+    if u == 0 and v == 0:
+        if abs(w) != 1:
+            raise ValueError("The direction has to be primitive")
+        return np.array([[0, 0, w], [w, 0, 0], [0, 1, 0]])
+
+    # Extended Euclid: u*x + v*y = g and g*s + w*t = 1
+    def ext_gcd(a, b):
+        if b == 0:
+            return (a, 1, 0) if a >= 0 else (-a, -1, 0)
+        g, x, y = ext_gcd(b, a % b)
+        return g, y, x - (a//b)*y
+    g, x, y = ext_gcd(u, v)
+    one, s, t = ext_gcd(g, w)
+    if one != 1:
+        raise ValueError("The direction has to be primitive")
+    return np.array([[u, v, w], [-y, x, 0], [-t*u//g, -t*v//g, s]])
+
+
+def reduce_basis_2d(periods):
+    """Lagrange-Gauss reduction of a 2D lattice basis (rows)."""
+    p1, p2 = np.array(periods[0], float), np.array(periods[1], float)
+    while True:
+        if p2.dot(p2) < p1.dot(p1):
+            p1, p2 = p2, p1
+        mu = np.round(p1.dot(p2)/p1.dot(p1))
+        if mu == 0.0:
+            return np.array([p1, p2])
+        p2 = p2 - mu*p1
+
+
+def projected_cell(cell, direction):
+    """Return the periodicity vectors of a cell projected along a direction.
+
+    The direction has to be parallel to a lattice direction [uvw]. The
+    lattice vectors completing [uvw] to a basis are projected onto the
+    plane and reduced. The in-plane coordinates follow the same
+    convention as AutocorrelationFunction.projected_positions.
+
+    :param cell: Cell vectors (rows)
+    :param direction: Cartesian direction
+
+    :return: Array of shape (2, 2) where the rows are the periodicity
+        vectors
+    """
+    basis = unimodular_basis(lattice_direction(direction, cell))
+    rot = rotation_to_normal(direction)
+    return reduce_basis_2d(basis[1:].dot(cell).dot(rot[:2, :].T))
+
+
+class StructureFactor(object):
+    """
+    Species resolved structure factor and auto correlation function of
+    a periodic atoms object.
+
+    The densities are deposited on a grid spanned by the cell vectors,
+    such that the grid is commensurate with the periodic images and the
+    Fourier transforms are evaluated exactly at the reciprocal lattice
+    vectors of the cell.
+
+    :param atoms: Atoms object
+    :param symb_dict: Weight of each chemical symbol. If not given all
+        species has weight 1
+    :param grid: Number of grid points along each cell vector. If not
+        given it is determined from spacing
+    :param spacing: Approximate grid spacing in angstrom
+    """
+
+    def __init__(self, atoms, symb_dict=None, grid=None, spacing=0.2):
+        self.atoms = atoms
+        self.symb_dict = symb_dict
+        if grid is None:
+            lengths = np.sqrt(np.sum(atoms.get_cell()**2, axis=1))
+            grid = np.ceil(lengths/spacing).astype(int)
+        self.grid = tuple(int(n) for n in grid)
+
+        symbs = atoms.get_chemical_symbols()
+        _, first = np.unique(symbs, return_index=True)
+        self.species = [symbs[i] for i in sorted(first)]
+        self._fourier_densities = None
+
+    @property
+    def num_atoms(self):
+        return len(self.atoms)
+
+    @property
+    def weights(self):
+        """Return the weight of each species."""
+        if self.symb_dict is None:
+            return np.ones(len(self.species))
+        return np.array([self.symb_dict.get(s, 0.0) for s in self.species])
+
+    def species_densities(self):
+        """Return the number of atoms of each species in each voxel.
+
+        The shape is (num_species, n1, n2, n3).
+        """
+        symbs = np.array(self.atoms.get_chemical_symbols())
+        species_index = np.zeros(len(symbs), dtype=int)
+        for i, s in enumerate(self.species):
+            species_index[symbs == s] = i
+
+        grid = np.array(self.grid)
+        frac = self.atoms.get_scaled_positions(wrap=True)
+        indx = np.floor(frac*grid + 0.5).astype(int) % grid
+        flat = np.ravel_multi_index((species_index, indx[:, 0], indx[:, 1],
+                                     indx[:, 2]),
+                                    (len(self.species),) + self.grid)
+        size = len(self.species)*np.prod(grid)
+        dens = np.bincount(flat, minlength=size).astype(float)
+        return dens.reshape((len(self.species),) + self.grid)
+
+    @property
+    def fourier_densities(self):
+        """Fourier transform of the species densities (rfftn layout)."""
+        if self._fourier_densities is None:
+            self._fourier_densities = np.fft.rfftn(self.species_densities(),
+                                                   axes=(1, 2, 3))
+        return self._fourier_densities
+
+    def miller_indices(self):
+        """Return the integer indices (h, k, l) of the rfftn grid."""
+        h = np.fft.fftfreq(self.grid[0], d=1.0/self.grid[0])
+        k = np.fft.fftfreq(self.grid[1], d=1.0/self.grid[1])
+        l = np.fft.rfftfreq(self.grid[2], d=1.0/self.grid[2])
+        return np.meshgrid(h, k, l, indexing="ij")
+
+    def q_vectors(self):
+        """Return the cartesian wave vectors of the rfftn grid.
+
+        The shape is (n1, n2, n3//2+1, 3) and the unit is 1/angstrom.
+        """
+        hkl = np.stack(self.miller_indices(), axis=-1)
+        rec_cell = self.atoms.get_reciprocal_cell()
+        return 2.0*np.pi*hkl.dot(rec_cell)
+
+    def partial_structure_factors(self):
+        """Return the partial structure factors S_ab(q).
+
+        The shape is (num_species, num_species, n1, n2, n3//2+1).
+        """
+        ft = self.fourier_densities
+        return np.einsum("a...,b...->ab...", ft, np.conj(ft))/self.num_atoms
+
+    def structure_factor(self):
+        """Return the weighted structure factor S(q) (rfftn layout)."""
+        ft = np.tensordot(self.weights, self.fourier_densities, axes=(0, 0))
+        return np.abs(ft)**2/self.num_atoms
+
+    def autocorrelation(self):
+        """Return the real space auto correlation of the weighted density.
+
+        Element (i, j, k) is the correlation at the lag vector
+        i*a1/n1 + j*a2/n2 + k*a3/n3.
+        """
+        return np.fft.irfftn(self.structure_factor(), s=self.grid)
+
+    def _plane_normal(self, plane_normal, hkl):
+        """Return the cartesian normal of a plane given by normal or (hkl)."""
+        if hkl is None:
+            return np.asarray(plane_normal, dtype=float)
+        return np.asarray(hkl, dtype=float).dot(self.atoms.get_reciprocal_cell())
+
+    def _plane_section(self, normal, tol):
+        """Return the Miller indices, wave vectors and S(q) in a plane."""
+        rot = rotation_to_normal(normal)
+        q = self.q_vectors().dot(rot.T)
+        S = self.structure_factor()
+        hkl = np.stack(self.miller_indices(), axis=-1)
+
+        qmax = np.max(np.abs(q))
+        in_plane = np.abs(q[..., 2]) < tol*qmax
+        hkl_plane = hkl[in_plane]
+        q_plane = q[in_plane][:, :2]
+        S_plane = S[in_plane]
+
+        # rfftn only stores l >= 0, the rest follows from S(-q) = S(q)
+        mirror = hkl_plane[:, 2] > 0
+        hkl_plane = np.vstack((hkl_plane, -hkl_plane[mirror]))
+        q_plane = np.vstack((q_plane, -q_plane[mirror]))
+        S_plane = np.concatenate((S_plane, S_plane[mirror]))
+        return hkl_plane.astype(int), q_plane, S_plane
+
+    def plane_projection(self, plane_normal=(1, 1, 1), hkl=None, tol=1E-8):
+        """Return the structure factor in the plane perpendicular to a normal.
+
+        By the projection-slice theorem this is the structure factor of
+        the atoms projected onto the plane. The in-plane coordinates
+        follow the same convention as
+        AutocorrelationFunction.projected_positions.
+
+        :param plane_normal: Cartesian normal vector of the plane
+        :param hkl: Miller indices of the plane. If given, the normal is
+            the reciprocal lattice vector of (hkl) and plane_normal is
+            ignored
+        :param tol: Tolerance (relative to the largest wave vector) for
+            considering a wave vector to be in the plane
+
+        :return: q (M x 2) in-plane wave vectors and S (M) the
+            structure factor
+        """
+        normal = self._plane_normal(plane_normal, hkl)
+        _, q_plane, S_plane = self._plane_section(normal, tol)
+        return q_plane, S_plane
+
+    def projected_autocorrelation(self, plane_normal=(1, 1, 1), hkl=None,
+                                  npix=None):
+        """Compute the auto correlation of the projected density.
+
+        The normal has to be parallel to a lattice direction [uvw], such
+        that the projected density is periodic with the two periodicity
+        vectors p1 and p2 of the projected cell (see projected_cell). The
+        weighted density is deposited on a grid spanned by p1 and p2 and
+        the periodic correlation is obtained by FFT.
+
+        Element (i, j) is the correlation at the lag vector
+        i*p1/n1 + j*p2/n2. The normalization is the same as
+        autocorrelation (per atom), hence if all atom columns are in
+        different pixels, multiplying the zero lag value by the number of
+        atoms gives the sum of the squared column weights.
+
+        :param plane_normal: Cartesian normal vector of the plane
+        :param hkl: Miller indices of the plane (see plane_projection)
+        :param npix: Number of pixels (n1, n2) along p1 and p2. If not
+            given, the pixel size is the smallest voxel size of the 3D
+            grid
+
+        :return: corr (n1 x n2) and the in-plane lag vectors
+            (n1 x n2 x 2)
+        """
+        normal = self._plane_normal(plane_normal, hkl)
+        cell = self.atoms.get_cell()
+        periods = projected_cell(cell, normal)
+        if npix is None:
+            lengths = np.sqrt(np.sum(cell**2, axis=1))
+            voxel = np.min(lengths/np.array(self.grid))
+            lengths = np.sqrt(np.sum(periods**2, axis=1))
+            npix = np.round(lengths/voxel).astype(int)
+        shape = tuple(int(n) for n in np.broadcast_to(npix, (2,)))
+
+        rot = rotation_to_normal(normal)
+        proj = self.atoms.get_positions().dot(rot[:2, :].T)
+        frac = proj.dot(np.linalg.inv(periods))
+        indx = np.floor(frac*np.array(shape) + 0.5).astype(int) % shape
+        symbs = self.atoms.get_chemical_symbols()
+        weights = dict(zip(self.species, self.weights))
+        values = np.array([weights[s] for s in symbs])
+        image = np.zeros(shape)
+        np.add.at(image, (indx[:, 0], indx[:, 1]), values)
+
+        corr = np.fft.irfft2(np.abs(np.fft.rfft2(image))**2, s=shape)
+        corr /= self.num_atoms
+
+        i, j = np.meshgrid(np.arange(shape[0])/float(shape[0]),
+                           np.arange(shape[1])/float(shape[1]),
+                           indexing="ij")
+        lags = i[..., None]*periods[0] + j[..., None]*periods[1]
+        return corr, lags
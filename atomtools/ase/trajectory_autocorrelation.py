@@ -0,0 +1,185 @@
+"""Module for averaging the auto correlation function over many frames."""
+import os
+from itertools import islice
+import numpy as np
+from atomtools.ase.autocorrelation_function import AutocorrelationFunction
+from atomtools.ase.autocorrelation_function import grid_positions
+from atomtools.ase.autocorrelation_function import grid_extent
+from atomtools.ase.autocorrelation_function import power_spectrum
+from atomtools.ase.autocorrelation_function import correlation_from_power
+from atomtools.ase.structure_factor import projected_cell
+
+
+class TrajectoryAutocorrelation(object):
+    """Streaming average of projected images and their auto correlation.
+
+    Only the running sum of the images and the running sum of the
+    power spectra are stored. Hence, the memory is independent of the
+    number of frames.
+
+    All frames are deposited on the same grid, such that a pixel
+    corresponds to the same position in every frame. Unless pos_min and
+    spacing are given, the grid is fixed by the first frame. In the linear
+    mode it spans the projected bounding box and positions of later frames
+    outside the grid are discarded. In the periodic mode the grid spans
+    the projected cell of the first frame and positions are wrapped with
+    the period of the cell. This requires a projected cell that is
+    rectangular in the plane (e.g. (001) of a cubic cell), otherwise
+    pos_min and spacing have to be given.
+
+    :param plane_normal: Normal vector of the projection plane
+    :param symb_dict: Weight of each chemical symbol
+    :param npix: Number of pixels along each direction
+    :param mode: linear (zero padded) or periodic correlation
+    :param smearing: Smearing kernel (None, gaussian or cic)
+    :param sigma: Width of the Gaussian smearing kernel
+    :param pos_min: Projected position of the first pixel
+    :param spacing: Pixel spacing along each direction
+    """
+
+    def __init__(self, plane_normal=(1, 1, 1), symb_dict={}, npix=512,
+                 mode="periodic", smearing=None, sigma=None, pos_min=None,
+                 spacing=None):
+        allowed_modes = ["linear", "periodic"]
+        if mode not in allowed_modes:
+            raise ValueError("Mode has to be one of {}".format(allowed_modes))
+        self.acf = AutocorrelationFunction(plane_normal=plane_normal,
+                                           symb_dict=dict(symb_dict))
+        self.npix = npix
+        self.mode = mode
+        self.smearing = smearing
+        self.sigma = sigma
+        if (pos_min is None) != (spacing is None):
+            raise ValueError("pos_min and spacing have to be given together")
+        self.pos_min = pos_min
+        self.spacing = spacing
+        self.num_frames = 0
+        self._resume_skip = 0
+        self.image_sum = None
+        self.power_sum = None
+
+    @property
+    def periodic(self):
+        return self.mode == "periodic"
+
+    def _periodic_spacing(self, atoms, tol=1E-8):
+        """Return the pixel spacing given by the projected cell."""
+        periods = projected_cell(atoms.get_cell(), self.acf.plane_normal)
+        if abs(periods[0, 0]) < abs(periods[0, 1]):
+            periods = periods[::-1]
+        scale = np.max(np.abs(periods))
+        if abs(periods[0, 1]) > tol*scale or abs(periods[1, 0]) > tol*scale:
+            raise ValueError("The projected cell is not rectangular in the "
+                             "plane. pos_min and spacing have to be given "
+                             "in the periodic mode.")
+        return np.abs(np.diag(periods))/self.npix
+
+    def add_frame(self, atoms):
+        """Add the contribution from one frame."""
+        self.acf.atoms = atoms
+        pos = self.acf.projected_positions
+        if self.pos_min is None:
+            if self.periodic:
+                self.spacing = self._periodic_spacing(atoms)
+                self.pos_min = np.min(pos, axis=0)
+            else:
+                self.pos_min, self.spacing = grid_extent(pos, self.npix)
+        image = grid_positions(pos, self.acf.values, self.npix,
+                               smearing=self.smearing, sigma=self.sigma,
+                               pos_min=self.pos_min, spacing=self.spacing,
+                               wrap=self.periodic)
+        power = power_spectrum(image, periodic=self.periodic)
+
+        if self.num_frames == 0:
+            self.image_sum = image
+            self.power_sum = power
+        else:
+            self.image_sum += image
+            self.power_sum += power
+        self.num_frames += 1
+
+    def run(self, frames, checkpoint=None, checkpoint_every=100):
+        """Accumulate all frames from an iterator.
+
+        If the accumulator was restored from a checkpoint, the frames that
+        are already included are skipped in the first call, such that
+        passing the same trajectory again resumes the calculation. Later
+        calls add all frames.
+
+        :param frames: Iterable of atoms (e.g. ase.io.Trajectory)
+        :param checkpoint: Filename where the partial sums are stored
+        :param checkpoint_every: Number of frames between each checkpoint
+        """
+        skip, self._resume_skip = self._resume_skip, 0
+        for atoms in islice(frames, skip, None):
+            self.add_frame(atoms)
+            if checkpoint is not None and \
+                    self.num_frames % checkpoint_every == 0:
+                self.save(checkpoint)
+
+        if checkpoint is not None:
+            self.save(checkpoint)
+
+    def _check_frames(self):
+        if self.num_frames == 0:
+            raise ValueError("No frames have been added.")
+
+    @property
+    def average_image(self):
+        """Return the average projected image."""
+        self._check_frames()
+        return self.image_sum/self.num_frames
+
+    @property
+    def average_correlation(self):
+        """Return the average auto correlation function."""
+        self._check_frames()
+        return correlation_from_power(self.power_sum/self.num_frames,
+                                      (self.npix, self.npix),
+                                      periodic=self.periodic)
+
+    def save(self, fname):
+        """Store the partial sums and settings to a numpy .npz file.
+
+        The data is first written to a temporary file which is then
+        renamed, such that an interrupted job never leaves a corrupted
+        checkpoint behind.
+        """
+        self._check_frames()
+        symbs = sorted(self.acf.symb_dict.keys())
+        sigma = np.nan if self.sigma is None else self.sigma
+        tmp_fname = fname + ".tmp"
+        with open(tmp_fname, "wb") as out:
+            np.savez(out, image_sum=self.image_sum, power_sum=self.power_sum,
+                     num_frames=self.num_frames, npix=self.npix,
+                     mode=self.mode, smearing=str(self.smearing), sigma=sigma,
+                     plane_normal=self.acf.plane_normal,
+                     pos_min=self.pos_min, spacing=self.spacing,
+                     symbs=np.array(symbs),
+                     weights=np.array([self.acf.symb_dict[s] for s in symbs]))
+        os.rename(tmp_fname, fname)
+
+    @staticmethod
+    def load(fname):
+        """Restore an accumulator from a file written by save."""
+        data = np.load(fname)
+        smearing = str(data["smearing"])
+        if smearing == "None":
+            smearing = None
+        sigma = float(data["sigma"])
+        if np.isnan(sigma):
+            sigma = None
+        symb_dict = {str(s): float(w) for s, w in zip(data["symbs"],
+                                                     data["weights"])}
+        acc = TrajectoryAutocorrelation(plane_normal=data["plane_normal"],
+                                        symb_dict=symb_dict,
+                                        npix=int(data["npix"]),
+                                        mode=str(data["mode"]),
+                                        smearing=smearing, sigma=sigma,
+                                        pos_min=data["pos_min"],
+                                        spacing=data["spacing"])
+        acc.num_frames = int(data["num_frames"])
+        acc._resume_skip = acc.num_frames
+        acc.image_sum = data["image_sum"]
+        acc.power_sum = data["power_sum"]
+        return acc
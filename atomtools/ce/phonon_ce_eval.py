@@ -11,13 +11,23 @@ import numpy as np
 from ase.units import kB
 from matplotlib import pyplot as plt
 from scipy.integrate import simps
-from atomtools.eos.birch_murnagan import BirschMurnagan
+from atomtools.eos.eos_families import BATCHED_EOS_FAMILIES
+from atomtools.eos.debye_gruneisen import BatchedDebyeGruneisen
+from atomtools.eos.debye_model import QuasiHarmonicDebye
+from ase.data import atomic_masses, atomic_numbers
 from ase.db import connect
 from matplotlib import pyplot as plt
 from ase.visualize import view
 
 class PhononEvalEOS( ev.Evaluate ):
-    def __init__(self, BC, phonon_dbname, cluster_names=None, select_cond=None, lamb=0.0, penalty=None ):
+    def __init__(self, BC, phonon_dbname, cluster_names=None, select_cond=None, lamb=0.0, penalty=None, vibration_model="high_temperature", eos_family="birch_murnagan" ):
+        allowed_vibration_models = ["high_temperature","debye"]
+        if ( vibration_model not in allowed_vibration_models ):
+            raise ValueError( "vibration_model has to be one of {}".format(allowed_vibration_models) )
+        if ( eos_family not in BATCHED_EOS_FAMILIES.keys() ):
+            raise ValueError( "eos_family has to be one of {}".format(list(BATCHED_EOS_FAMILIES.keys())) )
+        self.vibration_model = vibration_model
+        self.eos_family = eos_family
         self.ph_db = connect( phonon_dbname )
         self._temperature = 600
         self.volume = {}
@@ -71,16 +81,30 @@ class PhononEvalEOS( ev.Evaluate ):
         Override the function in the main class to return the Free Energy associated
         to elastic and vibrational energy
         """
-        e_dft = []
-        #for key in self.atoms_count.keys():
+        # Fit the equation of state of all groups at once
+        group_ids = []
+        volumes = []
+        energies = []
+        for key in self.gid_in_order:
+            group_ids += [key]*len(self.volume[key])
+            volumes += list(self.volume[key])
+            energies += list(self.energy[key])
+        family = BATCHED_EOS_FAMILIES[self.eos_family]
+        eos_fit = family.from_groups( group_ids, volumes, energies ).fit()
+
+        tot_mass = []
         for key in self.gid_in_order:
-            eos = BirschMurnagan( np.array(self.volume[key]), np.array(self.energy[key]) )
-            eos.set_average_mass( self.atoms_count[key] )
-            fvib_el = eos.beta_elastic_vib_free_energy( [self.temperature], natoms=self.tot_number_of_atoms[key] )
-            #V = eos.volume_temperature( [self.temperature], self.tot_number_of_atoms[key] )
-            #print (V/self.tot_number_of_atoms[key],self.tot_number_of_atoms[key])
-            #fvib_el = eos.debye_temperature(V)
-            e_dft.append(fvib_el)
+            tot_mass.append( sum( num*atomic_masses[atomic_numbers[symb]] for symb,num in self.atoms_count[key].items() ) )
+        natoms = [self.tot_number_of_atoms[key] for key in self.gid_in_order]
+        vmin = [np.min(self.volume[key]) for key in self.gid_in_order]
+        vmax = [np.max(self.volume[key]) for key in self.gid_in_order]
+
+        # Minimize the free energy of all groups at once
+        if ( self.vibration_model == "debye" ):
+            model = QuasiHarmonicDebye( eos_fit, tot_mass, natoms, vmin, vmax )
+        else:
+            model = BatchedDebyeGruneisen( eos_fit, tot_mass, natoms, vmin, vmax )
+        e_dft = model.beta_elastic_vib_free_energy( [self.temperature] )[:,0]
         self.e_dft = np.array( e_dft )
         #self.e_dft -= np.min(self.e_dft)
         return True
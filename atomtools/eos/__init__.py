@@ -1,3 +1,9 @@
 # Empty file
 from atomtools.eos.redlich_kister import RedlichKister
 from atomtools.eos.birch_murnagan import BirschMurnagan
+from atomtools.eos.batched_birch_murnagan import BatchedBirschMurnagan, BirschMurnaganFit
+from atomtools.eos.debye_gruneisen import BatchedDebyeGruneisen
+from atomtools.eos.debye_model import QuasiHarmonicDebye
+from atomtools.eos.eos_families import FiniteStrainBirchMurnaghan, PoirierTarantola, Vinet, Murnaghan
+from atomtools.eos.eos_families import BatchedFiniteStrainBirchMurnaghan, BatchedPoirierTarantola, BatchedVinet, BatchedMurnaghan
+from atomtools.eos.adaptive_volume_sampler import AdaptiveVolumeSampler
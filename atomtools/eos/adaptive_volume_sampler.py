@@ -0,0 +1,144 @@
+import numpy as np
+from ase.db import connect
+from atomtools.eos.eos_families import BatchedVinet, BatchedMurnaghan
+
+class AdaptiveVolumeSampler( object ):
+    """
+    Samples the energy-volume curve of a structure with as few single
+    point calculations as possible
+
+    After a few initial volumes, the equation of state is refitted after
+    each calculation, and the next volume is the candidate that reduces
+    the relative variance of V0, B0 and B0' the most. The sampling stops
+    when the relative standard errors of V0, B0 and B0' are below the
+    tolerance. Each point is written to the database with the groupID,
+    such that the rows can be used directly by PhononEvalEOS. If the
+    database already contains points of the group, the sampling continues
+    from them.
+
+    :param atoms: Reference structure
+    :param calc: Calculator used for the single point energies
+    :param db_name: Database where the structures are stored
+    :param group_id: groupID of the rows
+    :param family: Equation of state used for the fit (vinet or murnaghan)
+    :param volume_range: Smallest and largest volume relative to the
+        reference volume
+    :param num_candidates: Number of candidate volumes in volume_range
+    :param initial_volume_factors: Volumes (relative to the reference) that
+        are computed before the adaptive sampling starts
+    :param noise: Smallest standard deviation of the energies (eV) used
+        when the residuals are smaller (e.g. when there are no degrees
+        of freedom left)
+    """
+    def __init__( self, atoms, calc, db_name, group_id=0, family="vinet", volume_range=(0.85,1.15),
+                  num_candidates=61, initial_volume_factors=[0.94,0.97,1.0,1.03,1.06], noise=1E-4 ):
+        allowed_families = {"vinet":BatchedVinet, "murnaghan":BatchedMurnaghan}
+        if ( family not in allowed_families.keys() ):
+            raise ValueError( "family has to be one of {}".format(list(allowed_families.keys())) )
+        self.atoms = atoms
+        self.calc = calc
+        self.db_name = db_name
+        self.group_id = group_id
+        self.family = allowed_families[family]
+        self.ref_volume = atoms.get_volume()
+        self.candidates = np.linspace( volume_range[0], volume_range[1], num_candidates )
+        self.initial_volume_factors = initial_volume_factors
+        self.noise = noise
+        self.params = None
+
+        self.volumes = []
+        self.energies = []
+        db = connect( self.db_name )
+        for row in db.select( groupID=self.group_id ):
+            self.volumes.append( row.volume )
+            self.energies.append( row.energy )
+
+    @property
+    def volume_factors( self ):
+        return np.array(self.volumes)/self.ref_volume
+
+    def _is_sampled( self, factor ):
+        spacing = self.candidates[1] - self.candidates[0]
+        return np.any( np.abs(self.volume_factors-factor) < 0.5*spacing )
+
+    def compute( self, factor ):
+        """
+        Computes the energy at the given volume (relative to the reference)
+        and writes the structure to the database
+        """
+        atoms = self.atoms.copy()
+        atoms.set_cell( atoms.get_cell()*factor**(1.0/3.0), scale_atoms=True )
+        atoms.set_calculator( self.calc )
+        energy = atoms.get_potential_energy()
+
+        db = connect( self.db_name )
+        db.write( atoms, groupID=self.group_id, volume_factor=float(factor), adaptive_step=len(self.volumes) )
+        self.volumes.append( atoms.get_volume() )
+        self.energies.append( energy )
+        return energy
+
+    def fit( self ):
+        """
+        Fits the equation of state to the computed points
+
+        :return: Fitted equation of state (ReducedEOSFit), the parameters
+            E0, V0, B0, B0' and their standard errors
+        """
+        fitter = self.family( np.array(self.volumes), np.array(self.energies) )
+        initial = None
+        if ( self.params is not None ):
+            initial = self.params[None,:]
+        result = fitter.fit( initial_params=initial )
+        self.params = result.params[0]
+
+        values, jac = self.family.model_and_jacobian( result.params, fitter.volumes )
+        jac = jac[0]
+        dof = len(self.volumes) - len(self.params)
+        variance = self.noise**2
+        if ( dof > 0 ):
+            variance = max( np.sum((values[0]-self.energies)**2)/dof, variance )
+        self.inv_normal = np.linalg.pinv( jac.T.dot(jac) )
+        std = np.sqrt( variance*np.diag(self.inv_normal) )
+        return result, self.params, std
+
+    def next_volume_factor( self ):
+        """
+        Returns the candidate volume (relative to the reference) that
+        reduces the relative variance of V0, B0 and B0' the most
+
+        Adding a point with Jacobian row j reduces the covariance matrix
+        by C j^T j C/(s^2 + j C j^T).
+        """
+        volumes = self.candidates[None,:]*self.ref_volume
+        _, jac = self.family.model_and_jacobian( self.params[None,:], volumes )
+        jac = jac[0]
+        cov_j = jac.dot( self.inv_normal )
+        pred_var = np.sum( cov_j*jac, axis=1 )
+        reduction = np.sum( (cov_j[:,1:]/self.params[1:])**2, axis=1 )/(1.0 + pred_var)
+        for i,factor in enumerate(self.candidates):
+            if ( self._is_sampled(factor) ):
+                reduction[i] = -1.0
+        return self.candidates[np.argmax(reduction)]
+
+    def run( self, tol=1E-2, max_points=15 ):
+        """
+        Runs the adaptive sampling
+
+        :param tol: Largest relative standard error of V0, B0 and B0'
+        :param max_points: Maximum number of computed volumes
+
+        :return: Fitted equation of state (ReducedEOSFit), the parameters
+            E0, V0, B0, B0' and their standard errors
+        """
+        for factor in self.initial_volume_factors:
+            if ( not self._is_sampled(factor) ):
+                self.compute( factor )
+
+        result, params, std = self.fit()
+        while ( len(self.volumes) < max_points ):
+            rel_std = std[1:]/np.abs(params[1:])
+            if ( np.all(rel_std < tol) ):
+                break
+            self.compute( self.next_volume_factor() )
+            result, params, std = self.fit()
+        return result, params, std
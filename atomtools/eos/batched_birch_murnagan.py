@@ -0,0 +1,46 @@
+import numpy as np
+from atomtools.eos.batched_eos import BatchedPowerSeries, PowerSeriesFit
+
+# Powers of the volume in the Birch-Murnaghan power series
+BM_POWERS = np.array( [0.0, -1.0/3.0, -2.0/3.0, -1.0] )
+
+class BatchedBirschMurnagan( BatchedPowerSeries ):
+    """
+    Fits the Birch-Murnaghan power series
+
+    E(V) = a + b*V^(-1/3) + c*V^(-2/3) + d/V
+
+    to many groups of (volume, energy) data at once. All least squares
+    problems are solved in one vectorized (batched pseudo inverse) call.
+
+    :param volumes: Padded volumes (num_groups x max_num_points)
+    :param energies: Padded energies (num_groups x max_num_points)
+    :param mask: True for the entries that are data points. If not given
+        all entries are used
+    :param groups: Labels of the groups
+    """
+    def __init__( self, volumes, energies, mask=None, groups=None ):
+        BatchedPowerSeries.__init__( self, volumes, energies, mask=mask, groups=groups, powers=BM_POWERS )
+
+    def fit( self ):
+        """
+        Fit all groups
+
+        :return: BirschMurnaganFit with the coefficients of all groups
+        """
+        coeff = self._linear_fit( self.volumes[:,:,None]**BM_POWERS )
+        return BirschMurnaganFit( coeff, groups=self.groups, vmin=self.vmin, vmax=self.vmax )
+
+class BirschMurnaganFit( PowerSeriesFit ):
+    """
+    Array backed result of BatchedBirschMurnagan
+
+    The volumes passed to the methods have shape (num_groups,) or
+    (num_groups, K) (K volumes for each group). A scalar is used for all
+    groups.
+
+    :param coeff: Coefficients a, b, c, d of each group (num_groups x 4)
+    :param groups: Labels of the groups
+    """
+    def __init__( self, coeff, groups=None, vmin=None, vmax=None ):
+        PowerSeriesFit.__init__( self, coeff, BM_POWERS, groups=groups, vmin=vmin, vmax=vmax )
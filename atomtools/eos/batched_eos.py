@@ -0,0 +1,297 @@
+import numpy as np
+from atomtools.eos.debye_gruneisen import bracketed_newton
+
+def pad_groups( group_ids, volumes, energies ):
+    """
+    Converts ragged (group, volume, energy) arrays into padded arrays
+
+    :param group_ids: Group ID of each data point
+    :param volumes: Volume of each data point
+    :param energies: Energy of each data point
+
+    :return: groups (in order of first appearance), volumes (G x M),
+        energies (G x M) and mask (G x M) which is True for data points
+    """
+    group_ids = np.asarray(group_ids)
+    volumes = np.asarray( volumes, dtype=float )
+    energies = np.asarray( energies, dtype=float )
+    unique, first, inverse = np.unique( group_ids, return_index=True, return_inverse=True )
+
+    # Order the groups by first appearance
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    group_index = rank[inverse]
+
+    counts = np.bincount( group_index, minlength=len(unique) )
+    sort = np.argsort( group_index, kind="stable" )
+    starts = np.cumsum(counts) - counts
+    col = np.arange(len(group_index)) - np.repeat(starts,counts)
+
+    shape = (len(unique), np.max(counts))
+    V = np.ones(shape)
+    E = np.zeros(shape)
+    mask = np.zeros( shape, dtype=bool )
+    V[group_index[sort],col] = volumes[sort]
+    E[group_index[sort],col] = energies[sort]
+    mask[group_index[sort],col] = True
+    return list(unique[order]), V, E, mask
+
+def falling_factorial( x, n ):
+    """
+    Returns x*(x-1)*...*(x-n+1)
+    """
+    result = np.ones_like( np.asarray(x, dtype=float) )
+    for k in range(n):
+        result = result*(x-k)
+    return result
+
+def power_series_nth_deriv( coeff, V, n, powers ):
+    """
+    Evaluates the n-th derivative of the power series sum_k c_k V^p_k
+
+    :param coeff: Coefficients. The leading dimensions are broadcasted
+        against V and the last dimension runs over the powers
+    :param V: Volumes
+    :param n: Order of the derivative (0 gives the energy)
+    :param powers: Powers p_k
+    """
+    V = np.asarray( V, dtype=float )
+    prefactor = falling_factorial( powers, n )
+    return np.sum( coeff*prefactor*V[...,None]**(powers-n), axis=-1 )
+
+def batched_levenberg_marquardt( model, params, energies, mask, max_iter=200, tol=1E-14 ):
+    """
+    Solves many nonlinear least squares problems at once
+
+    :param model: Function returning the model values (G x M) and the
+        Jacobian with respect to the parameters (G x M x P) for
+        parameters of shape (G x P)
+    :param params: Initial parameters (G x P)
+    :param energies: Data (G x M)
+    :param mask: True for the entries that are data points (G x M)
+    :param max_iter: Maximum number of iterations
+    :param tol: Relative change in the sum of squared residuals where the
+        iterations are stopped
+
+    :return: Parameters (G x P) and the sum of squared residuals (G)
+    """
+    params = np.array( params, dtype=float )
+    num_params = params.shape[1]
+
+    def cost_and_grad( p ):
+        with np.errstate( all="ignore" ):
+            values, jac = model(p)
+        res = np.where( mask, values-energies, 0.0 )
+        jac = jac*mask[:,:,None]
+        cost = np.sum( res**2, axis=1 )
+        cost[~np.isfinite(cost)] = np.inf
+        return cost, res, jac
+
+    cost, res, jac = cost_and_grad( params )
+    damping = np.full( params.shape[0], 1E-3 )
+    for _ in range(max_iter):
+        normal = np.einsum( "gmi,gmj->gij", jac, jac )
+        grad = np.einsum( "gmi,gm->gi", jac, res )
+        diag = np.einsum( "gii->gi", normal )
+        lhs = normal + (damping[:,None]*np.maximum(diag,1E-300))[:,:,None]*np.identity(num_params)
+        step = -np.linalg.solve( lhs, grad[:,:,None] )[:,:,0]
+
+        trial = params + step
+        new_cost, new_res, new_jac = cost_and_grad( trial )
+        accept = new_cost < cost
+        converged = accept & ( cost-new_cost <= tol*cost )
+        converged |= cost == 0.0
+
+        params = np.where( accept[:,None], trial, params )
+        res = np.where( accept[:,None], new_res, res )
+        jac = np.where( accept[:,None,None], new_jac, jac )
+        cost = np.where( accept, new_cost, cost )
+        damping = np.where( accept, damping/10.0, damping*10.0 )
+        converged |= damping > 1E20
+        if ( np.all(converged) ):
+            break
+    return params, cost
+
+class BatchedEOS( object ):
+    """
+    Base class for equations of state fitted to many groups of
+    (volume, energy) data at once. Derived classes implement fit.
+
+    :param volumes: Padded volumes (num_groups x max_num_points)
+    :param energies: Padded energies (num_groups x max_num_points)
+    :param mask: True for the entries that are data points. If not given
+        all entries are used
+    :param groups: Labels of the groups
+    """
+    def __init__( self, volumes, energies, mask=None, groups=None ):
+        self.volumes = np.atleast_2d( np.array(volumes, dtype=float) )
+        self.energies = np.atleast_2d( np.array(energies, dtype=float) )
+        if ( mask is None ):
+            mask = np.ones( self.volumes.shape, dtype=bool )
+        self.mask = np.asarray(mask, dtype=bool)
+        if ( groups is None ):
+            groups = list(range(self.volumes.shape[0]))
+        self.groups = groups
+
+        # Padded entries get a finite volume, they are removed from the fit by the mask
+        self.volumes[~self.mask] = 1.0
+
+    @classmethod
+    def from_groups( cls, group_ids, volumes, energies, **kwargs ):
+        """
+        Construct from ragged arrays where each data point has a group ID
+        """
+        groups, V, E, mask = pad_groups( group_ids, volumes, energies )
+        return cls( V, E, mask=mask, groups=groups, **kwargs )
+
+    @property
+    def vmin( self ):
+        return np.min( np.where(self.mask, self.volumes, np.inf), axis=1 )
+
+    @property
+    def vmax( self ):
+        return np.max( np.where(self.mask, self.volumes, -np.inf), axis=1 )
+
+    def _linear_fit( self, design ):
+        """
+        Solves the linear least squares problems of all groups
+
+        :param design: Design matrices (num_groups x max_num_points x num_coeff)
+        """
+        design = design*self.mask[:,:,None]
+        energies = self.energies*self.mask
+        return np.einsum( "gpm,gm->gp", np.linalg.pinv(design), energies )
+
+    def fit( self ):
+        raise NotImplementedError( "Fit has to be implemented in derived classes" )
+
+class BatchedEOSResult( object ):
+    """
+    Base class for fitted equations of state of many groups
+
+    The volumes passed to the methods have the group as first dimension,
+    e.g. shape (num_groups,) or (num_groups, K) (K volumes for each
+    group). A scalar is used for all groups. Derived classes implement
+    nth_deriv.
+
+    :param groups: Labels of the groups
+    :param vmin: Smallest volume in the data of each group
+    :param vmax: Largest volume in the data of each group
+    """
+    def __init__( self, groups, vmin=None, vmax=None ):
+        self.groups = groups
+        self.vmin = vmin
+        self.vmax = vmax
+
+    @property
+    def num_groups( self ):
+        return len(self.groups)
+
+    def _broadcast( self, V ):
+        V = np.asarray( V, dtype=float )
+        if ( V.ndim == 0 ):
+            V = np.full( self.num_groups, float(V) )
+        if ( V.shape[0] != self.num_groups ):
+            msg = "The first dimension of the volumes has to match the "
+            msg += "number of groups ({}). Given: {}".format(self.num_groups, V.shape[0])
+            raise ValueError( msg )
+        return V
+
+    def _per_group( self, values, V ):
+        """
+        Reshapes arrays with the group as first dimension such that they broadcast against V
+        """
+        values = np.asarray(values)
+        return values.reshape( values.shape[:1] + (1,)*(np.ndim(V)-1) + values.shape[1:] )
+
+    def nth_deriv( self, V, n ):
+        raise NotImplementedError( "nth_deriv has to be implemented in derived classes" )
+
+    def evaluate( self, V ):
+        """
+        Evaluates the energy of all groups
+        """
+        return self.nth_deriv( V, 0 )
+
+    def deriv( self, V ):
+        """
+        Evaluates the derivative with respect to volume
+        """
+        return self.nth_deriv( V, 1 )
+
+    def double_deriv( self, V ):
+        """
+        Evaluates the double derivative with respect to volume
+        """
+        return self.nth_deriv( V, 2 )
+
+    def bulk_modulus( self, V ):
+        """
+        Computes the bulk modulus V*E''(V)
+        """
+        V = self._broadcast(V)
+        return V*self.double_deriv(V)
+
+    def equilibrium_parameters( self ):
+        """
+        Returns the minimum energy E0, the equilibrium volume V0, the bulk
+        modulus B0 and its pressure derivative B0' of each group
+
+        V0 is the root of E' in the range of the data, B0 = V0*E''(V0) and
+        B0' = -1 - V0*E'''(V0)/E''(V0)
+        """
+        if ( self.vmin is None or self.vmax is None ):
+            raise ValueError( "The volume range of the data is needed to locate the minimum" )
+
+        def func( V ):
+            return self.deriv(V), self.double_deriv(V)
+        V0 = bracketed_newton( func, self.vmin, self.vmax )
+        d2 = self.double_deriv(V0)
+        B0 = V0*d2
+        Bp = -1.0 - V0*self.nth_deriv(V0,3)/d2
+        return self.evaluate(V0), V0, B0, Bp
+
+class BatchedPowerSeries( BatchedEOS ):
+    """
+    Fits the power series E(V) = sum_k c_k V^p_k to many groups at once.
+    The coefficients enter linearly, hence all groups are solved with one
+    batched pseudo inverse.
+
+    :param powers: Powers p_k
+    """
+    def __init__( self, volumes, energies, mask=None, groups=None, powers=None ):
+        BatchedEOS.__init__( self, volumes, energies, mask=mask, groups=groups )
+        if ( powers is None ):
+            raise ValueError( "The powers of the series have to be given" )
+        self.powers = np.asarray( powers, dtype=float )
+
+    def fit( self ):
+        """
+        Fit all groups
+
+        :return: PowerSeriesFit with the coefficients of all groups
+        """
+        coeff = self._linear_fit( self.volumes[:,:,None]**self.powers )
+        return PowerSeriesFit( coeff, self.powers, groups=self.groups, vmin=self.vmin, vmax=self.vmax )
+
+class PowerSeriesFit( BatchedEOSResult ):
+    """
+    Array backed result of BatchedPowerSeries
+
+    :param coeff: Coefficients of each group (num_groups x num_powers)
+    :param powers: Powers of the series
+    """
+    def __init__( self, coeff, powers, groups=None, vmin=None, vmax=None ):
+        self.coeff = np.atleast_2d(coeff)
+        self.powers = np.asarray( powers, dtype=float )
+        if ( groups is None ):
+            groups = list(range(self.coeff.shape[0]))
+        BatchedEOSResult.__init__( self, groups, vmin=vmin, vmax=vmax )
+
+    def nth_deriv( self, V, n ):
+        """
+        Evaluates the n-th derivative with respect to volume
+        """
+        V = self._broadcast(V)
+        return power_series_nth_deriv( self._per_group(self.coeff,V), V, n, self.powers )
@@ -1,5 +1,7 @@
 from atomtools.eos.equation_of_state import EquationOfState
 import numpy as np
+from atomtools.eos.batched_eos import power_series_nth_deriv
+from atomtools.eos.batched_birch_murnagan import BM_POWERS
 
 class BirschMurnagan( EquationOfState ):
     def __init__( self, volume, energy ):
@@ -42,7 +44,7 @@ class BirschMurnagan( EquationOfState ):
         """
         if ( self.perform_fit() ):
             self.fit()
-        return -(self.b/3.0)*V**(-4.0/3.0) - (2.0*self.c/3.0)*V**(-5.0/3.0) - d*V**(-2.0)
+        return -(self.b/3.0)*V**(-4.0/3.0) - (2.0*self.c/3.0)*V**(-5.0/3.0) - self.d*V**(-2.0)
 
     def double_deriv( self, V ):
         """
@@ -51,3 +53,12 @@ class BirschMurnagan( EquationOfState ):
         if ( self.perform_fit() ):
             self.fit()
         return (4.0*self.b/9.0)*V**(-7.0/3.0) + (10.0*self.c/9.0)*V**(-8.0/3.0) + 2.0*self.d*V**(-3.0)
+
+    def nth_deriv( self, V, n ):
+        """
+        Evaluates the n-th derivative with respect to volume
+        """
+        if ( self.perform_fit() ):
+            self.fit()
+        coeff = np.array( [self.a, self.b, self.c, self.d] )
+        return power_series_nth_deriv( coeff, V, n, BM_POWERS )
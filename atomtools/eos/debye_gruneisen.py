@@ -0,0 +1,212 @@
+import numpy as np
+from ase.units import kB, kg, _hbar, J
+
+def debye_frequency( bulk_mod, V, tot_mass, natoms, debye_scheme="mjs" ):
+    """
+    Compute the Debye frequency (in eV) assuming isotropic speed of sound
+
+    :param bulk_mod: Bulk modulus in eV/angstrom^3
+    :param V: Volume in angstrom^3
+    :param tot_mass: Total mass of the atoms in the volume (ASE units)
+    :param natoms: Number of atoms in the volume
+    :param debye_scheme: none or mjs
+    """
+    rho = tot_mass/V
+    rho /= kg # Unit of rho is now kg/(angstrom^3)
+    B = bulk_mod/J # J/angstrom^3
+    v_sound = np.sqrt(B/rho)
+    number_density = natoms/V
+    omega_D = (6.0*np.pi**2 *number_density)**(1.0/3.0) * v_sound*1E10 # Unit of omega_D: rad/s
+    omega_D *= _hbar*J
+
+    if ( debye_scheme == "none" ):
+        return omega_D # In eV
+    elif ( debye_scheme == "mjs" ):
+        # See: Moruzzi, V.; Janak, J. & Schwarz, K. Calculated thermal properties of metals Physical Review B, APS, 1988, 37, 790
+        return 0.617*omega_D
+    raise ValueError( "Unknown debye scheme!" )
+
+def free_energy_deriv( eos, V, T, natoms=1 ):
+    """
+    Derivative of the free energy per atom with respect to volume
+
+    The Debye frequency scales as V^(2/3)*sqrt(E''), hence
+
+    dF/dV = E'/natoms + 3kT*( 2/(3V) + E'''/(2E'') )
+
+    :param eos: Equation of state with the method nth_deriv
+    :param V: Volumes
+    :param T: Temperatures (broadcasted against V)
+    :param natoms: Number of atoms (broadcasted against V)
+    """
+    d1 = eos.nth_deriv( V, 1 )
+    d2 = eos.nth_deriv( V, 2 )
+    d3 = eos.nth_deriv( V, 3 )
+    return d1/natoms + 3.0*kB*T*( 2.0/(3.0*V) + d3/(2.0*d2) )
+
+def free_energy_double_deriv( eos, V, T, natoms=1 ):
+    """
+    Second derivative of the free energy per atom with respect to volume
+    """
+    d2 = eos.nth_deriv( V, 2 )
+    d3 = eos.nth_deriv( V, 3 )
+    d4 = eos.nth_deriv( V, 4 )
+    return d2/natoms + 3.0*kB*T*( -2.0/(3.0*V**2) + d4/(2.0*d2) - d3**2/(2.0*d2**2) )
+
+def bracketed_newton( func, lower, upper, tol=1E-10, max_iter=100 ):
+    """
+    Finds the roots of many increasing functions at once
+
+    Newton iterations are safeguarded by a bracket. Whenever a Newton step
+    leaves the bracket, it is replaced by a bisection step. If the function
+    does not change sign in [lower, upper] the root is set to the
+    boundary closest to it. NaN values are treated as being above the
+    root.
+
+    :param func: Function returning the value and the derivative at an
+        array of points
+    :param lower: Lower bounds
+    :param upper: Upper bounds (same shape as lower)
+    :param tol: Relative tolerance
+    :param max_iter: Maximum number of iterations
+    """
+    lower = np.array( lower, dtype=float )
+    upper = np.array( upper, dtype=float )
+    with np.errstate( divide="ignore", invalid="ignore", over="ignore" ):
+        increasing = ~(func(lower)[0] < 0.0)
+        decreasing = func(upper)[0] < 0.0
+
+        x = 0.5*(lower+upper)
+        for _ in range(max_iter):
+            f, df = func(x)
+            below = f < 0.0
+            lower = np.where( below, x, lower )
+            upper = np.where( below, upper, x )
+
+            x_new = x - f/df
+            inside = (x_new > lower) & (x_new < upper) & (df > 0.0)
+            x_new = np.where( inside, x_new, 0.5*(lower+upper) )
+            converged = np.abs(x_new-x) < tol*np.abs(x)
+            x = x_new
+            if ( np.all(converged) ):
+                break
+
+    x = np.where( decreasing, upper, x )
+    x = np.where( increasing, lower, x )
+    return x
+
+def equilibrium_volume( eos, T, vmin, vmax, natoms=1, tol=1E-10, max_iter=100 ):
+    """
+    Minimizes the free energy with respect to volume for all temperatures
+    (and all groups) at once
+
+    The root of dF/dV is found with bracketed_newton. If dF/dV does not
+    change sign in [vmin, vmax] the minimum is at one of the boundaries.
+    Volumes where E'' <= 0 (the Debye model is not defined) are treated
+    as being above the minimum.
+
+    :param eos: Equation of state with the method nth_deriv. For a
+        batched equation of state (e.g. BirschMurnaganFit) the volumes
+        have shape (num_groups, num_temperatures)
+    :param T: Temperatures, shape (num_temperatures,). T = 0 gives the
+        minimum of the energy
+    :param vmin: Lower bound of the volume, shape (num_groups,)
+    :param vmax: Upper bound of the volume, shape (num_groups,)
+    :param natoms: Number of atoms, scalar or shape (num_groups,)
+    :param tol: Relative tolerance of the volume
+    :param max_iter: Maximum number of iterations
+
+    :return: Volumes of shape (num_groups, num_temperatures)
+    """
+    T = np.atleast_1d( np.asarray(T, dtype=float) )[None,:]
+    natoms = np.atleast_1d( np.asarray(natoms, dtype=float) )[:,None]
+    lower, upper = volume_bracket( vmin, vmax, T.shape[1] )
+
+    def func( V ):
+        return free_energy_deriv( eos, V, T, natoms ), free_energy_double_deriv( eos, V, T, natoms )
+    return bracketed_newton( func, lower, upper, tol=tol, max_iter=max_iter )
+
+def volume_bracket( vmin, vmax, num_temperatures ):
+    """
+    Broadcasts the volume bounds of each group to (num_groups, num_temperatures)
+    """
+    vmin = np.atleast_1d( np.asarray(vmin, dtype=float) )
+    vmax = np.atleast_1d( np.asarray(vmax, dtype=float) )
+    shape = (len(vmin), num_temperatures)
+    return np.broadcast_to( vmin[:,None], shape ), np.broadcast_to( vmax[:,None], shape )
+
+class BatchedDebyeGruneisen( object ):
+    """
+    Debye-Gruneisen model (high temperature limit) for many groups at once
+
+    F(V,T) = E(V)/natoms + kT*( 3*ln(hbar*omega_D/kT) - 1 )
+
+    :param eos: Fitted batched equation of state (e.g. BirschMurnaganFit)
+    :param tot_mass: Total mass of the atoms in each group (num_groups,)
+    :param natoms: Number of atoms in each group (num_groups,)
+    :param vmin: Lower bound of the volume in each group (num_groups,)
+    :param vmax: Upper bound of the volume in each group (num_groups,)
+    :param debye_scheme: none or mjs
+    """
+    def __init__( self, eos, tot_mass, natoms, vmin, vmax, debye_scheme="mjs" ):
+        allowed_debye_schemes = ["none","mjs"]
+        if ( debye_scheme not in allowed_debye_schemes ):
+            raise ValueError( "Debye Scheme has to be one of {}".format(allowed_debye_schemes) )
+        self.eos = eos
+        self.tot_mass = np.asarray( tot_mass, dtype=float )
+        self.natoms = np.asarray( natoms, dtype=float )
+        self.vmin = np.asarray( vmin, dtype=float )
+        self.vmax = np.asarray( vmax, dtype=float )
+        self.debye_scheme = debye_scheme
+
+    def _per_group( self, values, V ):
+        """
+        Reshapes an array with one value per group such that it broadcasts against V
+        """
+        return values.reshape( (len(values),) + (1,)*(np.ndim(V)-1) )
+
+    def debye_frequency( self, V ):
+        """
+        Debye frequency in eV. The first dimension of V is the group
+        """
+        V = np.asarray( V, dtype=float )
+        B = np.maximum( V*self.eos.double_deriv(V), 0.0 )
+        tot_mass = self._per_group( self.tot_mass, V )
+        natoms = self._per_group( self.natoms, V )
+        return debye_frequency( B, V, tot_mass, natoms, debye_scheme=self.debye_scheme )
+
+    def free_energy( self, V, T ):
+        """
+        Free energy per atom. The first dimension of V is the group and
+        T is broadcasted against V (e.g. V of shape (num_groups, num_temperatures)
+        and T of shape (num_temperatures,))
+        """
+        V = np.asarray( V, dtype=float )
+        T = np.asarray( T, dtype=float )
+        debye = self.debye_frequency(V)
+        natoms = self._per_group( self.natoms, V )
+        return self.eos.evaluate(V)/natoms + kB*T*( 3.0*np.log(debye/(kB*T)) - 1.0 )
+
+    def volume_temperature( self, T ):
+        """
+        Equilibrium volumes of shape (num_groups, num_temperatures)
+        """
+        return equilibrium_volume( self.eos, T, self.vmin, self.vmax, natoms=self.natoms )
+
+    def minimum_energy( self ):
+        """
+        Minimum energy and the corresponding volume of each group
+        """
+        V0 = equilibrium_volume( self.eos, [0.0], self.vmin, self.vmax )[:,0]
+        return self.eos.evaluate(V0), V0
+
+    def beta_elastic_vib_free_energy( self, T, vol_curve=None ):
+        """
+        Elastic + vibrational free energy per atom relative to the minimum
+        energy, divided by kT. Shape (num_groups, num_temperatures)
+        """
+        T = np.atleast_1d( np.asarray(T, dtype=float) )
+        if ( vol_curve is None ):
+            vol_curve = self.volume_temperature(T)
+        Emin = self.minimum_energy()[0][:,None]/self.natoms[:,None]
+        return ( self.free_energy(vol_curve, T) - Emin )/(kB*T[None,:])
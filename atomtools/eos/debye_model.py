@@ -0,0 +1,190 @@
+import numpy as np
+from scipy.integrate import quad
+from scipy.interpolate import CubicSpline
+from ase.units import kB
+from atomtools.eos.debye_gruneisen import BatchedDebyeGruneisen, bracketed_newton, volume_bracket
+
+# The Debye function is tabulated on [0, DEBYE_TABLE_MAX], above the
+# asymptotic expansion is used (the error is of order exp(-2x))
+DEBYE_TABLE_MAX = 20.0
+DEBYE_TABLE_SIZE = 2001
+
+_debye_spline = None
+
+def _debye_integrand( t ):
+    if ( t == 0.0 ):
+        return 0.0
+    return t**3/np.expm1(t)
+
+def _get_debye_spline():
+    """
+    Returns the spline of the tabulated Debye function (computed on first call)
+    """
+    global _debye_spline
+    if ( _debye_spline is None ):
+        x = np.linspace( 0.0, DEBYE_TABLE_MAX, DEBYE_TABLE_SIZE )
+        D = np.ones_like(x)
+        for i in range(1,len(x)):
+            D[i] = 3.0*quad( _debye_integrand, 0.0, x[i], epsabs=0.0, epsrel=1E-13 )[0]/x[i]**3
+        _debye_spline = CubicSpline( x, D, bc_type=((1,-3.0/8.0),"not-a-knot") )
+    return _debye_spline
+
+def debye_function( x ):
+    """
+    Third order Debye function
+
+    D(x) = 3/x^3 int_0^x t^3/(exp(t) - 1) dt
+
+    Interpolated from a table for x <= DEBYE_TABLE_MAX, and evaluated from
+    the asymptotic expansion
+
+    D(x) = pi^4/(5x^3) - 3*exp(-x)*(1 + 3/x + 6/x^2 + 6/x^3)
+
+    above.
+    """
+    x = np.asarray( x, dtype=float )
+    large = x > DEBYE_TABLE_MAX
+    x_large = np.where( large, x, DEBYE_TABLE_MAX )
+    asymptotic = np.pi**4/(5.0*x_large**3) - 3.0*np.exp(-x_large)*( 1.0 + 3.0/x_large + 6.0/x_large**2 + 6.0/x_large**3 )
+    return np.where( large, asymptotic, _get_debye_spline()(np.minimum(x,DEBYE_TABLE_MAX)) )
+
+def debye_function_deriv( x ):
+    """
+    Derivative of the Debye function, D'(x) = 3/(exp(x) - 1) - 3D(x)/x
+    """
+    x = np.asarray( x, dtype=float )
+    small = x < 1E-3
+    x_safe = np.where( small, 1.0, x )
+    deriv = 3.0/np.expm1(x_safe) - 3.0*debye_function(x_safe)/x_safe
+    return np.where( small, -3.0/8.0 + x/10.0, deriv )
+
+class QuasiHarmonicDebye( BatchedDebyeGruneisen ):
+    """
+    Quasi-harmonic Debye model for many groups at once
+
+    The vibrational free energy per atom is
+
+    F_vib = 9/8*k*theta + kT*( 3*ln(1 - exp(-theta/T)) - D(theta/T) )
+
+    where D is the Debye function and theta(V) is the Debye temperature
+    obtained from the bulk modulus of the equation of state. In contrast
+    to BatchedDebyeGruneisen the free energy is valid at all temperatures.
+
+    All quantities take volumes with the group as first dimension and
+    temperatures that are broadcasted against them. For instance, V of
+    shape (num_groups, num_volumes, 1) and T of shape (num_temperatures,)
+    give the quantities on a (V, T) grid for each group.
+
+    :param eos: Fitted batched equation of state (e.g. BirschMurnaganFit)
+    :param tot_mass: Total mass of the atoms in each group (num_groups,)
+    :param natoms: Number of atoms in each group (num_groups,)
+    :param vmin: Lower bound of the volume in each group (num_groups,)
+    :param vmax: Upper bound of the volume in each group (num_groups,)
+    :param debye_scheme: none or mjs
+    """
+    def _reduced_temperature( self, V, T ):
+        """
+        Returns the Debye energy (hbar*omega_D) and x = theta/T
+        """
+        hw = self.debye_frequency(V)
+        with np.errstate( divide="ignore" ):
+            x = hw/(kB*np.asarray(T, dtype=float))
+        return hw, x
+
+    def vibrational_free_energy( self, V, T ):
+        """
+        Vibrational free energy per atom
+        """
+        T = np.asarray( T, dtype=float )
+        hw, x = self._reduced_temperature( V, T )
+        return 9.0*hw/8.0 + kB*T*( 3.0*np.log(-np.expm1(-x)) - debye_function(x) )
+
+    def free_energy( self, V, T ):
+        """
+        Elastic + vibrational free energy per atom
+        """
+        V = np.asarray( V, dtype=float )
+        natoms = self._per_group( self.natoms, V )
+        return self.eos.evaluate(V)/natoms + self.vibrational_free_energy( V, T )
+
+    def vibrational_energy( self, V, T ):
+        """
+        Vibrational internal energy per atom
+        """
+        T = np.asarray( T, dtype=float )
+        hw, x = self._reduced_temperature( V, T )
+        return 9.0*hw/8.0 + 3.0*kB*T*debye_function(x)
+
+    def entropy( self, V, T ):
+        """
+        Vibrational entropy per atom (eV/K)
+        """
+        _, x = self._reduced_temperature( V, T )
+        return kB*( 4.0*debye_function(x) - 3.0*np.log(-np.expm1(-x)) )
+
+    def heat_capacity( self, V, T ):
+        """
+        Heat capacity at constant volume per atom (eV/K)
+        """
+        _, x = self._reduced_temperature( V, T )
+        x_safe = np.where( np.isinf(x), 1.0, x )
+        einstein = np.where( np.isinf(x), 0.0, x_safe*np.exp(-x_safe)/(-np.expm1(-x_safe)) )
+        return 3.0*kB*( 4.0*debye_function(x) - 3.0*einstein )
+
+    def _gruneisen_term( self, V ):
+        """
+        Returns d ln(theta)/dV = 2/(3V) + E'''/(2E'') and its derivative
+        """
+        d2 = self.eos.nth_deriv( V, 2 )
+        d3 = self.eos.nth_deriv( V, 3 )
+        d4 = self.eos.nth_deriv( V, 4 )
+        g = 2.0/(3.0*V) + d3/(2.0*d2)
+        dg = -2.0/(3.0*V**2) + d4/(2.0*d2) - d3**2/(2.0*d2**2)
+        return g, dg
+
+    def free_energy_deriv( self, V, T ):
+        """
+        Derivative of the free energy per atom with respect to volume
+
+        dF/dV = E'/natoms + E_vib*d ln(theta)/dV
+        """
+        V = np.asarray( V, dtype=float )
+        natoms = self._per_group( self.natoms, V )
+        g, _ = self._gruneisen_term(V)
+        return self.eos.deriv(V)/natoms + self.vibrational_energy( V, T )*g
+
+    def free_energy_double_deriv( self, V, T ):
+        """
+        Second derivative of the free energy per atom with respect to volume
+        """
+        V = np.asarray( V, dtype=float )
+        natoms = self._per_group( self.natoms, V )
+        g, dg = self._gruneisen_term(V)
+        hw, x = self._reduced_temperature( V, T )
+        dE_vib_dhw = 9.0/8.0 + 3.0*debye_function_deriv(x)
+        return self.eos.double_deriv(V)/natoms + self.vibrational_energy( V, T )*dg + dE_vib_dhw*hw*g**2
+
+    def volume_temperature( self, T, tol=1E-10, max_iter=100 ):
+        """
+        Equilibrium volumes of shape (num_groups, num_temperatures)
+        """
+        T = np.atleast_1d( np.asarray(T, dtype=float) )
+        lower, upper = volume_bracket( self.vmin, self.vmax, len(T) )
+
+        def func( V ):
+            return self.free_energy_deriv( V, T ), self.free_energy_double_deriv( V, T )
+        return bracketed_newton( func, lower, upper, tol=tol, max_iter=max_iter )
+
+    def thermal_expansion( self, T, vol_curve=None ):
+        """
+        Volumetric thermal expansion coefficient (1/K) along the equilibrium
+        volume curve, shape (num_groups, num_temperatures)
+
+        alpha = -(d^2F/dVdT)/(V*d^2F/dV^2) where d^2F/dVdT = Cv*d ln(theta)/dV
+        """
+        T = np.atleast_1d( np.asarray(T, dtype=float) )
+        if ( vol_curve is None ):
+            vol_curve = self.volume_temperature(T)
+        g, _ = self._gruneisen_term(vol_curve)
+        cross = self.heat_capacity( vol_curve, T )*g
+        return -cross/( vol_curve*self.free_energy_double_deriv(vol_curve, T) )
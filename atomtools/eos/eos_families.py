@@ -0,0 +1,307 @@
+import numpy as np
+from atomtools.eos.equation_of_state import EquationOfState
+from atomtools.eos.batched_eos import BatchedEOS, BatchedEOSResult, BatchedPowerSeries
+from atomtools.eos.batched_eos import batched_levenberg_marquardt, falling_factorial
+from atomtools.eos.batched_birch_murnagan import BatchedBirschMurnagan
+
+class BatchedFiniteStrainBirchMurnaghan( BatchedPowerSeries ):
+    """
+    Birch-Murnaghan equation of state of arbitrary order
+
+    The energy is a polynomial of the given order in the Eulerian strain
+    f = ((V0/V)^(2/3) - 1)/2, which is the same as
+
+    E(V) = sum_{k=0}^{order} c_k V^(-2k/3)
+
+    Hence, the coefficients are fitted linearly for all groups at once.
+    order=3 gives the standard third order Birch-Murnaghan equation.
+
+    :param order: Order of the polynomial in the strain
+    """
+    def __init__( self, volumes, energies, mask=None, groups=None, order=3 ):
+        powers = -2.0*np.arange(order+1)/3.0
+        BatchedPowerSeries.__init__( self, volumes, energies, mask=mask, groups=groups, powers=powers )
+
+class BatchedPoirierTarantola( BatchedEOS ):
+    """
+    Poirier-Tarantola (logarithmic) equation of state of arbitrary order
+
+    E(V) = sum_{k=0}^{order} c_k ln(V)^k
+
+    which is a polynomial in the Hencky strain ln(V/V0). order=3 gives the
+    standard third order Poirier-Tarantola equation.
+
+    :param order: Order of the polynomial in the strain
+    """
+    def __init__( self, volumes, energies, mask=None, groups=None, order=3 ):
+        BatchedEOS.__init__( self, volumes, energies, mask=mask, groups=groups )
+        self.order = order
+
+    def fit( self ):
+        """
+        Fit all groups
+
+        :return: LogPolynomialFit with the coefficients of all groups
+        """
+        design = np.log(self.volumes)[:,:,None]**np.arange(self.order+1)
+        coeff = self._linear_fit( design )
+        return LogPolynomialFit( coeff, groups=self.groups, vmin=self.vmin, vmax=self.vmax )
+
+class LogPolynomialFit( BatchedEOSResult ):
+    """
+    Array backed result of BatchedPoirierTarantola
+
+    :param coeff: Coefficients of the polynomial in ln(V) in increasing
+        order (num_groups x (order+1))
+    """
+    def __init__( self, coeff, groups=None, vmin=None, vmax=None ):
+        self.coeff = np.atleast_2d(coeff)
+        if ( groups is None ):
+            groups = list(range(self.coeff.shape[0]))
+        BatchedEOSResult.__init__( self, groups, vmin=vmin, vmax=vmax )
+
+    def nth_deriv( self, V, n ):
+        """
+        Evaluates the n-th derivative with respect to volume
+
+        The n-th derivative of p(ln V) is V^(-n)*q_n(ln V) with
+        q_0 = p and q_{m+1} = q_m' - m*q_m
+        """
+        V = self._broadcast(V)
+        q = self.coeff
+        degree = np.arange(q.shape[1])
+        for m in range(n):
+            dq = np.zeros_like(q)
+            dq[:,:-1] = q[:,1:]*degree[1:]
+            q = dq - m*q
+        q = self._per_group( q, V )
+        return np.sum( q*np.log(V)[...,None]**degree, axis=-1 )/V**n
+
+class BatchedReducedEOS( BatchedEOS ):
+    """
+    Base class for equations of state of the form
+
+    E(V) = E0 + B0*V0*phi(V/V0, B0')
+
+    where phi is a dimensionless function. The parameters are nonlinear,
+    hence they are fitted by Levenberg-Marquardt iterations that are
+    batched across the groups. The Jacobian is given in closed form
+
+    dE/dE0 = 1, dE/dV0 = B0*(phi - y*phi'), dE/dB0 = V0*phi,
+    dE/dB0' = B0*V0*dphi/dB0'
+
+    where y = V/V0. Derived classes implement phi (and its derivatives
+    with respect to y) and phi_bp_deriv.
+    """
+    @staticmethod
+    def phi( y, bp, n ):
+        raise NotImplementedError( "phi has to be implemented in derived classes" )
+
+    @staticmethod
+    def phi_bp_deriv( y, bp ):
+        raise NotImplementedError( "phi_bp_deriv has to be implemented in derived classes" )
+
+    def _initial_guess( self ):
+        """
+        Initial parameters from a quadratic fit of each group
+        """
+        quad = self._linear_fit( self.volumes[:,:,None]**np.arange(3) )
+        E_data = np.where( self.mask, self.energies, np.inf )
+        V_lowest = self.volumes[np.arange(len(self.volumes)),np.argmin(E_data,axis=1)]
+        curved = quad[:,2] > 0.0
+        with np.errstate( divide="ignore", invalid="ignore" ):
+            V0 = np.where( curved, -0.5*quad[:,1]/quad[:,2], V_lowest )
+        V0 = np.clip( V0, self.vmin, self.vmax )
+        B0 = np.where( curved, 2.0*quad[:,2]*V0, 0.1 )
+        E0 = quad[:,0] + quad[:,1]*V0 + quad[:,2]*V0**2
+        return np.column_stack( (E0, V0, B0, np.full(len(V0), 4.0)) )
+
+    @classmethod
+    def model_and_jacobian( cls, params, volumes ):
+        """
+        Returns the energies and the Jacobian with respect to the parameters
+
+        :param params: E0, V0, B0 and B0' of each group (num_groups x 4)
+        :param volumes: Volumes (num_groups x num_volumes)
+        """
+        E0, V0, B0, bp = [params[:,i,None] for i in range(4)]
+        y = volumes/V0
+        phi = cls.phi( y, bp, 0 )
+        dphi = cls.phi( y, bp, 1 )
+        values = E0 + B0*V0*phi
+        jac = np.stack( (np.ones_like(y), B0*(phi - y*dphi), V0*phi, B0*V0*cls.phi_bp_deriv(y,bp)), axis=-1 )
+        return values, jac
+
+    def _model( self, params ):
+        return self.model_and_jacobian( params, self.volumes )
+
+    def fit( self, max_iter=200, initial_params=None ):
+        """
+        Fit all groups
+
+        :param max_iter: Maximum number of Levenberg-Marquardt iterations
+        :param initial_params: Initial E0, V0, B0 and B0' of each group. If
+            not given, they are estimated from a quadratic fit
+
+        :return: ReducedEOSFit with E0, V0, B0 and B0' of all groups
+        """
+        if ( initial_params is None ):
+            initial_params = self._initial_guess()
+        params, rss = batched_levenberg_marquardt( self._model, initial_params, self.energies, self.mask, max_iter=max_iter )
+        return ReducedEOSFit( params, type(self), groups=self.groups, vmin=self.vmin, vmax=self.vmax )
+
+class ReducedEOSFit( BatchedEOSResult ):
+    """
+    Array backed result of BatchedReducedEOS
+
+    :param params: E0, V0, B0 and B0' of each group (num_groups x 4)
+    :param family: Class implementing phi (e.g. BatchedVinet)
+    """
+    def __init__( self, params, family, groups=None, vmin=None, vmax=None ):
+        self.params = np.atleast_2d(params)
+        self.family = family
+        if ( groups is None ):
+            groups = list(range(self.params.shape[0]))
+        BatchedEOSResult.__init__( self, groups, vmin=vmin, vmax=vmax )
+
+    def nth_deriv( self, V, n ):
+        """
+        Evaluates the n-th derivative with respect to volume,
+        B0*V0^(1-n)*phi^(n)(V/V0)
+        """
+        V = self._broadcast(V)
+        E0, V0, B0, bp = [self._per_group(self.params[:,i],V) for i in range(4)]
+        value = B0*V0**(1-n)*self.family.phi( V/V0, bp, n )
+        if ( n == 0 ):
+            value = value + E0
+        return value
+
+    def equilibrium_parameters( self ):
+        """
+        Returns E0, V0, B0 and B0' of each group
+        """
+        return tuple( self.params[:,i] for i in range(4) )
+
+class BatchedVinet( BatchedReducedEOS ):
+    """
+    Vinet equation of state
+
+    phi(y) = 2/(B0'-1)^2*( 2 - (5 + 3B0'(x-1) - 3x)*exp(-eta(x-1)) )
+
+    where x = y^(1/3) and eta = 3(B0'-1)/2
+    """
+    @staticmethod
+    def phi( y, bp, n ):
+        x = y**(1.0/3.0)
+        q = bp-1.0
+        eta = 1.5*q
+        if ( n == 0 ):
+            return 2.0/q**2*( 2.0 - (2.0 + 3.0*q*(x-1.0))*np.exp(-eta*(x-1.0)) )
+
+        # The derivatives are Laurent polynomials in x times exp(eta(1-x)),
+        # phi' = 3(x^-1 - x^-2)exp(eta(1-x)) and d/dy = x^-2/3 d/dx
+        terms = {-1: 3.0, -2: -3.0}
+        for _ in range(n-1):
+            new_terms = {}
+            for p,c in terms.items():
+                new_terms[p-3] = new_terms.get(p-3,0.0) + c*p/3.0
+                new_terms[p-2] = new_terms.get(p-2,0.0) - c*eta/3.0
+            terms = new_terms
+        return np.exp(eta*(1.0-x))*sum( c*x**p for p,c in terms.items() )
+
+    @staticmethod
+    def phi_bp_deriv( y, bp ):
+        x = y**(1.0/3.0)
+        q = bp-1.0
+        phi = BatchedVinet.phi( y, bp, 0 )
+        return -2.0*phi/q + 9.0*(x-1.0)**2*np.exp(-1.5*q*(x-1.0))/q
+
+class BatchedMurnaghan( BatchedReducedEOS ):
+    """
+    Murnaghan equation of state
+
+    phi(y) = y^(1-B0')/(B0'(B0'-1)) + y/B0' - 1/(B0'-1)
+    """
+    @staticmethod
+    def phi( y, bp, n ):
+        if ( n == 0 ):
+            return y**(1.0-bp)/(bp*(bp-1.0)) + y/bp - 1.0/(bp-1.0)
+        value = falling_factorial( 1.0-bp, n )*y**(1.0-bp-n)/(bp*(bp-1.0))
+        if ( n == 1 ):
+            value = value + 1.0/bp
+        return value
+
+    @staticmethod
+    def phi_bp_deriv( y, bp ):
+        deriv = y**(1.0-bp)*( -np.log(y)/(bp*(bp-1.0)) - (2.0*bp-1.0)/(bp*(bp-1.0))**2 )
+        return deriv - y/bp**2 + 1.0/(bp-1.0)**2
+
+# Batched fitters that can be selected by name
+BATCHED_EOS_FAMILIES = {
+    "birch_murnagan": BatchedBirschMurnagan,
+    "finite_strain_birch_murnaghan": BatchedFiniteStrainBirchMurnaghan,
+    "poirier_tarantola": BatchedPoirierTarantola,
+    "vinet": BatchedVinet,
+    "murnaghan": BatchedMurnaghan
+}
+
+class FittedEquationOfState( EquationOfState ):
+    """
+    Equation of state of a single structure fitted with one of the
+    batched families
+
+    :param volume: Volumes
+    :param energy: Energies
+    :param debye_scheme: none or mjs
+    :param kwargs: Passed to the batched fitter (e.g. order)
+    """
+    batched_family = None
+
+    def __init__( self, volume, energy, debye_scheme="mjs", **kwargs ):
+        EquationOfState.__init__( self, volume, energy, debye_scheme=debye_scheme )
+        self.fit_kwargs = kwargs
+        self.result = None
+
+    def fit( self ):
+        """
+        Fits the equation of state
+        """
+        fitter = self.batched_family( np.atleast_2d(self.volume), np.atleast_2d(self.energy), **self.fit_kwargs )
+        self.result = fitter.fit()
+
+    def nth_deriv( self, V, n ):
+        """
+        Evaluates the n-th derivative with respect to volume
+        """
+        if ( self.result is None ):
+            self.fit()
+        return self.result.nth_deriv( np.asarray(V, dtype=float)[None], n )[0]
+
+    def evaluate( self, V ):
+        return self.nth_deriv( V, 0 )
+
+    def deriv( self, V ):
+        return self.nth_deriv( V, 1 )
+
+    def double_deriv( self, V ):
+        return self.nth_deriv( V, 2 )
+
+    def equilibrium_parameters( self ):
+        """
+        Returns E0, V0, B0 and B0'
+        """
+        if ( self.result is None ):
+            self.fit()
+        return tuple( value[0] for value in self.result.equilibrium_parameters() )
+
+class FiniteStrainBirchMurnaghan( FittedEquationOfState ):
+    batched_family = BatchedFiniteStrainBirchMurnaghan
+
+class PoirierTarantola( FittedEquationOfState ):
+    batched_family = BatchedPoirierTarantola
+
+class Vinet( FittedEquationOfState ):
+    batched_family = BatchedVinet
+
+class Murnaghan( FittedEquationOfState ):
+    batched_family = BatchedMurnaghan
@@ -1,8 +1,8 @@
 from matplotlib import pyplot as plt
 import numpy as np
 from ase.units import kB, kg, _hbar, _c, eV, _amu, J, Angstrom
-from scipy.optimize import minimize
 from ase.data import atomic_masses, atomic_numbers
+from atomtools.eos.debye_gruneisen import debye_frequency, equilibrium_volume
 
 class EquationOfState(object):
     def __init__( self, volume, energy, debye_scheme="mjs" ):
@@ -24,6 +24,9 @@ class EquationOfState(object):
     def double_deriv( self, V ):
         raise NotImplementedError( "Double derivative has to be implemented in subclasses" )
 
+    def nth_deriv( self, V, n ):
+        raise NotImplementedError( "Higher order derivatives has to be implemented in subclasses" )
+
     def plot( self, latex=False ):
         """
         Plots the result
@@ -75,11 +78,11 @@ class EquationOfState(object):
         Computes the density given a number dictionary of atoms
         """
         n_tot = 0
-        for key,value in atoms.iteritems():
+        for key,value in atoms.items():
             n_tot += value
         self.natoms = n_tot
         tot_mass = 0.0
-        for key,value in atoms.iteritems():
+        for key,value in atoms.items():
             tot_mass += value*atomic_masses[atomic_numbers[key]]
         self.tot_mass = tot_mass
         #print (self.avg_mass)
@@ -88,22 +91,9 @@ class EquationOfState(object):
         """
         Compute the Debye Frequency in rad/s of a given assuming isotropic speed of sound
         """
-        B = self.bulk_modulus(V)
-        rho = self.density(V)
-        rho /= kg # Unit of rho is now kg/(angstrom^3)
-        B /= J # J/angstrom^3
-        omega_D = (6.0*np.pi**2)**(1.0/3.0) * V**(-1.0/3.0) * np.sqrt( B/rho )*1E10 # Unit of omega_D: rad/s
-        v_sound = self.speed_of_sound(V)
-        number_density = self.natoms/V
-        omega_D = (6.0*np.pi**2 *number_density)**(1.0/3.0) * v_sound*1E10
-        omega_D *= _hbar*J
-
-        if ( self.debye_scheme == "none" ):
-            return omega_D # In eV
-        elif ( self.debye_scheme == "mjs" ):
-            # See: Moruzzi, V.; Janak, J. & Schwarz, K. Calculated thermal properties of metals Physical Review B, APS, 1988, 37, 790
-            return 0.617*omega_D
-        raise ValueError( "Unknown debye scheme!" )
+        if ( self.tot_mass is None ):
+            raise ValueError( "Average mass is not known" )
+        return debye_frequency( self.bulk_modulus(V), V, self.tot_mass, self.natoms, debye_scheme=self.debye_scheme )
 
     def debye_temperature( self, V ):
         """
@@ -131,10 +121,8 @@ class EquationOfState(object):
         """
         Compute the minimum energy
         """
-        indx = np.argmin(self.energy)
-        V0 = self.volume[indx]
-        res = minimize( self.evaluate, V0 )
-        return res["fun"], res["x"][0]
+        V0 = equilibrium_volume( self, [0.0], np.min(self.volume), np.max(self.volume) )[0,0]
+        return self.evaluate(V0), V0
 
     def beta_elastic_vib_free_energy( self, T, vol_curve=None, natoms=1 ):
         """
@@ -143,31 +131,24 @@ class EquationOfState(object):
         if ( vol_curve is None ):
             vol_curve = self.volume_temperature( T, natoms )
 
-        fvib = []
+        vol_curve = np.asarray(vol_curve)
+        T = np.asarray(T, dtype=float)
         elastic = self.evaluate( vol_curve )/natoms
-        for V,temp in zip(vol_curve,T):
-            debye = self.debye_frequency(V)
-            fvib.append( self.phonon_free_energy_high_temp(debye,temp) )
+        fvib = self.phonon_free_energy_high_temp( self.debye_frequency(vol_curve), T )
 
         Emin = self.minimum_energy()[0]/natoms
-        E = elastic-Emin + np.array(fvib)
+        E = elastic-Emin + fvib
         if ( len(T) == 1 ):
             return E[0]/(kB*T[0])
-        return E/(kB*np.array(T))
+        return E/(kB*T)
 
     def volume_temperature( self, T, natoms ):
         """
         Computes the volume as a function of temperature by minimizing the
-        Free Energy of elastic + vibration
+        Free Energy of elastic + vibration. All temperatures are solved at
+        once, and the volume is restricted to the range of the data.
         """
-        min_indx = np.argmin(self.energy)
-        V0 = self.volume[min_indx]
-        volumes = []
-        for temp in T:
-            res = minimize( minization_vol_temp_curve, V0, args=(self,natoms,temp) )
-            volumes.append(res["x"][0])
-            V0 = res["x"]
-        return np.array(volumes)
+        return equilibrium_volume( self, T, np.min(self.volume), np.max(self.volume), natoms=natoms )[0]
 
     def linear_thermal_expansion_coefficient( self, T, natoms=1, vol_curve=None ):
         """
@@ -188,9 +169,3 @@ class EquationOfState(object):
         alpha_V = (res[1]+2.0*res[2]*T)/vol_curve
         alpha_L = alpha_V/3.0
         return alpha_L
-
-def minization_vol_temp_curve( V, eos, natoms, temperature ):
-    elastic_energy = eos.evaluate(V)/natoms
-    debye_freq = eos.debye_frequency( V )
-    F_vib = eos.phonon_free_energy_high_temp( debye_freq, temperature )
-    return elastic_energy + F_vib
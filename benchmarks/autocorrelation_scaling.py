@@ -0,0 +1,37 @@
+"""Benchmark the scaling of the auto correlation function with npix.
+
+Compares the direct summation (scipy.signal.correlate2d) with the
+FFT based modes of AutocorrelationFunction.
+
+Usage: python benchmarks/autocorrelation_scaling.py
+"""
+import time
+import numpy as np
+from atomtools.ase.autocorrelation_function import fft_autocorrelation
+
+MAX_NPIX_DIRECT = 128
+
+
+def time_call(func, *args, **kwargs):
+    start = time.time()
+    func(*args, **kwargs)
+    return time.time() - start
+
+
+def main():
+    from scipy.signal import correlate2d
+    print("{:>6} {:>12} {:>12} {:>12}".format("npix", "direct (s)",
+                                              "linear (s)", "periodic (s)"))
+    for npix in [16, 32, 64, 128, 256, 512, 1024]:
+        image = np.random.rand(npix, npix)
+        if npix <= MAX_NPIX_DIRECT:
+            t_direct = "{:12.4f}".format(time_call(correlate2d, image, image))
+        else:
+            t_direct = "{:>12}".format("-")
+        t_linear = time_call(fft_autocorrelation, image, periodic=False)
+        t_periodic = time_call(fft_autocorrelation, image, periodic=True)
+        print("{:6d} {} {:12.4f} {:12.4f}".format(npix, t_direct, t_linear,
+                                                  t_periodic))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import numpy as np
+from ase.build import bulk
+from ase.calculators.calculator import Calculator
+from ase.db import connect
+from atomtools.eos.adaptive_volume_sampler import AdaptiveVolumeSampler
+
+db_name = "test_adaptive_volume_sampler.db"
+
+class VinetCalc( Calculator ):
+    """
+    Calculator returning the energy of a Vinet equation of state
+    """
+    implemented_properties = ["energy"]
+
+    def __init__( self, E0, V0, B0, Bp ):
+        Calculator.__init__( self )
+        self.params = (E0, V0, B0, Bp)
+
+    def calculate( self, atoms, properties, system_changes ):
+        Calculator.calculate( self, atoms, properties, system_changes )
+        E0, V0, B0, Bp = self.params
+        x = (atoms.get_volume()/V0)**(1.0/3.0)
+        eta = 1.5*(Bp-1.0)
+        energy = E0 + 2.0*B0*V0/(Bp-1.0)**2*( 2.0 - (5.0 + 3.0*Bp*(x-1.0) - 3.0*x)*np.exp(-eta*(x-1.0)) )
+        self.results = {"energy": energy}
+
+class TestAdaptiveVolumeSampler( unittest.TestCase ):
+    def tearDown( self ):
+        if ( os.path.exists(db_name) ):
+            os.remove( db_name )
+
+    def test_sampling( self ):
+        atoms = bulk( "Al", "fcc", a=4.05 )
+        calc = VinetCalc( -3.7, 16.2, 0.45, 4.5 )
+        sampler = AdaptiveVolumeSampler( atoms, calc, db_name, group_id=2, noise=1E-5 )
+        result, params, std = sampler.run( tol=1E-2, max_points=12 )
+        num_points = len(sampler.volumes)
+        self.assertTrue( num_points < 12 )
+        self.assertTrue( np.allclose( params, [-3.7,16.2,0.45,4.5], rtol=1E-4 ) )
+        self.assertTrue( np.all( std[1:]/params[1:] < 1E-2 ) )
+
+        db = connect( db_name )
+        self.assertEqual( db.count(groupID=2), num_points )
+
+        # The sampling continues from the points in the database
+        sampler = AdaptiveVolumeSampler( atoms, calc, db_name, group_id=2, noise=1E-5 )
+        self.assertEqual( len(sampler.volumes), num_points )
+        sampler.run( tol=1E-2, max_points=12 )
+        self.assertEqual( db.count(groupID=2), num_points )
+
+    def test_next_volume_reduces_variance( self ):
+        atoms = bulk( "Al", "fcc", a=4.05 )
+        calc = VinetCalc( -3.7, 16.2, 0.45, 4.5 )
+        sampler = AdaptiveVolumeSampler( atoms, calc, db_name )
+        for factor in sampler.initial_volume_factors:
+            sampler.compute( factor )
+        sampler.fit()
+        factor = sampler.next_volume_factor()
+
+        # Volumes outside the initial range are the most informative
+        self.assertTrue( factor < 0.94 or factor > 1.06 )
+
+if __name__ == "__main__":
+    unittest.main()
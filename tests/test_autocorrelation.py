@@ -0,0 +1,81 @@
+"""Unit tests for the auto correlation function."""
+import unittest
+import numpy as np
+from ase.build import bulk
+from atomtools.ase.autocorrelation_function import AutocorrelationFunction
+from atomtools.ase.autocorrelation_function import fft_autocorrelation
+from atomtools.ase.autocorrelation_function import grid_positions
+
+
+def get_atoms():
+    atoms = bulk("Al", cubic=True)*(4, 4, 4)
+    for i in range(0, len(atoms), 3):
+        atoms[i].symbol = "Mg"
+    return atoms
+
+
+class TestAutocorrelation(unittest.TestCase):
+    """Unit tests for the auto correlation function."""
+
+    def test_fft_matches_direct(self):
+        atoms = get_atoms()
+        acf = AutocorrelationFunction(atoms, plane_normal=(1, 0, 0),
+                                      symb_dict={"Al": 1.0, "Mg": -1.0})
+        image, direct = acf.projected_image(npix=32, show=False,
+                                            mode="direct")
+        image_fft, linear = acf.projected_image(npix=32, show=False,
+                                                mode="linear")
+        self.assertTrue(np.allclose(image, image_fft))
+        self.assertEqual(direct.shape, linear.shape)
+        self.assertTrue(np.allclose(direct, linear, atol=1E-8))
+
+    def test_periodic_is_folded_linear(self):
+        image = np.random.rand(6, 9)
+        linear = fft_autocorrelation(image, periodic=False)
+        periodic = fft_autocorrelation(image, periodic=True)
+
+        folded = np.zeros_like(image)
+        nx, ny = image.shape
+        for i in range(linear.shape[0]):
+            for j in range(linear.shape[1]):
+                folded[(i - nx + 1) % nx, (j - ny + 1) % ny] += linear[i, j]
+        self.assertTrue(np.allclose(np.fft.fftshift(folded), periodic))
+
+    def test_projection_along_normal(self):
+        atoms = get_atoms()
+        for normal in [(1, 1, 1), (1, 2, 3), (-1, 0, 2), (0, 0, 1)]:
+            atoms.set_positions(np.outer(np.arange(len(atoms)), normal))
+            acf = AutocorrelationFunction(atoms, plane_normal=normal)
+            self.assertTrue(np.allclose(acf.projected_positions, 0.0))
+
+    def test_unknown_mode(self):
+        acf = AutocorrelationFunction(get_atoms())
+        with self.assertRaises(ValueError):
+            acf.projected_image(npix=8, show=False, mode="unknown")
+
+    def test_grid_positions(self):
+        pos = np.random.rand(200, 2)*10.0
+        values = np.random.rand(200)
+        npix = 16
+        image = grid_positions(pos, values, npix)
+
+        # Reference implementation looping over all positions
+        ref = np.zeros((npix, npix))
+        dx = (np.max(pos[:, 0]) - np.min(pos[:, 0]))/(npix - 1)
+        dy = (np.max(pos[:, 1]) - np.min(pos[:, 1]))/(npix - 1)
+        for i in range(pos.shape[0]):
+            ix = int((pos[i, 0] - np.min(pos[:, 0]))/dx)
+            iy = int((pos[i, 1] - np.min(pos[:, 1]))/dy)
+            ref[ix, iy] += values[i]
+        self.assertTrue(np.allclose(image, ref))
+
+        for smearing in ["cic", "gaussian"]:
+            smeared = grid_positions(pos, values, npix, smearing=smearing,
+                                     sigma=0.5)
+            self.assertAlmostEqual(np.sum(smeared), np.sum(values))
+
+        with self.assertRaises(ValueError):
+            grid_positions(pos, values, npix, smearing="gaussian")
+
+if __name__ == "__main__":
+    unittest.main()
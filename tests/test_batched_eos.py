@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from scipy.optimize import minimize_scalar
+from atomtools.eos import BirschMurnagan, BatchedBirschMurnagan
+from atomtools.eos.debye_gruneisen import BatchedDebyeGruneisen
+
+class TestBatchedEOS( unittest.TestCase ):
+    def setUp( self ):
+        rng = np.random.RandomState(0)
+        self.group_ids = []
+        self.volumes = []
+        self.energies = []
+        for gid,num in zip( ["b","a","c"], [5,8,6] ):
+            V = np.linspace( 14.0, 18.0, num )
+            E = -3.0 + 0.05*(V-16.0)**2 + 0.01*rng.rand(num)
+            self.group_ids += [gid]*num
+            self.volumes += list(V)
+            self.energies += list(E)
+
+    def test_ragged_fit( self ):
+        fit = BatchedBirschMurnagan.from_groups( self.group_ids, self.volumes, self.energies ).fit()
+        self.assertEqual( fit.groups, ["b","a","c"] )
+        group_ids = np.array(self.group_ids)
+        for i,gid in enumerate(fit.groups):
+            V = np.array(self.volumes)[group_ids==gid]
+            E = np.array(self.energies)[group_ids==gid]
+            bm = BirschMurnagan( V, E )
+            bm.fit()
+            self.assertTrue( np.allclose( [bm.a,bm.b,bm.c,bm.d], fit.coeff[i] ) )
+            self.assertTrue( np.allclose( bm.deriv(15.0), fit.deriv(15.0)[i] ) )
+            self.assertTrue( np.allclose( bm.double_deriv(15.0), fit.double_deriv(15.0)[i] ) )
+
+    def test_derivatives( self ):
+        fit = BatchedBirschMurnagan.from_groups( self.group_ids, self.volumes, self.energies ).fit()
+        V = np.array( [[14.0,15.0],[15.0,16.0],[16.0,17.0]] )
+        h = 1E-4
+        for n in range(3):
+            fd = (fit.nth_deriv(V+h,n) - fit.nth_deriv(V-h,n))/(2.0*h)
+            self.assertTrue( np.allclose( fit.nth_deriv(V,n+1), fd ) )
+
+        with self.assertRaises( ValueError ):
+            fit.evaluate( np.ones(5) )
+
+    def test_debye_gruneisen( self ):
+        group_ids = []
+        volumes = []
+        energies = []
+        for gid,V0 in enumerate( [16.5,17.0,20.0] ):
+            V = np.linspace( 0.9*V0, 1.15*V0, 10 )
+            x = (V0/V)**(2.0/3.0)
+            E = -3.7 + 9.0*V0*0.45/16.0*( 4.5*(x-1.0)**3 + (x-1.0)**2*(6.0-4.0*x) )
+            group_ids += [gid]*len(V)
+            volumes += list(V)
+            energies += list(E)
+        fit = BatchedBirschMurnagan.from_groups( group_ids, volumes, energies ).fit()
+        vmin = [16.5*0.9, 17.0*0.9, 20.0*0.9]
+        vmax = [16.5*1.15, 17.0*1.15, 20.0*1.15]
+        model = BatchedDebyeGruneisen( fit, [26.98]*3, [1]*3, vmin, vmax )
+        T = np.array( [10.0, 300.0, 800.0] )
+        vol_curve = model.volume_temperature(T)
+        self.assertEqual( vol_curve.shape, (3,3) )
+        for g in range(3):
+            for i in range(3):
+                func = lambda v: model.free_energy( np.full((3,1),v), [T[i]] )[g,0]
+                res = minimize_scalar( func, bounds=(vmin[g],vmax[g]), method="bounded", options={"xatol":1E-8} )
+                self.assertAlmostEqual( res.x, vol_curve[g,i], places=5 )
+
+        E0, V0 = model.minimum_energy()
+        self.assertTrue( np.allclose( V0, [16.5,17.0,20.0], rtol=1E-3 ) )
+        self.assertTrue( np.allclose( fit.deriv(V0), 0.0 ) )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+"""Unit tests for the constituent strain."""
+import unittest
+import os
+import numpy as np
+from ase.build import bulk
+from ase.db import connect
+from ase.calculators.emt import EMT
+from ase.calculators.singlepoint import SinglePointCalculator
+from scipy.optimize import minimize_scalar
+from atomtools.ase import ConstituentStrain
+from atomtools.ase.constituent_strain_model import ConstituentStrainModel
+
+db_name = "test_constituent_strain.db"
+model_file = "test_constituent_strain_model.npz"
+
+
+class FailingEMT(EMT):
+    """EMT calculator that fails for large cells."""
+
+    def calculate(self, atoms=None, properties=["energy"],
+                  system_changes=["positions", "numbers", "cell"]):
+        if atoms.get_volume() > 20.0:
+            raise RuntimeError("Cell too large")
+        EMT.calculate(self, atoms, properties, system_changes)
+
+
+class CountingEMT(EMT):
+    """EMT calculator that counts the number of calculations."""
+    num_calls = 0
+
+    def calculate(self, *args, **kwargs):
+        CountingEMT.num_calls += 1
+        EMT.calculate(self, *args, **kwargs)
+
+
+def write_synthetic_db(directions=[(0, 0, 1), (1, 1, 1)]):
+    """Write parabolic E(a) curves for three end members."""
+    db = connect(db_name)
+    a0 = {"Al": 4.05, "Mg": 4.5, "Cu": 3.6}
+    curv = {"Al": 0.5, "Mg": 0.3, "Cu": 0.8}
+    for symb in a0.keys():
+        for i, direction in enumerate(directions):
+            for a in np.linspace(3.5, 4.6, 12):
+                atoms = bulk(symb, "fcc", a=4.0)
+                energy = (i + 1)*curv[symb]*(a - a0[symb])**2 - 3.0
+                atoms.set_calculator(SinglePointCalculator(atoms,
+                                                           energy=energy))
+                kvp = {"cell_length_x": a, "cell_length_y": a,
+                       "direction_x": direction[0],
+                       "direction_y": direction[1],
+                       "direction_z": direction[2]}
+                db.write(atoms, key_value_pairs=kvp)
+    return directions
+
+
+class TestConstituentStrain(unittest.TestCase):
+    """Unit tests for the constituent strain."""
+
+    def tearDown(self):
+        for fname in [db_name, model_file]:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def test_run_parallel(self):
+        atoms = bulk("Al")
+        atoms.set_calculator(FailingEMT())
+        cs = ConstituentStrain(atoms=atoms, db_name=db_name)
+        a = [2.75, 2.8, 2.85, 3.3]
+        cs.run_parallel(cell_length_x=a, directions=[(0, 0, 1), (1, 1, 1)],
+                        num_proc=2)
+
+        db = connect(db_name)
+        self.assertEqual(db.count(), 8)
+        self.assertEqual(db.count(failed=True), 2)
+        row = db.get(failed=True, direction_z=1, direction_x=0)
+        self.assertIn("Cell too large", row.data["error"])
+
+        energies, a_in_plane = cs.get_energy_in_plane_distance(
+            direction=(0, 0, 1))
+        self.assertEqual(sorted(a_in_plane["Al"]), a[:3])
+
+    def test_continuation(self):
+        a = list(np.linspace(3.95, 4.15, 6))
+        calls = []
+        energies = []
+        for continuation in [False, True]:
+            atoms = bulk("Al", cubic=True)
+            atoms.rattle(0.05, seed=1)
+            atoms.set_calculator(CountingEMT())
+            cs = ConstituentStrain(atoms=atoms, db_name=db_name)
+            CountingEMT.num_calls = 0
+            cs.run(cell_length_x=a, direction=(0, 0, 1), smax=0.0003,
+                   continuation=continuation, reuse_hessian=continuation)
+            calls.append(CountingEMT.num_calls)
+            eng, _ = cs.get_energy_in_plane_distance(direction=(0, 0, 1))
+            energies.append(eng["Al4"])
+            os.remove(db_name)
+        self.assertLess(calls[1], calls[0])
+        self.assertTrue(np.allclose(energies[0], energies[1], atol=1E-3))
+
+    def test_adaptive_sampling(self):
+        atoms = bulk("Al", cubic=True)
+        atoms.set_calculator(EMT())
+        cs = ConstituentStrain(atoms=atoms, db_name=db_name)
+        a_opt, curv, E_opt, converged = cs.run_adaptive(
+            a_min=3.9, a_max=4.2, direction=(0, 0, 1), smax=0.0003,
+            max_points=12)
+        energies, a = cs.get_energy_in_plane_distance(direction=(0, 0, 1))
+        self.assertTrue(converged)
+        self.assertLessEqual(len(a["Al4"]), 12)
+        self.assertGreater(curv, 0.0)
+        self.assertLess(E_opt, np.min(energies["Al4"]) + 1E-4)
+        self.assertAlmostEqual(a_opt, a["Al4"][np.argmin(energies["Al4"])],
+                               places=2)
+
+    def test_adaptive_sampling_failed_bracket(self):
+        atoms = bulk("Al", cubic=True)
+        cs = ConstituentStrain(atoms=atoms, db_name=db_name)
+
+        def relax(db, a, direction, smax, relaxed):
+            if a < 3.9:
+                return None
+            return (a - 3.8)**2
+        cs._relax_adaptive_point = relax
+        with self.assertRaisesRegex(RuntimeError, "failed point"):
+            cs.run_adaptive(a_min=3.95, a_max=4.2, max_points=20)
+
+    def test_adaptive_sampling_max_points(self):
+        atoms = bulk("Al", cubic=True)
+        cs = ConstituentStrain(atoms=atoms, db_name=db_name)
+        calls = []
+
+        def relax(db, a, direction, smax, relaxed):
+            calls.append(a)
+            return (a - 4.0)**2 + 10.0*(a - 4.0)**4
+        cs._relax_adaptive_point = relax
+        a_opt, curv, E_opt, converged = cs.run_adaptive(
+            a_min=3.9, a_max=4.2, max_points=5)
+        self.assertFalse(converged)
+        self.assertEqual(len(calls), 5)
+        self.assertAlmostEqual(a_opt, 4.0, places=1)
+
+        calls = []
+        a_opt, curv, E_opt, converged = cs.run_adaptive(
+            a_min=3.9, a_max=4.2, max_points=30)
+        self.assertTrue(converged)
+        self.assertLess(len(calls), 30)
+
+    def test_coherency_strain_energy_table(self):
+        directions = write_synthetic_db()
+        cs = ConstituentStrain(db_name=db_name)
+        x = np.random.rand(5, 3)
+        x /= np.sum(x, axis=1)[:, None]
+        formulas, conc, E_CS, a_min = cs.coherency_strain_energy_table(
+            directions=directions, concentrations=x, formulas=["Al", "Mg", "Cu"],
+            kind="cubic")
+        self.assertEqual(E_CS.shape, (2, 5))
+
+        # Compare with a direct minimization of the analytic curves
+        a0 = np.array([4.05, 4.5, 3.6])
+        curv = np.array([0.5, 0.3, 0.8])
+        for i in range(2):
+            for j in range(5):
+                res = minimize_scalar(
+                    lambda a: np.sum(x[j]*(i + 1)*curv*(a - a0)**2),
+                    bounds=(3.5, 4.6), method="bounded")
+                self.assertAlmostEqual(E_CS[i, j], res.fun, places=4)
+
+        binary = cs.coherency_strain_energy_table(formulas=["Al", "Mg"])[2]
+        self.assertEqual(binary.shape, (1, 101))
+        self.assertAlmostEqual(binary[0, 0], 0.0)
+        self.assertAlmostEqual(binary[0, -1], 0.0)
+
+        with self.assertRaises(ValueError):
+            cs.coherency_strain_energy(direction=(0, 0, 1))
+
+    def test_strain_model(self):
+        directions = [(1, 0, 0), (1, 1, 0), (1, 1, 1)]
+        write_synthetic_db(directions=directions)
+        cs = ConstituentStrain(db_name=db_name)
+        model = ConstituentStrainModel.from_constituent_strain(
+            cs, directions=directions, formulas=["Al", "Mg"],
+            cache=model_file)
+        table = cs.coherency_strain_energy_table(directions=directions,
+                                                 formulas=["Al", "Mg"])
+        conc = table[1][:, 0]
+        for i, direction in enumerate(directions):
+            E = model.evaluate(np.tile(direction, (len(conc), 1)), conc)
+            self.assertTrue(np.allclose(E, table[2][i], atol=5E-3))
+
+        # Cubic symmetry
+        k = np.random.rand(10, 3)
+        self.assertTrue(np.allclose(model.evaluate(k, 0.3),
+                                    model.evaluate(-k[:, [2, 0, 1]], 0.3)))
+
+        # The cached model is used when the settings match, without
+        # reading the database
+        empty = ConstituentStrain(db_name="no_such_file.db")
+        cached = ConstituentStrainModel.from_constituent_strain(
+            empty, directions=directions, formulas=["Al", "Mg"],
+            cache=model_file)
+        self.assertTrue(np.allclose(cached.coeff, model.coeff))
+        self.assertFalse(os.path.exists("no_such_file.db"))
+
+        # Different settings are refitted and replace the cache
+        refitted = ConstituentStrainModel.from_constituent_strain(
+            cs, directions=directions, formulas=["Al", "Mg"], order=2,
+            cache=model_file)
+        self.assertEqual(refitted.coeff.shape, (3, 2))
+        self.assertEqual(ConstituentStrainModel.load(model_file).order, 2)
+        swapped = ConstituentStrainModel.from_constituent_strain(
+            cs, directions=directions, formulas=["Mg", "Al"], order=2,
+            cache=model_file)
+        self.assertTrue(np.allclose(swapped.evaluate(k, 0.7),
+                                    refitted.evaluate(k, 0.3)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Unit tests for the cubic elastic constants."""
+import unittest
+import os
+import numpy as np
+from ase.build import bulk
+from ase.calculators.emt import EMT
+from ase.calculators.calculator import Calculator
+from ase.db import connect
+from atomtools.ase import CubicElasticConstants, ElasticConstants
+
+db_name = "test_cubic_elastic.db"
+
+
+class LinearCubicCalc(Calculator):
+    """Calculator with a linear stress-strain relation."""
+
+    implemented_properties = ["stress"]
+
+    def __init__(self, ref_cell, C11, C12, C44, residual=0.0):
+        Calculator.__init__(self)
+        self.ref_cell = np.array(ref_cell)
+        self.tensor = np.zeros((6, 6))
+        self.tensor[:3, :3] = C12
+        self.tensor[[0, 1, 2], [0, 1, 2]] = C11
+        self.tensor[[3, 4, 5], [3, 4, 5]] = C44
+        self.residual = residual
+
+    def calculate(self, atoms, properties, system_changes):
+        Calculator.calculate(self, atoms, properties, system_changes)
+        F = np.linalg.solve(self.ref_cell, np.array(atoms.get_cell()))
+        eps = 0.5*(F.T.dot(F) - np.identity(3))
+        voigt = np.array([eps[0, 0], eps[1, 1], eps[2, 2], 2*eps[1, 2],
+                          2*eps[0, 2], 2*eps[0, 1]])
+        self.results = {"stress": self.tensor.dot(voigt) + self.residual}
+
+
+class TestCubicElasticConstants(unittest.TestCase):
+    def tearDown(self):
+        if os.path.exists(db_name):
+            os.remove(db_name)
+
+    def test_compute(self):
+        # Lattice parameter with zero pressure for EMT
+        atoms = bulk("Al", cubic=True, a=3.99427418)
+        el = CubicElasticConstants(atoms, db_name)
+        C11, C12, C44 = el.compute(EMT(), num_proc=2)
+        self.assertEqual(connect(db_name).count(), 8)
+
+        # Compare with central differences of the general driver
+        ref = ElasticConstants(atoms, "ref_" + db_name)
+        C_ref, _ = ref.run_adaptive(EMT(), spg=225, tol=1.0)
+        os.remove("ref_" + db_name)
+        self.assertAlmostEqual(C11, C_ref[0, 0], places=3)
+        self.assertAlmostEqual(C12, C_ref[0, 1], places=3)
+
+        # The shear strains are larger, which reduces C44 slightly
+        self.assertAlmostEqual(C44, 0.5*C_ref[3, 3], delta=0.02)
+        self.assertAlmostEqual(el.bulk_modulus(mode="V"),
+                               (C11 + 2.0*C12)/3.0)
+
+        # Calling compute again does not add or recompute any rows
+        self.assertEqual(el.compute(EMT(), num_proc=2), (C11, C12, C44))
+        self.assertEqual(connect(db_name).count(), 8)
+
+    def test_linear_calc(self):
+        atoms = bulk("Al", cubic=True)
+        calc = LinearCubicCalc(atoms.get_cell(), 0.4, 0.25, 0.15,
+                               residual=0.01)
+        el = CubicElasticConstants(atoms, db_name)
+        C11, C12, C44 = el.compute(calc, num_proc=2)
+        self.assertAlmostEqual(C11, 0.4)
+        self.assertAlmostEqual(C12, 0.25)
+        self.assertAlmostEqual(C44, 0.15)
+
+
+if __name__ == "__main__":
+    unittest.main()
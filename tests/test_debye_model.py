@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from scipy.integrate import quad
+from ase.units import kB
+from atomtools.eos import BatchedBirschMurnagan, QuasiHarmonicDebye
+from atomtools.eos.debye_model import debye_function, debye_function_deriv
+
+def birch_murnaghan( V, V0, B0, Bp ):
+    x = (V0/V)**(2.0/3.0)
+    return -3.7 + 9.0*V0*B0/16.0*( Bp*(x-1.0)**3 + (x-1.0)**2*(6.0-4.0*x) )
+
+class TestDebyeModel( unittest.TestCase ):
+    def setUp( self ):
+        group_ids = []
+        volumes = []
+        energies = []
+        for gid,V0 in enumerate( [16.5,20.0] ):
+            V = np.linspace( 0.9*V0, 1.15*V0, 10 )
+            group_ids += [gid]*len(V)
+            volumes += list(V)
+            energies += list( birch_murnaghan(V,V0,0.45,4.5) )
+        fit = BatchedBirschMurnagan.from_groups( group_ids, volumes, energies ).fit()
+        self.model = QuasiHarmonicDebye( fit, [26.98]*2, [1]*2, [14.85,18.0], [18.975,23.0] )
+
+    def test_debye_function( self ):
+        x = np.array( [1E-4, 0.3, 2.5, 11.7, 19.99, 20.01, 35.0] )
+        ref = [3.0*quad( lambda t: t**3/np.expm1(t), 0.0, xi, epsabs=0.0, epsrel=1E-12 )[0]/xi**3 for xi in x]
+        self.assertTrue( np.allclose( debye_function(x), ref, rtol=1E-9, atol=0.0 ) )
+        self.assertAlmostEqual( float(debye_function(0.0)), 1.0 )
+        self.assertEqual( float(debye_function(np.inf)), 0.0 )
+
+        h = 1E-5
+        fd = (debye_function(x+h) - debye_function(x-h))/(2.0*h)
+        self.assertTrue( np.allclose( debye_function_deriv(x), fd, atol=1E-8 ) )
+
+    def test_thermodynamics( self ):
+        V = np.array( [[16.0,17.0],[19.0,21.0]] )[:,:,None]
+        T = np.array( [20.0,300.0,1000.0] )
+        F = self.model.free_energy( V, T )
+        self.assertEqual( F.shape, (2,2,3) )
+
+        # S = -dF/dT and Cv = T dS/dT
+        h = 1E-3
+        S = -(self.model.free_energy(V,T+h) - self.model.free_energy(V,T-h))/(2.0*h)
+        self.assertTrue( np.allclose( self.model.entropy(V,T), S ) )
+        Cv = T*(self.model.entropy(V,T+h) - self.model.entropy(V,T-h))/(2.0*h)
+        self.assertTrue( np.allclose( self.model.heat_capacity(V,T), Cv ) )
+
+        # Dulong-Petit limit and vanishing heat capacity at T = 0
+        self.assertTrue( np.allclose( self.model.heat_capacity(V,1E5), 3.0*kB, rtol=1E-4 ) )
+        self.assertTrue( np.allclose( self.model.heat_capacity(V,0.0), 0.0 ) )
+
+        h = 1E-5
+        dF = (self.model.free_energy(V+h,T) - self.model.free_energy(V-h,T))/(2.0*h)
+        self.assertTrue( np.allclose( self.model.free_energy_deriv(V,T), dF, atol=1E-8 ) )
+
+    def test_thermal_expansion( self ):
+        T = np.array( [100.0, 300.0, 900.0] )
+        vol_curve = self.model.volume_temperature(T)
+        self.assertTrue( np.allclose( self.model.free_energy_deriv(vol_curve,T), 0.0 ) )
+        self.assertTrue( np.all( np.diff(vol_curve,axis=1) > 0.0 ) )
+
+        dT = 1E-2
+        dVdT = (self.model.volume_temperature(T+dT) - self.model.volume_temperature(T-dT))/(2.0*dT)
+        self.assertTrue( np.allclose( self.model.thermal_expansion(T), dVdT/vol_curve, rtol=1E-5 ) )
+
+if __name__ == "__main__":
+    unittest.main()
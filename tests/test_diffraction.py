@@ -0,0 +1,69 @@
+"""Unit tests for the kinematic diffraction patterns."""
+import unittest
+import numpy as np
+from ase.build import bulk
+from atomtools.ase import KinematicDiffraction
+
+
+class TestKinematicDiffraction(unittest.TestCase):
+    """Unit tests for the kinematic diffraction."""
+
+    def test_matches_direct_sum(self):
+        atoms = bulk("Al", cubic=True)*(3, 3, 3)
+        for i in range(0, len(atoms), 3):
+            atoms[i].symbol = "Mg"
+        weights = {"Al": 1.0, "Mg": -0.5}
+        zone_axes = [(0, 0, 1), (1, 1, 0), (1, 1, 1)]
+        diff = KinematicDiffraction(atoms, form_factors=weights, npix=24)
+        intensity, q = diff.patterns(zone_axes)
+        self.assertEqual(intensity.shape, (3, 24, 24))
+        self.assertEqual(q.shape, (3, 24, 24, 2))
+
+        # All projected positions are on the grid, hence the FFT is
+        # exact at the reciprocal lattice vectors of the projected cell
+        f = np.array([weights[s] for s in atoms.get_chemical_symbols()])
+        proj = diff.projected_positions(zone_axes)
+        for i in range(len(zone_axes)):
+            phase = np.einsum("ijk,nk->ijn", q[i], proj[i])
+            ref = np.abs(np.exp(-1j*phase).dot(f))**2
+            self.assertTrue(np.allclose(intensity[i], ref))
+
+    def test_superlattice_peaks(self):
+        # L1_2 ordered Cu3Au
+        a = 4.0
+        atoms = bulk("Au", cubic=True, a=a)
+        atoms.set_chemical_symbols(["Au", "Cu", "Cu", "Cu"])
+        atoms = atoms*(2, 2, 2)
+        diff = KinematicDiffraction(atoms, npix=16)
+        intensity, q = diff.patterns((0, 0, 1))
+        intensity, q = intensity[0], q[0]
+
+        # Peaks are only at multiples of 2*pi/a (the reciprocal lattice
+        # of the conventional cell), there is no leakage in between
+        hk = q*a/(2.0*np.pi)
+        on_lattice = np.all(np.abs(hk - np.round(hk)) < 1E-8, axis=-1)
+        self.assertTrue(np.any(~on_lattice))
+        self.assertTrue(np.allclose(intensity[~on_lattice], 0.0))
+
+        # Superlattice peaks at (100) and (110) with amplitude
+        # num_cells*(f_Au - f_Cu), fundamental peak at (200) with
+        # num_cells*(f_Au + 3*f_Cu)
+        for target, amp in [((1, 0), 79 - 29), ((1, 1), 79 - 29),
+                            ((2, 0), 79 + 3*29)]:
+            dist = np.sum((hk - np.array(target))**2, axis=-1)
+            indx = np.unravel_index(np.argmin(dist), dist.shape)
+            self.assertAlmostEqual(dist[indx], 0.0)
+            self.assertAlmostEqual(intensity[indx], (8.0*amp)**2)
+
+    def test_q_dependent_form_factor(self):
+        atoms = bulk("Al", cubic=True)*(2, 2, 2)
+
+        def form_factor(q):
+            return 13.0*np.exp(-0.01*q**2)
+        diff = KinematicDiffraction(atoms, form_factors={"Al": form_factor},
+                                    npix=16)
+        intensity = diff.patterns((0, 0, 1))[0]
+        self.assertAlmostEqual(intensity[0, 8, 8], (13.0*len(atoms))**2)
+
+if __name__ == "__main__":
+    unittest.main()
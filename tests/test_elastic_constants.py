@@ -2,9 +2,19 @@
 import unittest
 from ase.build import bulk
 from atomtools.ase import ElasticConstants
+from atomtools.ase.elastic_constants import symmetry_projector
+from atomtools.ase.elastic_constants import symmetrize_elastic_tensors
+from atomtools.ase.elastic_constants import elastic_properties
+from atomtools.ase import mandel
 from ase.calculators.calculator import Calculator
+from ase.calculators.emt import EMT
+from ase.db import connect
 import numpy as np
 import os
+import socket
+import subprocess
+import sys
+import time
 
 
 class DummyCalc(Calculator):
@@ -20,9 +30,58 @@ class DummyCalc(Calculator):
         }
 
 
+class ExpansionFailingCalc(DummyCalc):
+    """Dummy calculator that fails for expanded cells."""
+
+    def calculate(self, atoms, properties, system_changes):
+        if atoms.get_volume() > 16.65:
+            raise RuntimeError("Calculation crashed")
+        DummyCalc.calculate(self, atoms, properties, system_changes)
+
+
+class NoisyEMT(EMT):
+    """EMT calculator with noise on the stress."""
+
+    def calculate(self, *args, **kwargs):
+        EMT.calculate(self, *args, **kwargs)
+        self.results["stress"] = self.results["stress"] + \
+            1E-5*np.random.randn(6)
+
+
+class LinearElasticCalc(Calculator):
+    """Stress from a given elastic tensor and the Green-Lagrange strain."""
+
+    implemented_properties = ["stress"]
+
+    def __init__(self, tensor, ref_cell):
+        Calculator.__init__(self)
+        self.tensor = tensor
+        self.ref_cell = np.array(ref_cell)
+
+    def calculate(self, atoms, properties, system_changes):
+        Calculator.calculate(self, atoms, properties, system_changes)
+        F = np.linalg.solve(self.ref_cell, np.array(atoms.get_cell()))
+        strain = 0.5*(F.T.dot(F) - np.identity(3))
+        stress = self.tensor.dot(mandel.to_mandel(strain))
+        stress[3:] /= np.sqrt(2.0)
+        self.results = {"stress": stress}
+
+
 db_name = "test_elastic.db"
 
 
+def hexagonal_tensor(C11=59.0, C12=26.0, C13=21.0, C33=61.0, C44=16.0):
+    """Return a hexagonal elastic tensor in Mandel notation."""
+    C = np.zeros((6, 6))
+    C[:2, :2] = C12
+    C[[0, 1], [0, 1]] = C11
+    C[:2, 2] = C[2, :2] = C13
+    C[2, 2] = C33
+    C[3, 3] = C[4, 4] = 2.0*C44
+    C[5, 5] = C11 - C12
+    return C
+
+
 class TestElasticConstante(unittest.TestCase):
     """Unit test case for elastic constants."""
 
@@ -62,5 +121,235 @@ class TestElasticConstante(unittest.TestCase):
         tensor_orig = el._to_mandel_rank4(full)
         self.assertTrue(np.allclose(tensor, tensor_orig))
 
+    def check_strain_keys(self, db, num_rows):
+        """Check that strain_type and strain_component match the strain."""
+        self.assertEqual(db.count(), num_rows)
+        for row in db.select():
+            comp = row.strain_component
+            strained = np.nonzero(np.abs(row.data["strain"]) > 1E-10)[0]
+            self.assertEqual(strained[-1], comp)
+            self.assertEqual(row.strain_type, 0 if comp < 3 else comp)
+
+    def test_run_pool_restart(self):
+        atoms = bulk("Al", a=4.05)
+        el = ElasticConstants(atoms, db_name)
+        el.prepare_db()
+        el.run_pool(ExpansionFailingCalc(), num_proc=2, batch_size=4)
+
+        # Failed rows are marked and not tried again
+        db = connect(db_name)
+        self.assertEqual(db.count(), 24)
+        num_failed = db.count(failed=True)
+        self.assertGreater(num_failed, 0)
+        self.assertEqual(db.count(computed=True), 24 - num_failed)
+        self.assertEqual(el.pending_ids(), [])
+        for row in db.select(failed=True):
+            self.assertEqual(row.data["error"], "Calculation crashed")
+
+        # Rows claimed by a job on this host that has died are resumed
+        proc = subprocess.Popen([sys.executable, "-c", "pass"])
+        proc.wait()
+        dead_owner = "{}:{}".format(socket.gethostname(), proc.pid)
+        for row in db.select(failed=True):
+            db.update(row.id, claimed_by=dead_owner, claimed_at=time.time(),
+                      delete_keys=["failed"])
+        self.assertEqual(len(el.pending_ids()), num_failed)
+
+        self.assertEqual(el.run_pool(DummyCalc(), num_proc=2, batch_size=4), 0)
+        self.assertEqual(el.pending_ids(), [])
+        self.assertEqual(sorted(row.id for row in db.select()),
+                         list(range(1, 25)))
+        for row in db.select():
+            self.assertEqual(len(row.data["stress"]), 6)
+            self.assertEqual(len(row.data["strain"]), 6)
+        os.remove(db_name)
+
+    def test_run_pool_claims(self):
+        atoms = bulk("Al", a=4.05)
+        el = ElasticConstants(atoms, db_name)
+        el.prepare_db()
+
+        # Rows claimed by another job are skipped
+        db = connect(db_name)
+        for uid in [1, 2, 3]:
+            db.update(uid, claimed_by="other:1", claimed_at=time.time())
+        self.assertEqual(len(el.pending_ids()), 21)
+        self.assertEqual(el.run_pool(DummyCalc(), num_proc=2, batch_size=4),
+                         3)
+        self.assertEqual(el.pending_ids(), [])
+        self.assertEqual(len(el.pending_ids(claim_timeout=0.0)), 3)
+        self.assertEqual(db.count(computed=True), 21)
+        self.assertEqual(db.count(claimed_by="other:1"), 3)
+
+        # Stale claims are taken over
+        for uid in [1, 2, 3]:
+            db.update(uid, claimed_at=time.time() - 100.0)
+        el.run_pool(DummyCalc(), num_proc=2, claim_timeout=50.0)
+        self.assertEqual(db.count(computed=True), 24)
+        self.assertEqual(db.count(claimed_by="other:1"), 0)
+        os.remove(db_name)
+
+    def test_symmetry_reduced_strains(self):
+        atoms = bulk("Al", cubic=True)
+        el = ElasticConstants(atoms, db_name)
+        self.assertEqual(el.minimal_strain_components(225), [0, 3])
+        self.assertEqual(el.minimal_strain_components(194), [0, 2, 3])
+        el.prepare_db(spg=225)
+        db = connect(db_name)
+        self.assertEqual(db.count(), 8)
+        os.remove(db_name)
+
+        # Cubic tensor in Mandel notation
+        C = np.zeros((6, 6))
+        C[:3, :3] = 0.4
+        C[[0, 1, 2], [0, 1, 2]] = 1.1
+        C[[3, 4, 5], [3, 4, 5]] = 0.6
+        strains = []
+        for delta in [-0.01, 0.01, 0.02]:
+            strains.append([delta, 0, 0, 0, 0, 0])
+            strains.append([0, 0, 0, delta, 0, 0])
+        stresses = [C.dot(eps) for eps in strains]
+        el = ElasticConstants(atoms, db_name)
+        tensor = el.get(strains=strains, stresses=stresses, spg=225,
+                        convert_stress_to_mandel=False)
+        self.assertTrue(np.allclose(tensor, C))
+
+        with self.assertRaises(ValueError):
+            el = ElasticConstants(atoms, db_name)
+            el.get(strains=strains[::2], stresses=stresses[::2], spg=225,
+                   convert_stress_to_mandel=False)
+
+    def test_run_adaptive(self):
+        # Lattice parameter with zero pressure for EMT
+        atoms = bulk("Al", cubic=True, a=3.99427418)
+        el = ElasticConstants(atoms, db_name)
+        C, std = el.run_adaptive(EMT(), spg=225, tol=1E-4)
+
+        # Noise free stresses are fitted exactly by the first magnitude
+        db = connect(db_name)
+        self.assertEqual(db.count(), 4)
+        self.assertLess(np.max(std), 1E-4)
+        self.assertAlmostEqual(C[0, 1], C[1, 2])
+        self.assertGreater(C[0, 0], C[0, 1])
+        os.remove(db_name)
+
+        # Same strain_type encoding as prepare_db
+        el = ElasticConstants(atoms, db_name)
+        el.run_adaptive(EMT(), spg=1, tol=1.0)
+        self.check_strain_keys(connect(db_name), 12)
+        os.remove(db_name)
+        el.prepare_db()
+        self.check_strain_keys(connect(db_name), 24)
+        os.remove(db_name)
+
+        np.random.seed(0)
+        el = ElasticConstants(atoms, db_name)
+        C_noisy, std = el.run_adaptive(NoisyEMT(), spg=225, tol=1E-6)
+        self.assertTrue(np.allclose(C_noisy, C, atol=0.02))
+
+        # The tolerance is not reached, the loop stops when the response
+        # becomes nonlinear
+        db = connect(db_name)
+        nonlinear = [row.adaptive_step for row in db.select(nonlinear=True)]
+        self.assertEqual(len(nonlinear), 4)
+        self.assertEqual(set(nonlinear), {db.count()//4 - 1})
+        os.remove(db_name)
+
+    def test_symmetrize_batched(self):
+        proj = symmetry_projector(225)
+        self.assertIs(symmetry_projector(225), proj)
+        self.assertTrue(np.allclose(proj.dot(proj), proj))
+
+        tensors = np.random.rand(5, 6, 6)
+        tensors = tensors + np.swapaxes(tensors, 1, 2)
+        sym = symmetrize_elastic_tensors(tensors, 225)
+        el = ElasticConstants(bulk("Al"), db_name)
+        for tensor, expect in zip(tensors, sym):
+            el.elastic_tensor = tensor
+            el._symmetrize_elastic_tensor(spg=225)
+            self.assertTrue(np.allclose(el.elastic_tensor, expect))
+
+            # Cubic symmetry: C11 = C22, C12 = C13, C44 = C55 and no
+            # coupling between normal and shear components
+            self.assertAlmostEqual(expect[0, 0], expect[1, 1])
+            self.assertAlmostEqual(expect[0, 1], expect[0, 2])
+            self.assertAlmostEqual(expect[3, 3], expect[4, 4])
+            self.assertTrue(np.allclose(expect[:3, 3:], 0.0))
+
+    def test_symmetrize_hexagonal(self):
+        C = hexagonal_tensor()
+        for spg in [194, 191, 167, 143]:
+            sym = symmetrize_elastic_tensors(C, spg)
+            self.assertTrue(np.allclose(sym, C))
+
+        # The projection removes components breaking the symmetry
+        C_broken = C.copy()
+        C_broken[0, 0] += 2.0
+        sym = symmetrize_elastic_tensors(C_broken, 194)
+        self.assertAlmostEqual(sym[0, 0], sym[1, 1])
+        self.assertAlmostEqual(sym[5, 5], sym[0, 0] - sym[0, 1])
+
+    def test_reduced_strains_hexagonal(self):
+        C = hexagonal_tensor()/100.0
+        atoms = bulk("Mg")
+        el = ElasticConstants(atoms, db_name)
+        self.assertEqual(el.minimal_strain_components(194), [0, 2, 3])
+        el.prepare_db(spg=194)
+        el.run_pool(LinearElasticCalc(C, atoms.get_cell()), num_proc=2)
+        tensor = el.get(spg=194)
+        os.remove(db_name)
+        self.assertTrue(np.allclose(tensor, C, atol=1E-3*np.max(C)))
+
+    def test_elastic_properties(self):
+        el = ElasticConstants(bulk("Al"), db_name)
+        tensors = []
+        for _ in range(4):
+            tensor = np.random.rand(6, 6)
+            tensors.append(tensor.dot(tensor.T) + 6.0*np.identity(6))
+        props = elastic_properties(np.array(tensors))
+        self.assertEqual(props["compliance"].shape, (4, 6, 6))
+
+        for i, tensor in enumerate(tensors):
+            el.elastic_tensor = tensor
+            self.assertAlmostEqual(props["K_V"][i], el.bulk_modulus(mode="V"))
+            self.assertAlmostEqual(props["K_R"][i], el.bulk_modulus(mode="R"))
+            self.assertAlmostEqual(props["G_H"][i], el.shear_modulus())
+            self.assertAlmostEqual(props["nu_H"][i], el.poisson_ratio)
+            self.assertAlmostEqual(props["E_H"][i], el.youngs_modulus())
+            self.assertTrue(np.allclose(props["compliance"][i],
+                                        el.compliance_tensor))
+            self.assertAlmostEqual(el.properties()["G_R"], props["G_R"][i])
+
+        # An isotropic tensor has equal Voigt and Reuss averages
+        el.elastic_tensor = tensors[0]
+        props = elastic_properties(el.isotropic_elastic_tensor)
+        self.assertAlmostEqual(props["zener"][0], 1.0)
+        self.assertAlmostEqual(props["universal_anisotropy"][0], 0.0)
+        self.assertAlmostEqual(props["G_V"][0], props["G_R"][0])
+
+    def test_get_from_energy(self):
+        atoms = bulk("Al", cubic=True, a=3.99427418)
+        el = ElasticConstants(atoms, db_name)
+        el.delta_no_shear = [-0.004, -0.002, 0.002, 0.004]
+        el.delta_shear = [-0.008, -0.004, 0.004, 0.008]
+        self.assertEqual(el.pair_strain_components(225), [(0, 1)])
+        el.prepare_db(spg=225)
+        el.run_pool(EMT(), num_proc=2, properties=["energy"])
+
+        # Single component strains do not determine C12
+        with self.assertRaises(ValueError):
+            el.get_from_energy(spg=225)
+        os.remove(db_name)
+
+        el.prepare_db(spg=225, pair_strains=True)
+        db = connect(db_name)
+        self.assertEqual(db.count(), 12)
+        el.run_pool(EMT(), num_proc=2, properties=["energy", "stress"])
+        C_energy = el.get_from_energy(spg=225)
+        self.assertTrue(np.allclose(el.residual_stress, 0.0, atol=1E-4))
+        C_stress = el.get(spg=225)
+        self.assertTrue(np.allclose(C_energy, C_stress, atol=1E-3))
+        os.remove(db_name)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,100 @@
+"""Unit tests for the directional elastic properties."""
+import unittest
+import numpy as np
+from ase.build import bulk
+from ase.units import _e, _amu, _hplanck, _k, GPa
+from atomtools.ase import DirectionalElasticity
+from atomtools.ase.elastic_directional import fibonacci_sphere
+
+
+def isotropic_tensor(K, G):
+    C = np.zeros((6, 6))
+    C[:3, :3] = K - 2.0*G/3.0
+    C[[0, 1, 2], [0, 1, 2]] = K + 4.0*G/3.0
+    C[[3, 4, 5], [3, 4, 5]] = 2.0*G
+    return C
+
+
+def cubic_tensor(C11, C12, C44):
+    C = np.zeros((6, 6))
+    C[:3, :3] = C12
+    C[[0, 1, 2], [0, 1, 2]] = C11
+    C[[3, 4, 5], [3, 4, 5]] = 2.0*C44
+    return C
+
+
+class TestDirectionalElasticity(unittest.TestCase):
+    def test_fibonacci_sphere(self):
+        points = fibonacci_sphere(1000)
+        self.assertTrue(np.allclose(np.sum(points**2, axis=1), 1.0))
+        self.assertTrue(np.allclose(np.mean(points, axis=0), 0.0, atol=1E-3))
+
+    def test_isotropic(self):
+        K = 0.5
+        G = 0.2
+        atoms = bulk("Al", cubic=True)
+        el = DirectionalElasticity(isotropic_tensor(K, G), atoms=atoms)
+        directions = fibonacci_sphere(500)
+        E = el.youngs_modulus(directions)
+        self.assertTrue(np.allclose(E, 9.0*K*G/(3.0*K + G)))
+        self.assertTrue(np.allclose(el.linear_compressibility(directions),
+                                    1.0/(3.0*K)))
+        G_min, G_max = el.shear_modulus(directions)
+        self.assertTrue(np.allclose(G_min, G))
+        self.assertTrue(np.allclose(G_max, G))
+
+        # Christoffel eigenvalues are rho*vT^2 = G (twice) and
+        # rho*vL^2 = K + 4G/3 in every direction
+        eigval = np.linalg.eigvalsh(el.christoffel(directions))
+        self.assertTrue(np.allclose(eigval[:, :2], G))
+        self.assertTrue(np.allclose(eigval[:, 2], K + 4.0*G/3.0))
+
+        vel = el.sound_velocities(directions)
+        factor = _e/(_amu*el.density)
+        v_T = np.sqrt(G*factor)
+        v_L = np.sqrt((K + 4.0*G/3.0)*factor)
+        self.assertTrue(np.allclose(vel[:, :2], v_T))
+        self.assertTrue(np.allclose(vel[:, 2], v_L))
+
+        # The mean velocity is exact for an isotropic tensor
+        v_mean = (3.0/(2.0/v_T**3 + 1.0/v_L**3))**(1.0/3.0)
+        num_dens = len(atoms)/(atoms.get_volume()*1E-30)
+        theta = _hplanck/_k*(3.0*num_dens/(4.0*np.pi))**(1.0/3.0)*v_mean
+        self.assertAlmostEqual(el.debye_temperature(num_points=100), theta)
+
+    def test_debye_temperature_al(self):
+        # Elastic constants of Al at 0 K (Kamm and Alers). The tabulated
+        # Debye temperature is 428 K
+        C = cubic_tensor(114.3*GPa, 61.9*GPa, 31.6*GPa)
+        atoms = bulk("Al", cubic=True, a=4.032)
+        el = DirectionalElasticity(C, atoms=atoms)
+        self.assertAlmostEqual(el.debye_temperature(), 428.0, delta=4.0)
+
+        # Room temperature elastic constants
+        C = cubic_tensor(106.75*GPa, 60.41*GPa, 28.34*GPa)
+        atoms = bulk("Al", cubic=True, a=4.0495)
+        el = DirectionalElasticity(C, atoms=atoms)
+        self.assertAlmostEqual(el.debye_temperature(), 407.9, delta=0.5)
+
+    def test_cubic(self):
+        C11 = 0.33
+        C12 = 0.2
+        C44 = 0.45
+        el = DirectionalElasticity(cubic_tensor(C11, C12, C44))
+        E = el.youngs_modulus([[1, 0, 0], [1, 1, 1]])
+        S = np.linalg.inv(cubic_tensor(C11, C12, C44))
+        self.assertAlmostEqual(E[0], 1.0/S[0, 0])
+
+        # Shear in the (100) plane is C44 in every direction
+        G_min, G_max = el.shear_modulus([[1, 0, 0]])
+        self.assertAlmostEqual(G_min[0], C44)
+        self.assertAlmostEqual(G_max[0], C44)
+
+        # Christoffel eigenvalues along [100] are C44 (twice) and C11
+        gamma = el.christoffel([[2, 0, 0]])
+        self.assertTrue(np.allclose(np.linalg.eigvalsh(gamma)[0],
+                                    sorted([C11, C44, C44])))
+
+
+if __name__ == "__main__":
+    unittest.main()
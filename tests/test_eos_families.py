@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+from atomtools.eos import Vinet, BatchedVinet, BatchedMurnaghan
+from atomtools.eos import BatchedFiniteStrainBirchMurnaghan, BatchedPoirierTarantola
+from atomtools.eos import QuasiHarmonicDebye
+
+PARAMS = [(-3.7,16.5,0.45,4.5), (-5.1,20.0,0.8,5.2), (-2.0,12.0,0.3,3.8)]
+
+def vinet( V, E0, V0, B0, Bp ):
+    x = (V/V0)**(1.0/3.0)
+    eta = 1.5*(Bp-1.0)
+    return E0 + 2.0*B0*V0/(Bp-1.0)**2*( 2.0 - (5.0 + 3.0*Bp*(x-1.0) - 3.0*x)*np.exp(-eta*(x-1.0)) )
+
+def murnaghan( V, E0, V0, B0, Bp ):
+    return E0 + B0*V/Bp*( (V0/V)**Bp/(Bp-1.0) + 1.0 ) - B0*V0/(Bp-1.0)
+
+def ragged_data( func ):
+    group_ids = []
+    volumes = []
+    energies = []
+    for gid,params in enumerate(PARAMS):
+        V = np.linspace( 0.9*params[1], 1.12*params[1], 8+gid )
+        group_ids += [gid]*len(V)
+        volumes += list(V)
+        energies += list( func(V,*params) )
+    return group_ids, volumes, energies
+
+class TestEOSFamilies( unittest.TestCase ):
+    def test_nonlinear_fits( self ):
+        for family,func in zip( [BatchedVinet,BatchedMurnaghan], [vinet,murnaghan] ):
+            fit = family.from_groups( *ragged_data(func) ).fit()
+            params = np.array( fit.equilibrium_parameters() ).T
+            self.assertTrue( np.allclose( params, PARAMS, rtol=1E-6 ) )
+
+    def test_linear_fits( self ):
+        data = ragged_data( vinet )
+        for family in [BatchedFiniteStrainBirchMurnaghan,BatchedPoirierTarantola]:
+            fit = family.from_groups( *data, order=5 ).fit()
+            params = np.array( fit.equilibrium_parameters() ).T
+            self.assertTrue( np.allclose( params[:,:3], np.array(PARAMS)[:,:3], rtol=1E-3 ) )
+            self.assertTrue( np.allclose( params[:,3], np.array(PARAMS)[:,3], rtol=2E-2 ) )
+
+    def test_derivatives( self ):
+        data = ragged_data( vinet )
+        V = np.array( [[15.0,17.0],[19.0,21.0],[11.0,12.5]] )
+        h = 1E-5
+        for family in [BatchedVinet,BatchedMurnaghan,BatchedFiniteStrainBirchMurnaghan,BatchedPoirierTarantola]:
+            fit = family.from_groups( *data ).fit()
+            for n in range(4):
+                fd = (fit.nth_deriv(V+h,n) - fit.nth_deriv(V-h,n))/(2.0*h)
+                self.assertTrue( np.allclose( fit.nth_deriv(V,n+1), fd, rtol=1E-5, atol=1E-8 ) )
+
+    def test_swappable( self ):
+        group_ids, volumes, energies = ragged_data( vinet )
+        V = np.array(volumes[:8])
+        E = np.array(energies[:8])
+        eos = Vinet( V, E )
+        eos.set_average_mass( {"Al":1} )
+        E0, V0, B0, Bp = eos.equilibrium_parameters()
+        self.assertAlmostEqual( eos.minimum_energy()[1], V0 )
+        self.assertAlmostEqual( eos.deriv(V0), 0.0 )
+        vol_curve = eos.volume_temperature( [300.0,600.0], 1 )
+        self.assertTrue( vol_curve[1] > vol_curve[0] )
+
+        fit = BatchedVinet.from_groups( group_ids, volumes, energies ).fit()
+        model = QuasiHarmonicDebye( fit, [26.98]*3, [1]*3, fit.vmin, fit.vmax )
+        self.assertEqual( model.volume_temperature([300.0,600.0]).shape, (3,2) )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Unit tests for the Mandel notation conversions."""
+import unittest
+import numpy as np
+from atomtools.ase import mandel
+
+
+class TestMandel(unittest.TestCase):
+    def test_rank2_round_trip(self):
+        tensor = np.random.rand(4, 5, 3, 3)
+        tensor = tensor + np.swapaxes(tensor, -1, -2)
+        vec = mandel.to_mandel(tensor)
+        self.assertEqual(vec.shape, (4, 5, 6))
+        self.assertTrue(np.allclose(mandel.from_mandel(vec), tensor))
+
+        # The Mandel notation preserves the inner product
+        inner = np.einsum("...ij,...ij", tensor, tensor)
+        self.assertTrue(np.allclose(np.sum(vec**2, axis=-1), inner))
+
+    def test_rank4_round_trip(self):
+        tensors = np.random.rand(10, 6, 6)
+        full = mandel.to_full_rank4(tensors)
+        self.assertEqual(full.shape, (10, 3, 3, 3, 3))
+        self.assertTrue(np.allclose(full, np.swapaxes(full, 1, 2)))
+        self.assertTrue(np.allclose(full, np.swapaxes(full, 3, 4)))
+        self.assertTrue(np.allclose(mandel.to_mandel_rank4(full), tensors))
+
+    def test_rank4_contraction(self):
+        # sigma_ij = C_ijkl eps_kl is a matrix product in Mandel notation
+        C = np.random.rand(6, 6)
+        eps = np.random.rand(3, 3)
+        eps = eps + eps.T
+        sigma = np.einsum("ijkl,kl->ij", mandel.to_full_rank4(C), eps)
+        self.assertTrue(np.allclose(mandel.to_mandel(sigma),
+                                    C.dot(mandel.to_mandel(eps))))
+
+    def test_rotation(self):
+        angle = 0.3
+        rot = np.array([[np.cos(angle), -np.sin(angle), 0.0],
+                        [np.sin(angle), np.cos(angle), 0.0],
+                        [0.0, 0.0, 1.0]])
+        eps = np.random.rand(3, 3)
+        eps = eps + eps.T
+        Q = mandel.mandel_rotation(np.array([rot, rot.T]))
+        self.assertTrue(np.allclose(Q[0].dot(mandel.to_mandel(eps)),
+                                    mandel.to_mandel(rot.dot(eps).dot(rot.T))))
+        self.assertTrue(np.allclose(Q[0].dot(Q[1]), np.identity(6)))
+
+
+if __name__ == "__main__":
+    unittest.main()
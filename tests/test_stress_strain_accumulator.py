@@ -0,0 +1,88 @@
+"""Unit tests for the streaming stress-strain fit."""
+import unittest
+import numpy as np
+from atomtools.ase.stress_strain_accumulator import StressStrainAccumulator
+from atomtools.ase.stress_strain_accumulator import EnergyStrainAccumulator
+
+
+class TestStressStrainAccumulator(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        tensor = np.random.rand(6, 6)
+        self.tensor = tensor + tensor.T + 6.0*np.identity(6)
+        self.strains = 0.01*np.random.randn(200, 6)
+        self.noise = 1E-4
+        self.stresses = self.strains.dot(self.tensor.T) + \
+            self.noise*np.random.randn(200, 6)
+
+    def test_batch_equals_row_by_row(self):
+        batch = StressStrainAccumulator()
+        batch.add(self.strains, self.stresses)
+        single = StressStrainAccumulator()
+        for eps, sigma in zip(self.strains, self.stresses):
+            single.add(eps, sigma)
+        self.assertEqual(batch.num_obs, 200)
+        self.assertTrue(np.allclose(batch.stress_strain, single.stress_strain))
+        self.assertTrue(np.allclose(batch.solve()[0], single.solve()[0]))
+
+    def test_free_fit(self):
+        acc = StressStrainAccumulator()
+        acc.add(self.strains, self.stresses)
+        tensor, cov, std = acc.solve()
+        expect = np.linalg.lstsq(self.strains, self.stresses, rcond=None)[0]
+        self.assertTrue(np.allclose(tensor, expect.T))
+        self.assertEqual(cov.shape, (36, 36))
+
+        # Standard error of each element is noise/sqrt(n var(eps))
+        expected_std = self.noise/(0.01*np.sqrt(200))
+        self.assertTrue(np.allclose(std, expected_std, rtol=0.3))
+
+    def test_basis_fit(self):
+        # Only the isotropic part (two parameters)
+        iso = np.zeros((6, 6))
+        iso[:3, :3] = 1.0/3.0
+        dev = np.identity(6) - iso
+        basis = [iso, dev/np.sqrt(5.0)]
+        tensor = 3.0*iso + 2.0*dev
+        stresses = self.strains.dot(tensor.T)
+
+        acc = StressStrainAccumulator()
+        acc.add(self.strains[:1], stresses[:1])
+        self.assertEqual(acc.rank(), 1)
+        self.assertEqual(acc.rank(basis=basis), 2)
+        fitted, cov, std = acc.solve(basis=basis)
+        self.assertTrue(np.allclose(fitted, tensor))
+        self.assertEqual(cov.shape, (2, 2))
+
+    def test_energy_fit(self):
+        volume = 20.0
+        stress0 = 0.01*np.random.rand(6)
+        energies = -3.0 + volume*self.strains.dot(stress0) + \
+            0.5*volume*np.einsum("ni,ij,nj->n", self.strains, self.tensor,
+                                 self.strains)
+        basis = []
+        for i in range(6):
+            for j in range(i, 6):
+                B = np.zeros((6, 6))
+                B[i, j] = B[j, i] = 1.0
+                basis.append(B)
+
+        acc = EnergyStrainAccumulator()
+        acc.add(self.strains[:100], energies[:100])
+        for eps, energy in zip(self.strains[100:], energies[100:]):
+            acc.add(eps, energy)
+        E0, stress, tensor, cov, std = acc.solve(volume, basis)
+        self.assertAlmostEqual(E0, -3.0)
+        self.assertTrue(np.allclose(stress, stress0))
+        self.assertTrue(np.allclose(tensor, self.tensor))
+        self.assertEqual(cov.shape, (28, 28))
+
+        # Too few observations
+        acc = EnergyStrainAccumulator()
+        acc.add(self.strains[:10], energies[:10])
+        with self.assertRaises(ValueError):
+            acc.solve(volume, basis)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Unit tests for the 3D structure factor."""
+import unittest
+import numpy as np
+from ase.build import bulk
+from atomtools.ase import StructureFactor, AutocorrelationFunction
+from atomtools.ase.structure_factor import projected_cell
+from atomtools.ase.autocorrelation_function import rotation_to_normal
+
+
+def get_atoms():
+    atoms = bulk("Al", cubic=True)*(3, 3, 3)
+    for i in range(0, len(atoms), 4):
+        atoms[i].symbol = "Mg"
+    return atoms
+
+
+class TestStructureFactor(unittest.TestCase):
+    """Unit tests for the structure factor."""
+
+    def test_sum_rules(self):
+        atoms = get_atoms()
+        sf = StructureFactor(atoms, symb_dict={"Al": 1.0, "Mg": -1.0},
+                             grid=(24, 24, 24))
+        S = sf.structure_factor()
+        num_mg = sum(1 for s in atoms.get_chemical_symbols() if s == "Mg")
+        total = len(atoms) - 2*num_mg
+        self.assertAlmostEqual(S[0, 0, 0], total**2/float(len(atoms)))
+
+        # Weighted sum of partial structure factors gives S(q)
+        w = sf.weights
+        partial = sf.partial_structure_factors()
+        S_partial = np.einsum("a,b,ab...->...", w, w, partial)
+        self.assertTrue(np.allclose(S, S_partial.real))
+
+        # All atoms sit in different voxels
+        corr = sf.autocorrelation()
+        self.assertAlmostEqual(corr[0, 0, 0], 1.0)
+
+    def test_projection_slice(self):
+        atoms = get_atoms()
+        sf = StructureFactor(atoms, grid=(12, 12, 12))
+        q, S = sf.plane_projection(plane_normal=(0, 0, 1))
+        self.assertEqual(len(S), 12*12)
+
+        # Compare with the 2D transform of the projected density
+        proj = np.sum(sf.species_densities(), axis=(0, 3))
+        S2d = np.abs(np.fft.fft2(proj))**2/len(atoms)
+        self.assertAlmostEqual(np.sum(S), np.sum(S2d))
+        self.assertAlmostEqual(np.max(S), np.max(S2d))
+
+    def test_projected_autocorrelation(self):
+        atoms = get_atoms()
+        symb_dict = {"Al": 1.0, "Mg": -1.0}
+
+        # All atoms sit on a grid with spacing a/2, hence a 6 x 6 x 6
+        # grid and a 6 x 6 image of the projected bounding box are both
+        # exact and commensurate with the cell
+        sf = StructureFactor(atoms, symb_dict=symb_dict, grid=(6, 6, 6))
+        corr, lags = sf.projected_autocorrelation(plane_normal=(0, 0, 1))
+        self.assertEqual(corr.shape, (6, 6))
+        self.assertTrue(np.allclose(lags[1, 0], [atoms.cell[0, 0]/6, 0.0]))
+
+        acf = AutocorrelationFunction(atoms, plane_normal=(0, 0, 1),
+                                      symb_dict=dict(symb_dict))
+        ref = acf.projected_image(npix=6, show=False, mode="periodic")[1]
+        ref = np.fft.ifftshift(ref)
+        self.assertAlmostEqual(len(atoms)*corr[0, 0], ref[0, 0])
+        self.assertTrue(np.allclose(len(atoms)*corr, ref))
+
+        # The (001) plane of a cubic cell has the normal (0, 0, 1)
+        corr_hkl, _ = sf.projected_autocorrelation(hkl=(0, 0, 1))
+        self.assertTrue(np.allclose(corr_hkl, corr))
+
+    def test_hkl_plane(self):
+        atoms = get_atoms()
+        sf = StructureFactor(atoms, grid=(12, 12, 12))
+        q, S = sf.plane_projection(plane_normal=(1, 1, 1))
+        q_hkl, S_hkl = sf.plane_projection(hkl=(1, 1, 1))
+        self.assertTrue(np.allclose(q, q_hkl))
+        self.assertTrue(np.allclose(S, S_hkl))
+
+    def test_projected_sum_rule(self):
+        atoms = get_atoms()
+        symb_dict = {"Al": 1.0, "Mg": -1.0}
+        w = np.array([symb_dict[s] for s in atoms.get_chemical_symbols()])
+        sf = StructureFactor(atoms, symb_dict=symb_dict, grid=(6, 6, 6))
+        for hkl in [(0, 0, 1), (1, 1, 0), (1, 1, 1)]:
+            normal = np.array(hkl, dtype=float)
+            corr, lags = sf.projected_autocorrelation(hkl=hkl, npix=60)
+            self.assertTrue(np.allclose(lags[0, 0], 0.0))
+
+            # Zero lag gives the sum of the squared column weights
+            periods = projected_cell(atoms.get_cell(), normal)
+            rot = rotation_to_normal(normal)
+            frac = atoms.get_positions().dot(rot[:2, :].T).dot(
+                np.linalg.inv(periods))
+            frac = np.round(frac % 1.0, 6) % 1.0
+            columns = {}
+            for f, weight in zip(map(tuple, frac), w):
+                columns[f] = columns.get(f, 0.0) + weight
+            expect = sum(v**2 for v in columns.values())
+            self.assertAlmostEqual(len(atoms)*corr[0, 0], expect)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Unit tests for the trajectory averaged auto correlation function."""
+import unittest
+import os
+import numpy as np
+from ase.build import bulk
+from atomtools.ase import TrajectoryAutocorrelation
+from atomtools.ase.autocorrelation_function import fft_autocorrelation
+from atomtools.ase.autocorrelation_function import grid_positions
+
+chk_file = "test_traj_autocorr.npz"
+
+
+def get_frames(num):
+    frames = []
+    for i in range(num):
+        atoms = bulk("Al", cubic=True)*(3, 3, 3)
+        symbs = np.array(["Al"]*len(atoms))
+        symbs[np.random.rand(len(atoms)) < 0.3] = "Mg"
+        atoms.set_chemical_symbols(symbs)
+        frames.append(atoms)
+    return frames
+
+
+class TestTrajectoryAutocorrelation(unittest.TestCase):
+    """Unit tests for the streaming auto correlation."""
+
+    def test_average(self):
+        frames = get_frames(4)
+        symb_dict = {"Al": 1.0, "Mg": -1.0}
+        for mode in ["linear", "periodic"]:
+            acc = TrajectoryAutocorrelation(plane_normal=(0, 0, 1),
+                                            symb_dict=symb_dict, npix=16,
+                                            mode=mode)
+            acc.run(frames)
+            self.assertEqual(acc.num_frames, 4)
+
+            images = []
+            corr = []
+            for atoms in frames:
+                acc.acf.atoms = atoms
+                image = grid_positions(acc.acf.projected_positions,
+                                       acc.acf.values, 16,
+                                       pos_min=acc.pos_min,
+                                       spacing=acc.spacing,
+                                       wrap=(mode == "periodic"))
+                images.append(image)
+                corr.append(fft_autocorrelation(image,
+                                                periodic=(mode == "periodic")))
+            self.assertTrue(np.allclose(acc.average_image,
+                                        np.mean(images, axis=0)))
+            self.assertTrue(np.allclose(acc.average_correlation,
+                                        np.mean(corr, axis=0)))
+
+    def test_resume_from_checkpoint(self):
+        frames = get_frames(5)
+        symb_dict = {"Al": 1.0, "Mg": -1.0}
+        kwargs = dict(plane_normal=(0, 0, 1), symb_dict=symb_dict, npix=8)
+        full = TrajectoryAutocorrelation(**kwargs)
+        full.run(frames)
+
+        partial = TrajectoryAutocorrelation(**kwargs)
+        partial.run(frames[:3], checkpoint=chk_file, checkpoint_every=2)
+        resumed = TrajectoryAutocorrelation.load(chk_file)
+        self.assertEqual(resumed.num_frames, 3)
+        resumed.run(frames)
+        os.remove(chk_file)
+
+        self.assertEqual(resumed.num_frames, 5)
+        self.assertTrue(np.allclose(resumed.average_correlation,
+                                    full.average_correlation))
+
+    def test_run_twice(self):
+        frames = get_frames(5)
+        symb_dict = {"Al": 1.0, "Mg": -1.0}
+        kwargs = dict(plane_normal=(0, 0, 1), symb_dict=symb_dict, npix=8)
+        full = TrajectoryAutocorrelation(**kwargs)
+        full.run(frames)
+
+        acc = TrajectoryAutocorrelation(**kwargs)
+        acc.add_frame(frames[0])
+        acc.run(frames[1:3])
+        acc.run(frames[3:])
+        self.assertEqual(acc.num_frames, 5)
+        self.assertTrue(np.allclose(acc.average_correlation,
+                                    full.average_correlation))
+
+    def test_periodic_grid(self):
+        atoms = get_frames(1)[0]
+        symb_dict = {"Al": 1.0, "Mg": -1.0}
+        acc = TrajectoryAutocorrelation(plane_normal=(0, 0, 1),
+                                        symb_dict=symb_dict, npix=24)
+        acc.add_frame(atoms)
+        period = np.diag(atoms.get_cell())[:2]
+        self.assertTrue(np.allclose(acc.spacing*acc.npix, period))
+
+        # The (111) projection of a cubic cell is oblique
+        acc = TrajectoryAutocorrelation(plane_normal=(1, 1, 1),
+                                        symb_dict=symb_dict, npix=24)
+        with self.assertRaises(ValueError):
+            acc.add_frame(atoms)
+
+    def test_rigid_shift(self):
+        atoms = get_frames(1)[0]
+        atoms.rattle(0.1, seed=0)
+        atoms.wrap()
+        symb_dict = {"Al": 1.0, "Mg": -1.0}
+
+        # Grid commensurate with the (cubic) cell
+        npix = 32
+        spacing = np.diag(atoms.get_cell())[:2]/npix
+        kwargs = dict(plane_normal=(0, 0, 1), symb_dict=symb_dict,
+                      npix=npix, smearing="cic", pos_min=np.zeros(2),
+                      spacing=spacing)
+        ref = TrajectoryAutocorrelation(**kwargs)
+        ref.run([atoms, atoms])
+
+        # Shift by an integer number of pixels and wrap the atoms back
+        # into the cell, which changes their bounding box
+        shifted = atoms.copy()
+        shifted.translate([3.0*spacing[0], 5.0*spacing[1], 0.0])
+        shifted.wrap()
+        acc = TrajectoryAutocorrelation(**kwargs)
+        acc.run([atoms, shifted])
+        self.assertTrue(np.allclose(acc.average_correlation,
+                                    ref.average_correlation))
+        self.assertFalse(np.allclose(acc.average_image, ref.average_image))
+
+if __name__ == "__main__":
+    unittest.main()